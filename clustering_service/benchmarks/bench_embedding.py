@@ -0,0 +1,59 @@
+"""Benchmark: full-row t-SNE (the previous tsne_data) vs. the pattern embedding.
+
+For each import size, reports the wall time of the scatter-plot coordinates and their
+trustworthiness (sklearn.manifold.trustworthiness, 1.0 = every embedded neighbourhood is a true
+neighbourhood) measured on a fixed subsample against the one-hot encoded features. The full
+t-SNE baseline is only run up to --full-max rows.
+
+Usage: python benchmarks/bench_embedding.py --rows 2000 5000 20000 --full-max 5000
+"""
+import argparse
+import pathlib
+import sys
+import time
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import numpy as np
+from sklearn.manifold import TSNE, trustworthiness
+from sklearn.preprocessing import OneHotEncoder
+
+from bench_kmodes import feature_matrix
+from embedding import embed_patterns
+
+
+def timed(function):
+    start = time.perf_counter()
+    coords = function()
+    return time.perf_counter() - start, coords
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[2000, 5000, 20000])
+    parser.add_argument('--full-max', type=int, default=5000)
+    parser.add_argument('--eval-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    layouts = {
+        'full t-SNE': lambda X: TSNE(n_components=2, perplexity=30, learning_rate=200,
+                                     random_state=42).fit_transform(X),
+        'pattern t-SNE': lambda X: embed_patterns(X, method='tsne'),
+        'pattern PCA': lambda X: embed_patterns(X, method='pca'),
+    }
+    print(f"{'rows':>8} {'patterns':>9} {'layout':>14} {'time (s)':>9} {'trust':>6}")
+    for n_rows in args.rows:
+        X = feature_matrix(n_rows)
+        subsample = np.random.default_rng(0).choice(len(X), min(args.eval_size, len(X)), replace=False)
+        one_hot = OneHotEncoder().fit_transform(X[subsample]).toarray()
+        n_patterns = len(np.unique(X, axis=0))
+        for name, layout in layouts.items():
+            if name == 'full t-SNE' and n_rows > args.full_max:
+                continue
+            seconds, coords = timed(lambda: layout(X))
+            trust = trustworthiness(one_hot, coords[subsample], n_neighbors=10)
+            print(f"{n_rows:>8} {n_patterns:>9} {name:>14} {seconds:>9.2f} {trust:>6.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""Benchmark: dense gower_matrix + linkage on the square matrix vs. condensed chunked Gower.
+
+For each input size, reports wall time and peak traced memory (tracemalloc) of the stage-2
+distance + Ward linkage step. The dense path is only run up to --dense-max rows: it holds an
+n x n matrix and its linkage treats every matrix row as an n-dimensional observation.
+
+Usage: python benchmarks/bench_gower.py --sizes 1000 2000 5000 10000 --dense-max 2000
+"""
+import argparse
+import pathlib
+import sys
+import time
+import tracemalloc
+import warnings
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import numpy as np
+import pandas as pd
+from gower import gower_matrix
+from scipy.cluster.hierarchy import ClusterWarning, linkage
+
+from gower_distance import gower_condensed
+
+
+def stage2_frame(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'domain_type': rng.choice(['academic', 'corporate', 'other'], n, p=[0.3, 0.5, 0.2]),
+        'Keyword Category': rng.choice([f'category {i}' for i in range(12)], n),
+        'tld': rng.choice(['.lk', '.com', '.org', '.net', '.edu', '.io'], n),
+        'stage1_cluster': rng.integers(0, 8, n).astype(np.uint16),
+    })
+
+
+def dense(frame):
+    # scipy rightly warns that the square matrix looks like distances; this is the old behaviour
+    warnings.simplefilter('ignore', ClusterWarning)
+    return linkage(gower_matrix(frame), method='ward')
+
+
+def condensed(frame):
+    return linkage(gower_condensed(frame), method='ward')
+
+
+def measure(func, frame):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func(frame)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 2000, 5000, 10000])
+    parser.add_argument('--dense-max', type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'dense s':>9} {'dense MB':>10} {'condensed s':>12} {'condensed MB':>13}")
+    for n in args.sizes:
+        frame = stage2_frame(n)
+        dense_time, dense_peak = measure(dense, frame) if n <= args.dense_max else (np.nan, np.nan)
+        condensed_time, condensed_peak = measure(condensed, frame)
+        print(f"{n:>8} {dense_time:>9.2f} {dense_peak:>10.1f} {condensed_time:>12.2f} {condensed_peak:>13.1f}")
+
+
+if __name__ == '__main__':
+    main()
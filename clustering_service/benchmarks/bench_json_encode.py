@@ -0,0 +1,64 @@
+"""Benchmark: /cluster response encode time, response_model validation vs. fast_json.
+
+For each record count, times building the records (DataFrame.to_dict vs. fast_json.frame_records)
+and encoding the response: FastAPI's own serialize_response with the route's ClusterResult
+response field (validation, then pydantic's JSON dump) vs. fast_json.dumps. The clustered
+frame is the one bench_response_format builds.
+
+Usage: python benchmarks/bench_json_encode.py --rows 1000 10000 100000 500000
+"""
+import argparse
+import asyncio
+import logging
+import pathlib
+import sys
+import time
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+from fastapi.routing import serialize_response
+
+from bench_response_format import TSNE_COLUMNS, clustered_frame, tiled
+from fast_json import ORJSON_AVAILABLE, dumps, frame_records
+
+
+def timed(function):
+    start = time.perf_counter()
+    value = function()
+    return time.perf_counter() - start, value
+
+
+def response_model_field():
+    logging.disable(logging.INFO)
+    import clustering_service
+
+    route = next(route for route in clustering_service.app.routes if getattr(route, 'path', None) == '/cluster')
+    return route.response_field
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000, 500000])
+    parser.add_argument('--fit-rows', type=int, default=5000)
+    args = parser.parse_args()
+
+    field = response_model_field()
+    fitted = clustered_frame(args.fit_rows)
+    print(f"fast_json encoder: {'orjson' if ORJSON_AVAILABLE else 'json (orjson not installed)'}")
+    print(f"{'rows':>8} {'to_dict (s)':>12} {'frame_records (s)':>18} {'response_model (s)':>19} "
+          f"{'fast_json (s)':>14} {'MB':>7}")
+    for n_rows in args.rows:
+        frame = tiled(fitted, n_rows)
+        to_dict_seconds, _ = timed(lambda: frame.to_dict(orient='records'))
+        records_seconds, records = timed(lambda: frame_records(frame))
+        payload = {'records': records, 'visualization_data': {'tsne_data': frame_records(frame[TSNE_COLUMNS])},
+                   'cluster_analysis': {}, 'metrics': {}}
+        model_seconds, _ = timed(lambda: asyncio.run(serialize_response(field=field, response_content=payload,
+                                                                        dump_json=True)))
+        fast_seconds, body = timed(lambda: dumps(payload))
+        print(f"{n_rows:>8} {to_dict_seconds:>12.3f} {records_seconds:>18.3f} {model_seconds:>19.3f} "
+              f"{fast_seconds:>14.3f} {len(body) / 2 ** 20:>7.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Benchmark: independent k sweep vs. the warm-started, early-stopping sweep.
+
+Runs find_optimal_k_with_metrics on the stage-1 features of a synthetic import with both sweep
+modes and reports wall time, how many values of k were fitted, the suggested k and the cost of
+the fit at that k.
+
+Usage: python benchmarks/bench_k_sweep.py --rows 5000 --engine kmodes numpy --patience 2
+"""
+import argparse
+import contextlib
+import io
+import pathlib
+import sys
+import time
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import clustering_script as cs
+from bench_kmodes import feature_matrix
+
+
+def run(X, engine, mode, patience):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        optimal_k, _, sweep = cs.find_optimal_k_with_metrics(X, max_k=15, engine=engine, mode=mode,
+                                                             patience=patience)
+    return time.perf_counter() - start, len(sweep), optimal_k, sweep[optimal_k]['cost']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[5000])
+    parser.add_argument('--engine', nargs='+', default=['kmodes', 'numpy'], choices=sorted(cs.KMODES_ENGINES))
+    parser.add_argument('--patience', type=int, default=2)
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'engine':>7} {'mode':>12} {'time (s)':>9} {'fits':>5} {'k':>3} {'cost at k':>10}")
+    for n_rows in args.rows:
+        X = feature_matrix(n_rows)
+        for engine in args.engine:
+            baseline = None
+            for mode in ['independent', 'warm']:
+                elapsed, fits, k, cost = run(X, engine, mode, args.patience)
+                baseline = baseline or elapsed
+                print(f"{n_rows:>8} {engine:>7} {mode:>12} {elapsed:>9.2f} {fits:>5} {k:>3} {cost:>10.0f}"
+                      + (f"   saved {baseline - elapsed:.2f}s" if mode == 'warm' else ''))
+
+
+if __name__ == '__main__':
+    main()
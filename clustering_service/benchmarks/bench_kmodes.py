@@ -0,0 +1,58 @@
+"""Benchmark: kmodes.KModes vs. the NumPy k-modes engine on the stage-1 feature matrix.
+
+Builds X_kmodes from synthetic imports with the real preprocessing, then fits both engines with
+the sweep's settings (init='Huang', n_init=5, random_state=42) for each k and reports wall time
+and final cost (lower is better; the two engines take different but equally valid paths).
+
+Usage: python benchmarks/bench_kmodes.py --rows 5000 20000 --k 4 8 15
+"""
+import argparse
+import contextlib
+import io
+import pathlib
+import sys
+import time
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+from kmodes.kmodes import KModes
+
+import clustering_script as cs
+from kmodes_engine import NumpyKModes
+from synthetic_data import make_email_frame
+
+
+def feature_matrix(n_rows):
+    df = make_email_frame(n_rows)
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = cs.add_domain_features(df).dropna(subset=['domain'])
+        df = cs.add_academic_features(df)
+        _, X, _ = cs.prepare_for_clustering(df)
+    return X
+
+
+def timed_fit(engine, X, k):
+    model = engine(n_clusters=k, init='Huang', n_init=5, random_state=42)
+    start = time.perf_counter()
+    model.fit(X)
+    return time.perf_counter() - start, model.cost_
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[5000, 20000])
+    parser.add_argument('--k', type=int, nargs='+', default=[4, 8, 15])
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'k':>3} {'kmodes (s)':>11} {'cost':>9} {'numpy (s)':>10} {'cost':>9} {'speedup':>8}")
+    for n_rows in args.rows:
+        X = feature_matrix(n_rows)
+        for k in args.k:
+            t_package, cost_package = timed_fit(KModes, X, k)
+            t_numpy, cost_numpy = timed_fit(NumpyKModes, X, k)
+            print(f"{n_rows:>8} {k:>3} {t_package:>11.2f} {cost_package:>9.0f} {t_numpy:>10.3f} "
+                  f"{cost_numpy:>9.0f} {t_package / t_numpy:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
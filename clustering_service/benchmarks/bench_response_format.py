@@ -0,0 +1,77 @@
+"""Benchmark: payload size and serialisation time of the records vs. the columnar response.
+
+The records format is what /cluster returns by default: final_df.to_dict('records') plus the
+tsne_data rows copied into visualization_data, dumped as one JSON document. The columnar format
+is columnar.encode_columns (and the Arrow IPC stream when pyarrow is installed). The clustered
+frame is one pipeline run on --fit-rows synthetic rows, tiled to each size with unique emails.
+
+Usage: python benchmarks/bench_response_format.py --rows 10000 100000 500000
+"""
+import argparse
+import contextlib
+import io
+import json
+import pathlib
+import sys
+import time
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import pandas as pd
+
+from clustering_script import main as run_pipeline
+from columnar import ARROW_AVAILABLE, encode_arrow, encode_columns
+from synthetic_data import make_email_frame
+
+TSNE_COLUMNS = ['x', 'y', 'z', 'cluster_name', 'university_name']
+
+
+def clustered_frame(fit_rows):
+    with contextlib.redirect_stdout(io.StringIO()):
+        final_df, _ = run_pipeline(make_email_frame(fit_rows), dedup=True, kmodes_engine='numpy',
+                                   embedding={'method': 'pca', 'max_points': 5000, 'jitter': 0.05},
+                                   include_records=False)
+    return final_df
+
+
+def tiled(frame, n_rows):
+    frame = pd.concat([frame] * -(-n_rows // len(frame)), ignore_index=True).iloc[:n_rows].copy()
+    frame['Email'] = [f'user{i}@{domain}' for i, domain in enumerate(frame['domain'])]
+    return frame
+
+
+def records_body(frame):
+    return json.dumps({'records': frame.to_dict(orient='records'),
+                       'visualization_data': {'tsne_data': frame[TSNE_COLUMNS].to_dict(orient='records')}}).encode()
+
+
+def columnar_body(frame):
+    return json.dumps(encode_columns(frame)).encode()
+
+
+def timed(function, frame):
+    start = time.perf_counter()
+    body = function(frame)
+    return time.perf_counter() - start, len(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 500000])
+    parser.add_argument('--fit-rows', type=int, default=5000)
+    args = parser.parse_args()
+
+    formats = {'records': records_body, 'columnar': columnar_body}
+    if ARROW_AVAILABLE:
+        formats['arrow'] = encode_arrow
+    fitted = clustered_frame(args.fit_rows)
+    print(f"{'rows':>8} {'format':>9} {'MB':>8} {'time (s)':>9}")
+    for n_rows in args.rows:
+        frame = tiled(fitted, n_rows)
+        for name, encode in formats.items():
+            seconds, size = timed(encode, frame)
+            print(f"{n_rows:>8} {name:>9} {size / 2 ** 20:>8.2f} {seconds:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
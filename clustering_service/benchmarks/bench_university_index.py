@@ -0,0 +1,70 @@
+"""Microbenchmark: identify_university's triple scan vs. the precompiled UniversityIndex.
+
+Resolves a realistic list of distinct domains (the synthetic import's domain set plus random
+look-alikes) with the original scan, the index without memoization, and the memoized entry point.
+
+Usage: python benchmarks/bench_university_index.py --domains 3000 --repeat 5
+"""
+import argparse
+import pathlib
+import sys
+import time
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import numpy as np
+
+import clustering_script as cs
+from synthetic_data import make_domains
+
+
+def realistic_domains(n_company_domains, seed=0):
+    domains, _ = make_domains(n_company_domains, seed)
+    rng = np.random.default_rng(seed)
+    alphabet = np.array(list('abcdefghijklmnopqrstuvwxyz'))
+    prefixes = ['', 'stu.', 'mail.', 'eng.', 'students.']
+    suffixes = ['.lk', '.ac.lk', '.edu.lk', '.com', '.edu', '.org']
+    for _ in range(n_company_domains // 2):
+        name = ''.join(rng.choice(alphabet, rng.integers(3, 12)))
+        domains.append(f"{rng.choice(prefixes)}{name}{rng.choice(suffixes)}")
+    return list(dict.fromkeys(domains))
+
+
+def timed(func, domains, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        cs._resolve_university.cache_clear()
+        start = time.perf_counter()
+        result = [func(domain) for domain in domains]
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--domains', type=int, default=3000, help='long-tail company domains to generate')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    domains = realistic_domains(args.domains)
+    t_scan, expected = timed(cs._identify_university_scan, domains, args.repeat)
+    t_index, actual = timed(cs.UNIVERSITY_INDEX.resolve, domains, args.repeat)
+
+    # Memoized: a second pass over the same domains is served from the cache
+    cs._resolve_university.cache_clear()
+    [cs.identify_university(domain) for domain in domains]
+    start = time.perf_counter()
+    memoized = [cs.identify_university(domain) for domain in domains]
+    t_cached = time.perf_counter() - start
+
+    identical = expected == actual == memoized
+    per_domain = 1e6 / len(domains)
+    print(f"{len(domains)} distinct domains, {sum(r is not None for r in expected)} resolved to a university")
+    print(f"{'triple scan':>16}: {t_scan * per_domain:8.2f} us/domain")
+    print(f"{'index':>16}: {t_index * per_domain:8.2f} us/domain ({t_scan / t_index:.1f}x)")
+    print(f"{'index, memoized':>16}: {t_cached * per_domain:8.2f} us/domain ({t_scan / t_cached:.1f}x)")
+    print(f"identical: {identical}")
+
+
+if __name__ == '__main__':
+    main()
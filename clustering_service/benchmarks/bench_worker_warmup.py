@@ -0,0 +1,74 @@
+"""Benchmark: latency of the first clustering request on a cold vs. a pre-warmed worker.
+
+For each import size, runs one request through a fresh single-worker JobManager, first cold
+(the worker spawns, imports the pipeline and runs it) and then pre-warmed (JobManager.start has
+already warmed the worker; its start-up time is reported separately), followed by a second
+request on the same worker as the steady-state reference.
+
+Usage: python benchmarks/bench_worker_warmup.py --rows 500 5000 --kmodes-engine numpy
+"""
+import argparse
+import contextlib
+import os
+import pathlib
+import sys
+import tempfile
+import time
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+from clustering_jobs import JobManager
+from synthetic_data import make_email_frame
+
+
+@contextlib.contextmanager
+def silenced_stdout():
+    """Send the pipeline's prints (ours and the workers', which share fd 1) to /dev/null."""
+    saved = os.dup(1)
+    sys.stdout.flush()
+    with open(os.devnull, 'w') as devnull:
+        os.dup2(devnull.fileno(), 1)
+    try:
+        yield os.fdopen(os.dup(saved), 'w', buffering=1)
+    finally:
+        sys.stdout.flush()
+        os.dup2(saved, 1)
+        os.close(saved)
+
+
+def request_seconds(manager, path, config):
+    start = time.perf_counter()
+    manager.run(path, pipeline_config=config).result()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[500, 5000])
+    parser.add_argument('--kmodes-engine', default='numpy')
+    args = parser.parse_args()
+    config = {'kmodes_engine': args.kmodes_engine}
+
+    with silenced_stdout() as out, tempfile.TemporaryDirectory() as directory:
+        print(f"{'rows':>7} {'cold first (s)':>15} {'warm-up (s)':>12} {'warm first (s)':>15} {'steady (s)':>11}",
+              file=out)
+        for n_rows in args.rows:
+            path = os.path.join(directory, f'emails_{n_rows}.csv')
+            make_email_frame(n_rows).to_csv(path, index=False)
+
+            cold = JobManager(max_workers=1)
+            cold_first = request_seconds(cold, path, config)
+            cold.shutdown()
+
+            warm = JobManager(max_workers=1, warmup_config=config)
+            start = time.perf_counter()
+            warm.start()
+            warmup = time.perf_counter() - start
+            warm_first = request_seconds(warm, path, config)
+            steady = request_seconds(warm, path, config)
+            warm.shutdown()
+            print(f"{n_rows:>7} {cold_first:>15.2f} {warmup:>12.2f} {warm_first:>15.2f} {steady:>11.2f}", file=out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+"""Synthetic email lists shaped like real EduPulse imports, shared by the benchmark scripts.
+
+A handful of personal providers dominate, followed by Sri Lankan university domains and a
+long tail of company domains, so the number of distinct domains stays in the low thousands.
+"""
+import numpy as np
+import pandas as pd
+
+KEYWORD_CATEGORIES = ['AI', 'Marketing', 'Data Science', 'Engineering', 'Business Management',
+                      'Computer Science', 'Finance', 'IT']
+
+PERSONAL = [('gmail.com', 400), ('yahoo.com', 60), ('hotmail.com', 40), ('outlook.com', 25),
+            ('icloud.com', 8), ('live.com', 5), ('ymail.com', 2), ('googlemail.com', 2)]
+
+ACADEMIC = ['sliit.lk', 'my.sliit.lk', 'kdu.ac.lk', 'iit.ac.lk', 'sltc.ac.lk', 'nsbm.ac.lk',
+            'students.nsbm.ac.lk', 'uom.lk', 'cmb.ac.lk', 'stu.cmb.ac.lk', 'pdn.ac.lk', 'eng.pdn.ac.lk',
+            'ruh.ac.lk', 'sjp.ac.lk', 'ou.ac.lk', 'kln.ac.lk', 'stu.kln.ac.lk', 'cinec.edu', 'seu.ac.lk',
+            'jfn.ac.lk', 'wyb.ac.lk', 'uwu.ac.lk', 'esn.ac.lk', 'vpa.ac.lk', 'sab.ac.lk', 'mit.edu',
+            'stanford.edu', 'ox.ac.uk', 'colombo-university.lk', 'moratuwa-campus.lk', 'openschool.edu.lk',
+            'maritime-college.org']
+
+OTHER = ['dialog.lk', 'mobitel.lk', 'gov.lk', 'health.gov.lk', 'education.gov', 'unicef.org',
+         'redcross.org.lk', 'wso2.com', 'virtusa.io', 'ifs.net', 'x.co', 'abc.xyz', 'lanka.info']
+
+COMPANY_TLDS = ['com', 'net', 'lk', 'org', 'io', 'co', 'de', 'com.au', 'co.uk', 'biz', 'info']
+
+
+def make_domains(n_company_domains=3000, seed=0):
+    """Return (domains, weights) for a realistic long-tailed domain distribution."""
+    rng = np.random.default_rng(seed)
+    domains = [d for d, _ in PERSONAL] + ACADEMIC + OTHER
+    weights = [w for _, w in PERSONAL] + [6.0] * len(ACADEMIC) + [2.0] * len(OTHER)
+    tlds = rng.choice(COMPANY_TLDS, n_company_domains)
+    domains += [f"company{i}.{tld}" for i, tld in enumerate(tlds)]
+    weights += list(rng.pareto(1.5, n_company_domains) + 0.05)
+    weights = np.asarray(weights, dtype=float)
+    return domains, weights / weights.sum()
+
+
+def make_email_frame(n_rows, n_company_domains=3000, seed=0):
+    """Build an Email / Keyword Category frame with n_rows rows, including a few malformed emails."""
+    rng = np.random.default_rng(seed)
+    domains, weights = make_domains(n_company_domains, seed)
+    picked = rng.choice(len(domains), n_rows, p=weights)
+    emails = np.char.add(np.char.add('user', np.arange(n_rows).astype(str)), '@')
+    emails = np.char.add(emails, np.asarray(domains, dtype=object)[picked].astype(str)).astype(object)
+    # Sprinkle in the kinds of rows real uploads contain
+    if n_rows >= 100:
+        emails[::97] = [e.upper() for e in emails[::97]]
+        emails[50] = 'not-an-email'
+        emails[75] = None
+    return pd.DataFrame({
+        'Email': emails,
+        'Keyword Category': rng.choice(KEYWORD_CATEGORIES, n_rows),
+    })
@@ -0,0 +1,157 @@
+"""PNG charts drawn on demand from the numeric series the pipeline records.
+
+The pipeline no longer renders figures on every run: each chart's series is kept under
+visualization_data['chart_series'] (the frontend draws from the same numbers), and render_chart
+turns a series into the PNG the pipeline used to embed. ChartStore holds the series of recent
+runs for the chart endpoint and caches every chart it renders.
+"""
+import base64
+import threading
+import uuid
+from collections import OrderedDict
+from io import BytesIO
+
+import numpy as np
+
+# Panels of the metric sweep charts: (series key, y label, style, title)
+SWEEP_PANELS = [
+    ('costs', 'Cost', 'bo-', 'Elbow Method'),
+    ('silhouette_scores', 'Silhouette Score', 'go-', 'Silhouette Score (higher is better)'),
+    ('davies_bouldin_scores', 'Davies-Bouldin Index', 'ro-', 'Davies-Bouldin Index (lower is better)'),
+    ('calinski_harabasz_scores', 'Calinski-Harabasz Index', 'mo-', 'Calinski-Harabasz Index (higher is better)'),
+]
+
+
+def truncated_linkage(Z, p=30):
+    """The last p - 1 merges of a linkage matrix as a linkage over their p subtrees.
+
+    Returns (linkage, labels): labels follow dendrogram's truncate_mode='lastp' convention, the
+    original index of a single observation or the size of a subtree in parentheses. Drawing the
+    result untruncated gives the same picture as dendrogram(Z, truncate_mode='lastp', p=p)
+    while storing O(p) numbers instead of the whole linkage.
+    """
+    Z = np.asarray(Z, dtype=float)
+    n = len(Z) + 1
+    top = Z[max(0, len(Z) - (p - 1)):]
+    first = n + len(Z) - len(top)
+    children = top[:, :2].astype(int)
+    leaves = np.setdiff1d(children, np.arange(first, n + len(Z)))
+    index = {int(leaf): i for i, leaf in enumerate(leaves)}
+    small = top.copy()
+    small[:, :2] = [[index[c] if c in index else len(leaves) + c - first for c in pair] for pair in children]
+    # Counts refer to the p subtrees now; their real sizes live in the labels
+    sizes = np.ones(len(leaves) + len(small))
+    for i, (a, b) in enumerate(small[:, :2].astype(int)):
+        sizes[len(leaves) + i] = small[i, 3] = sizes[a] + sizes[b]
+    labels = [str(leaf) if leaf < n else f"({int(Z[leaf - n, 3])})" for leaf in leaves]
+    return small, labels
+
+
+def _figure(figsize):
+    # matplotlib is only loaded once a chart is actually rendered
+    from matplotlib.figure import Figure
+    return Figure(figsize=figsize)
+
+
+def _sweep_chart(series, panels, layout, figsize):
+    fig = _figure(figsize)
+    for pos, (key, ylabel, style, title) in enumerate(panels, start=1):
+        ax = fig.add_subplot(*layout, pos)
+        ax.plot(series['k_values'], series[key], style)
+        ax.set_xlabel('Number of clusters')
+        ax.set_ylabel(ylabel)
+        ax.set_title(title)
+    fig.tight_layout()
+    return fig
+
+
+def _kmodes_metrics_chart(series):
+    return _sweep_chart(series, SWEEP_PANELS, (2, 2), (15, 10))
+
+
+def _hierarchical_metrics_chart(series):
+    return _sweep_chart(series, SWEEP_PANELS[1:], (1, 3), (15, 5))
+
+
+def _dendrogram(series):
+    from scipy.cluster.hierarchy import dendrogram
+
+    fig = _figure((12, 8))
+    ax = fig.add_subplot()
+    dendrogram(np.asarray(series['linkage']), labels=series['labels'], leaf_font_size=10, ax=ax)
+    ax.set_title('Hierarchical Clustering Dendrogram')
+    ax.set_xlabel('Samples')
+    ax.set_ylabel('Gower Distance')
+    return fig
+
+
+def _metrics_chart(series):
+    fig = _figure((10, 6))
+    titles = ['Silhouette Score\n(higher is better)', 'Davies-Bouldin Index\n(lower is better)',
+              'Calinski-Harabasz Index\n(higher is better)']
+    names = [method['name'] for method in series['series']]
+    for i, title in enumerate(titles):
+        ax = fig.add_subplot(1, 3, i + 1)
+        ax.bar(names, [method['data'][i] for method in series['series']], color=['#3498db', '#e74c3c'])
+        ax.set_title(title)
+        ax.set_ylabel('Score')
+        if i == 0:
+            ax.set_ylim(0, 1)
+    fig.tight_layout()
+    return fig
+
+
+CHARTS = {
+    'kmodes_metrics_chart': _kmodes_metrics_chart,
+    'hierarchical_metrics_chart': _hierarchical_metrics_chart,
+    'dendrogram': _dendrogram,
+    'metrics_chart': _metrics_chart,
+}
+
+
+def render_chart(name, series):
+    """PNG bytes of the named chart drawn from its series."""
+    buffer = BytesIO()
+    CHARTS[name](series).savefig(buffer, format='png', bbox_inches='tight')
+    return buffer.getvalue()
+
+
+def chart_to_base64(name, series):
+    return base64.b64encode(render_chart(name, series)).decode('utf-8')
+
+
+class ChartStore:
+    """Chart series of the last max_runs runs, keyed by run id, with their rendered PNGs."""
+
+    def __init__(self, max_runs=32):
+        self.max_runs = max_runs
+        self._runs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, chart_series):
+        """Keep a run's chart series; returns its run id."""
+        run_id = uuid.uuid4().hex
+        with self._lock:
+            self._runs[run_id] = {'series': chart_series, 'rendered': {}}
+            while len(self._runs) > self.max_runs:
+                self._runs.popitem(last=False)
+        return run_id
+
+    def charts(self, run_id):
+        with self._lock:
+            return sorted(self._runs[run_id]['series'])
+
+    def render(self, run_id, name):
+        """PNG bytes of one chart of a run, rendered on first request. Raises KeyError for an
+        unknown or evicted run or a chart the run did not record."""
+        with self._lock:
+            run = self._runs[run_id]
+            self._runs.move_to_end(run_id)
+            if name in run['rendered']:
+                return run['rendered'][name]
+            series = run['series'][name]
+        # Rendered outside the lock, so a slow chart holds up no other run; two requests for
+        # the same chart may both render it, and the first stored wins
+        png = render_chart(name, series)
+        with self._lock:
+            return run['rendered'].setdefault(name, png)
@@ -0,0 +1,296 @@
+"""Clustering quality metrics for weighted (deduplicated) observations.
+
+Each score equals its scikit-learn counterpart evaluated on the data with every observation
+repeated `sample_weight` times, without materialising the repeated rows.
+sampled_silhouette_score estimates the silhouette from a stratified sample of observations, and
+CategoricalMetrics scores many labelings of one categorical dataset from shared precomputed state.
+"""
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from gower_distance import condensed_rows, encode_gower_features, gower_block
+
+
+def _check_labels(labels, sample_weight):
+    classes, codes = np.unique(np.asarray(labels), return_inverse=True)
+    weights = np.ones(len(codes)) if sample_weight is None else np.asarray(sample_weight, dtype=float)
+    n_clusters = len(classes)
+    if not 1 < n_clusters < weights.sum():
+        raise ValueError(f"Number of labels is {n_clusters}. Valid values are 2 to n_samples - 1 (inclusive)")
+    return codes.reshape(-1), n_clusters, weights
+
+
+def _membership(codes, n_clusters, weights):
+    """Observations x clusters matrix holding each observation's weight in its own cluster."""
+    membership = np.zeros((len(codes), n_clusters))
+    membership[np.arange(len(codes)), codes] = weights
+    return membership
+
+
+def _silhouette_values(X, rows, codes, membership, cluster_weight, metric):
+    """Silhouette coefficients of the observations at index array rows, against all observations.
+    A callable metric maps an index array to the distances from those rows to every row."""
+    if callable(metric):
+        distances = metric(rows)
+    elif metric == 'precomputed' and np.ndim(X) == 1:
+        distances = condensed_rows(X, len(codes), rows)
+    elif metric == 'precomputed':
+        distances = np.asarray(X[rows], dtype=float)
+    else:
+        from scipy.spatial.distance import cdist
+        distances = cdist(X[rows], X, metric=metric)
+    return _silhouette_from_sums(distances @ membership, codes[rows], cluster_weight)
+
+
+def _silhouette_from_sums(sums, own, cluster_weight):
+    """Silhouette coefficients from each observation's summed (weighted) distance to every cluster."""
+    idx = np.arange(len(own))
+    own_weight = cluster_weight[own]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        intra = sums[idx, own] / (own_weight - 1)
+        inter = sums / cluster_weight
+        inter[idx, own] = np.inf
+        inter = inter.min(axis=1)
+        scores = np.nan_to_num((inter - intra) / np.maximum(intra, inter))
+    # Singleton clusters score 0, as in scikit-learn
+    scores[own_weight <= 1] = 0.0
+    return scores
+
+
+def _silhouette_inputs(X, labels, sample_weight, metric, chunk_size):
+    codes, n_clusters, weights = _check_labels(labels, sample_weight)
+    membership = _membership(codes, n_clusters, weights)
+    if callable(metric):
+        pass
+    elif metric != 'precomputed':
+        X = np.asarray(X, dtype=float)
+    elif np.ndim(X) == 1:
+        # Expanded rows need an index array as well; keep each chunk around 4M cells
+        chunk_size = max(1, min(chunk_size, 2 ** 22 // len(codes)))
+    return X, codes, n_clusters, weights, membership, chunk_size
+
+
+def weighted_silhouette_score(X, labels, sample_weight=None, metric='euclidean', chunk_size=1024):
+    """Mean silhouette coefficient; X is a feature matrix, or with metric='precomputed' a square
+    or condensed distance matrix. Distances are produced chunk_size rows at a time."""
+    X, codes, _, weights, membership, chunk_size = _silhouette_inputs(X, labels, sample_weight, metric, chunk_size)
+    cluster_weight = membership.sum(axis=0)
+    total = 0.0
+    for start in range(0, len(codes), chunk_size):
+        rows = np.arange(start, min(start + chunk_size, len(codes)))
+        total += weights[rows] @ _silhouette_values(X, rows, codes, membership, cluster_weight, metric)
+    return float(total / weights.sum())
+
+
+def sampled_silhouette_score(X, labels, sample_size=2000, sample_weight=None, metric='euclidean',
+                             random_state=None, confidence=0.95, chunk_size=1024):
+    """Stratified-sample estimate of weighted_silhouette_score; returns (score, (low, high)).
+
+    Each cluster gets a share of sample_size proportional to its weight (at least two
+    observations). Sampled coefficients are exact against the full data, so the cost is
+    O(sample_size * n) instead of O(n^2). With weights, observations are drawn with replacement
+    and probability proportional to weight. The interval is the normal-approximation confidence
+    interval of the stratified mean. The exact score is returned when sample_size >= n.
+    """
+    X, codes, n_clusters, weights, membership, chunk_size = _silhouette_inputs(
+        X, labels, sample_weight, metric, chunk_size)
+    if sample_size is None or sample_size >= len(codes):
+        score = weighted_silhouette_score(X, labels, sample_weight, metric, chunk_size)
+        return score, (score, score)
+
+    rng = np.random.default_rng(random_state)
+    cluster_weight = membership.sum(axis=0)
+    share = cluster_weight / cluster_weight.sum()
+    sizes = np.bincount(codes, minlength=n_clusters)
+    allocation = np.minimum(sizes, np.maximum(2, np.round(share * sample_size).astype(int)))
+    members = np.split(np.argsort(codes, kind='stable'), np.cumsum(sizes)[:-1])
+
+    estimate, variance = 0.0, 0.0
+    for cluster, (rows, n_draw) in enumerate(zip(members, allocation)):
+        if sample_weight is None:
+            sample = rng.choice(rows, n_draw, replace=False)
+            # Finite population correction; a fully sampled cluster contributes no variance
+            correction = 1.0 - n_draw / len(rows)
+        else:
+            sample = rng.choice(rows, n_draw, replace=True, p=weights[rows] / weights[rows].sum())
+            correction = 1.0
+        scores = np.concatenate([
+            _silhouette_values(X, sample[start:start + chunk_size], codes, membership, cluster_weight, metric)
+            for start in range(0, n_draw, chunk_size)])
+        estimate += share[cluster] * scores.mean()
+        if n_draw > 1:
+            variance += share[cluster] ** 2 * scores.var(ddof=1) / n_draw * correction
+
+    margin = NormalDist().inv_cdf(0.5 + confidence / 2) * np.sqrt(variance)
+    return float(estimate), (float(estimate - margin), float(estimate + margin))
+
+
+def _centroids(X, codes, n_clusters, weights):
+    membership = _membership(codes, n_clusters, weights)
+    cluster_weight = membership.sum(axis=0)
+    return membership.T @ X / cluster_weight[:, None], cluster_weight
+
+
+def _davies_bouldin(intra, centroids):
+    """Davies-Bouldin index from mean intra-cluster distances and cluster centroids."""
+    from scipy.spatial.distance import cdist
+
+    centroid_distances = cdist(centroids, centroids)
+    if np.allclose(intra, 0) or np.allclose(centroid_distances, 0):
+        return 0.0
+    centroid_distances[centroid_distances == 0] = np.inf
+    combined_intra = intra[:, None] + intra
+    return float(np.mean(np.max(combined_intra / centroid_distances, axis=1)))
+
+
+def _calinski_harabasz(extra, intra, n_samples, n_clusters):
+    return float(1.0 if intra == 0.0 else extra * (n_samples - n_clusters) / (intra * (n_clusters - 1)))
+
+
+def weighted_davies_bouldin_score(X, labels, sample_weight=None):
+    codes, n_clusters, weights = _check_labels(labels, sample_weight)
+    X = np.asarray(X, dtype=float)
+    centroids, cluster_weight = _centroids(X, codes, n_clusters, weights)
+    distances = np.linalg.norm(X - centroids[codes], axis=1)
+    intra = np.bincount(codes, weights=weights * distances, minlength=n_clusters) / cluster_weight
+    return _davies_bouldin(intra, centroids)
+
+
+def weighted_calinski_harabasz_score(X, labels, sample_weight=None):
+    codes, n_clusters, weights = _check_labels(labels, sample_weight)
+    X = np.asarray(X, dtype=float)
+    centroids, cluster_weight = _centroids(X, codes, n_clusters, weights)
+    n_samples = weights.sum()
+    mean = weights @ X / n_samples
+    extra = (cluster_weight * ((centroids - mean) ** 2).sum(axis=1)).sum()
+    intra = (weights * ((X - centroids[codes]) ** 2).sum(axis=1)).sum()
+    return _calinski_harabasz(extra, intra, n_samples, n_clusters)
+
+
+class CategoricalMetrics:
+    """Silhouette, Davies-Bouldin and Calinski-Harabasz for many labelings of one categorical dataset.
+
+    Built once per dataset: the rows are collapsed to their distinct patterns, every column is
+    treated as categorical and one-hot encoded, and pattern-to-pattern distances for the silhouette
+    are cached (Euclidean between one-hot rows, or Gower with distance='gower'). A labeling then
+    only needs the weight of each occupied (pattern, cluster) cell: Davies-Bouldin and
+    Calinski-Harabasz come from per-cluster value-count tables and the silhouette is computed over
+    the cells, so no step after construction depends on the number of rows.
+
+    Scores equal weighted_davies_bouldin_score / weighted_calinski_harabasz_score on the one-hot
+    matrix and weighted_silhouette_score on the chosen distances.
+    """
+
+    def __init__(self, X, sample_weight=None, distance='onehot', max_cached_patterns=4096):
+        frame = pd.DataFrame(X).reset_index(drop=True)
+        codes = np.column_stack([pd.factorize(frame[col], use_na_sentinel=False)[0] for col in frame.columns])
+        self.patterns, first_rows, inverse = np.unique(codes, axis=0, return_index=True, return_inverse=True)
+        self.inverse = inverse.reshape(-1)
+        self.weights = np.ones(len(frame)) if sample_weight is None else np.asarray(sample_weight, dtype=float)
+        self.n_values = codes.max(axis=0) + 1
+        self.offsets = np.concatenate([[0], np.cumsum(self.n_values)[:-1]])
+
+        if distance == 'gower':
+            # Gower over the distinct rows, with the same column handling as gower_condensed
+            gower_features = encode_gower_features(frame.iloc[first_rows])
+            self._pattern_distances = lambda rows: gower_block(*gower_features, rows, slice(None))
+        elif distance == 'onehot':
+            # Two one-hot rows differing in h features are sqrt(2 h) apart
+            self._pattern_distances = lambda rows: np.sqrt(
+                2.0 * (self.patterns[rows][:, None, :] != self.patterns[None, :, :]).sum(axis=2))
+        else:
+            raise ValueError(f"Unknown distance: {distance!r}")
+        self._distance_cache = None
+        if len(self.patterns) <= max_cached_patterns:
+            self._distance_cache = self._pattern_distances(np.arange(len(self.patterns)))
+
+    def _distances(self, pattern_rows):
+        if self._distance_cache is not None:
+            return self._distance_cache[pattern_rows]
+        return self._pattern_distances(pattern_rows)
+
+    def _cells(self, labels):
+        """Occupied (pattern, cluster) cells: (pattern, cluster code, weight, number of clusters)."""
+        cluster, n_clusters, weights = _check_labels(labels, self.weights)
+        cells, cell_index = np.unique(self.inverse * n_clusters + cluster, return_inverse=True)
+        cell_weight = np.bincount(cell_index.reshape(-1), weights=weights)
+        return cells // n_clusters, cells % n_clusters, cell_weight, n_clusters
+
+    def _count_tables(self, labels):
+        """Per-cluster centroids in one-hot space, from weighted value counts per feature."""
+        pattern, cluster, weight, n_clusters = self._cells(labels)
+        tables = [np.bincount(cluster * n_j + self.patterns[pattern, j], weights=weight,
+                              minlength=n_clusters * n_j).reshape(n_clusters, n_j)
+                  for j, n_j in enumerate(self.n_values)]
+        cluster_weight = np.bincount(cluster, weights=weight, minlength=n_clusters)
+        centroids = np.hstack(tables) / cluster_weight[:, None]
+        return centroids, cluster_weight, pattern, cluster, weight, n_clusters
+
+    def davies_bouldin(self, labels):
+        centroids, cluster_weight, pattern, cluster, weight, n_clusters = self._count_tables(labels)
+        # |x - c|^2 = n_features - 2 x.c + |c|^2 for a one-hot row x
+        dot = centroids[cluster[:, None], self.offsets + self.patterns[pattern]].sum(axis=1)
+        squared = len(self.n_values) - 2 * dot + (centroids ** 2).sum(axis=1)[cluster]
+        distances = np.sqrt(np.maximum(squared, 0))
+        intra = np.bincount(cluster, weights=weight * distances, minlength=n_clusters) / cluster_weight
+        return _davies_bouldin(intra, centroids)
+
+    def calinski_harabasz(self, labels):
+        centroids, cluster_weight, _, _, _, n_clusters = self._count_tables(labels)
+        n_samples = cluster_weight.sum()
+        mean = cluster_weight @ centroids / n_samples
+        extra = (cluster_weight * ((centroids - mean) ** 2).sum(axis=1)).sum()
+        intra = (cluster_weight * (len(self.n_values) - (centroids ** 2).sum(axis=1))).sum()
+        return _calinski_harabasz(extra, intra, n_samples, n_clusters)
+
+    def silhouette(self, labels, sample_size=None, random_state=None):
+        """Silhouette over the (pattern, cluster) cells; returns (score, (low, high)) as
+        sampled_silhouette_score does. The cells are sampled only when there are more than
+        sample_size of them; sample_size=None always computes the exact score."""
+        pattern, cluster, weight, _ = self._cells(labels)
+
+        def cell_distances(rows):
+            return self._distances(pattern[rows])[:, pattern]
+
+        return sampled_silhouette_score(None, cluster, sample_size, sample_weight=weight,
+                                        metric=cell_distances, random_state=random_state)
+
+    def silhouette_sweep(self, labelings, chunk_size=1024):
+        """Exact silhouette for each of several nested labelings, e.g. the fcluster cuts of one
+        linkage for decreasing k; labelings is a dict and the result has the same keys.
+
+        Each labeling must merge clusters of the previous one. Summed distances from every
+        pattern to every cluster are computed once, for the first (finest) labeling, and are then
+        only added together as clusters merge, so the sweep walks the dendrogram once.
+        Labelings with fewer than two clusters are left out of the result.
+        """
+        scores = {}
+        sums = previous = None
+        for key, labels in labelings.items():
+            classes, cluster = np.unique(np.asarray(labels), return_inverse=True)
+            cluster, n_clusters = cluster.reshape(-1), len(classes)
+            cluster_weight = np.bincount(cluster, weights=self.weights, minlength=n_clusters)
+            if sums is None:
+                table = np.bincount(self.inverse * n_clusters + cluster, weights=self.weights,
+                                    minlength=len(self.patterns) * n_clusters).reshape(-1, n_clusters)
+                sums = np.vstack([self._distances(np.arange(start, min(start + chunk_size, len(table)))) @ table
+                                  for start in range(0, len(table), chunk_size)])
+            else:
+                # Each previous cluster lies inside exactly one current cluster
+                pairs = np.unique(previous * n_clusters + cluster)
+                if len(pairs) != sums.shape[1]:
+                    raise ValueError("silhouette_sweep needs nested labelings")
+                merge = np.zeros((sums.shape[1], n_clusters))
+                merge[pairs // n_clusters, pairs % n_clusters] = 1.0
+                sums = sums @ merge
+            previous = cluster
+
+            if not 1 < n_clusters < cluster_weight.sum():
+                continue
+            cells, cell_index = np.unique(self.inverse * n_clusters + cluster, return_inverse=True)
+            cell_weight = np.bincount(cell_index.reshape(-1), weights=self.weights)
+            cell_scores = _silhouette_from_sums(sums[cells // n_clusters], cells % n_clusters, cluster_weight)
+            scores[key] = float(cell_weight @ cell_scores / cell_weight.sum())
+        return scores
@@ -0,0 +1,247 @@
+"""Clustering jobs run in a pool of worker processes.
+
+Running the pipeline inside a request blocks the event loop for the whole run. JobManager
+hands each upload to a ProcessPoolExecutor instead and tracks it by job id: its
+status, the pipeline stage it has reached (reported by the worker through a queue) and finally
+its result or error. Up to max_workers pipelines run at the same time.
+
+Workers can be pre-warmed: each one imports the pipeline and runs it once on a tiny CSV as it
+starts, so requests never pay for loading scikit-learn, scipy and friends or for first-call
+initialisation. JobManager.start brings the whole pool up front and reports each warm-up time.
+"""
+import contextlib
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger("clustering-service")
+
+# Set in every worker process by _init_worker
+_progress_queue = None
+_warmup_seconds = None
+
+# Enough rows for every stage of the pipeline to run, including the k sweep up to 15
+WARMUP_DOMAINS = ['gmail.com', 'sliit.lk', 'uom.lk']
+WARMUP_CATEGORIES = ['AI', 'Marketing', 'Finance', 'Data Science']
+
+
+def warmup_upload():
+    """The tiny upload workers warm up on (24 rows); tests use it as their small CSV too."""
+    import pandas as pd
+
+    return pd.DataFrame({'Email': [f'user{i}@{domain}' for i, domain in enumerate(WARMUP_DOMAINS * 8)],
+                         'Keyword Category': WARMUP_CATEGORIES * 6})
+
+
+def warm_up(pipeline_config):
+    """Import the pipeline and run it once on a tiny upload; returns the seconds it took."""
+    start = time.perf_counter()
+    import clustering_script
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        clustering_script.main(warmup_upload(), **pipeline_config)
+    return time.perf_counter() - start
+
+
+def _init_worker(progress_queue, warmup_config=None, cpus=None):
+    global _progress_queue, _warmup_seconds
+    _progress_queue = progress_queue
+    if cpus is not None:
+        # The k sweep runs joblib with n_jobs=-1; without a cap every worker would use every core
+        os.environ['LOKY_MAX_CPU_COUNT'] = str(cpus)
+    if warmup_config is not None:
+        try:
+            _warmup_seconds = warm_up(warmup_config)
+        except Exception as e:
+            # A cold worker still runs jobs correctly
+            logger.warning(f"Worker warm-up failed: {str(e)}")
+
+
+def _worker_info():
+    return os.getpid(), _warmup_seconds
+
+
+def run_pipeline(job_id, source, is_new_import, pipeline_config, return_frame=False):
+    """Worker side of a job: clustering_script.main on source (a CSV path or an uploaded
+    DataFrame), returning its result dict, or (final_df, result without 'clustered_data') with
+    return_frame."""
+    from clustering_script import main
+
+    def report(stage, progress):
+        _progress_queue.put((job_id, stage, progress))
+
+    report('started', 0.0)
+    final_df, result = main(source, is_new_import=is_new_import, progress_callback=report,
+                            include_records=not return_frame, **pipeline_config)
+    return (final_df, result) if return_frame else result
+
+
+class JobManager:
+    """Clustering jobs by id, run by up to max_workers worker processes.
+
+    The pool is started by start() or on the first submission; with warmup_config (the
+    pipeline options) every worker warms up with them as it starts. The last `history` finished
+    jobs are kept for their status and result; older ones are forgotten. Each worker's joblib
+    parallelism is capped at cpus_per_worker (by default the cores divided between the workers),
+    so max_workers bounds the CPU the pool uses, not just the number of concurrent runs.
+
+    A worker that dies (e.g. killed for running out of memory) breaks the whole executor. The
+    broken pool is then replaced by a new one: submissions are retried once on it, and so is a
+    job whose worker died.
+    """
+
+    def __init__(self, max_workers=1, history=32, warmup_config=None, cpus_per_worker=None):
+        self.max_workers = max_workers
+        self.cpus_per_worker = cpus_per_worker or max(1, (os.cpu_count() or 1) // max_workers)
+        self.history = history
+        self.warmup_config = warmup_config
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._progress_queue = None
+
+    def _ensure_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                # Spawned workers do not inherit the server's threads or open sockets
+                context = multiprocessing.get_context('spawn')
+                self._progress_queue = context.Queue()
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=context,
+                                                 initializer=_init_worker,
+                                                 initargs=(self._progress_queue, self.warmup_config,
+                                                           self.cpus_per_worker))
+                threading.Thread(target=self._drain_progress, args=(self._progress_queue,), daemon=True).start()
+            return self._pool
+
+    def _discard_pool(self, pool):
+        """Drop pool if it is still the current one, so the next submission starts a new one."""
+        with self._pool_lock:
+            if self._pool is pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                self._progress_queue.put(None)
+                self._pool = None
+
+    def _submit(self, fn, *args):
+        """pool.submit, retried once on a new pool if the current one is broken."""
+        pool = self._ensure_pool()
+        try:
+            return pool.submit(fn, *args)
+        except BrokenProcessPool:
+            logger.warning("Clustering worker pool is broken (a worker died); starting a new one")
+            self._discard_pool(pool)
+            return self._ensure_pool().submit(fn, *args)
+
+    def start(self, timeout=300):
+        """Start every worker now and wait until they are ready (warmed up, if configured).
+
+        Returns {pid: warm-up seconds} for the workers that answered; None means not warmed.
+        """
+        # One task per worker makes the executor spawn the whole pool
+        done, _ = wait([self._submit(_worker_info) for _ in range(self.max_workers)], timeout=timeout)
+        return dict(future.result() for future in done if future.exception() is None)
+
+    def _drain_progress(self, progress_queue):
+        while True:
+            message = progress_queue.get()
+            if message is None:
+                return
+            job_id, stage, progress = message
+            with self._lock:
+                job = self._jobs.get(job_id)
+                # A late message must not overwrite a finished job
+                if job is not None and job['status'] in ('queued', 'running'):
+                    if job['status'] == 'queued':
+                        job['status'], job['started_at'] = 'running', time.time()
+                    job['stage'], job['progress'] = stage, progress
+
+    def _add(self, job):
+        with self._lock:
+            self._jobs[job['job_id']] = job
+            finished = [job_id for job_id, item in self._jobs.items() if item['status'] in ('completed', 'failed')]
+            for job_id in finished[:max(0, len(finished) - self.history)]:
+                del self._jobs[job_id]
+
+    @staticmethod
+    def _new_job(status='queued'):
+        return {'job_id': uuid.uuid4().hex, 'status': status, 'stage': None, 'progress': 0.0,
+                'submitted_at': time.time(), 'started_at': None, 'finished_at': None,
+                'error': None, 'result': None}
+
+    def submit(self, source, is_new_import=False, pipeline_config=None, finish=None):
+        """Queue a pipeline run on source (a CSV path or a DataFrame); returns the job id.
+
+        finish, if given, turns the worker's result dict into the job result; it runs in the
+        parent process.
+        """
+        job = self._new_job()
+        task = (run_pipeline, job['job_id'], source, is_new_import, pipeline_config or {})
+        future = self._submit(*task)
+        # Only a job that was actually queued enters the table
+        self._add(job)
+        future.add_done_callback(lambda done: self._finish(job['job_id'], done, finish, retry=task))
+        return job['job_id']
+
+    def run(self, source, is_new_import=False, pipeline_config=None, return_frame=False):
+        """Future of one pipeline run on a worker, for callers that wait for it themselves; it
+        is not tracked in the job table. See run_pipeline for return_frame. The future raises
+        BrokenProcessPool if its worker dies; the next run() starts a new pool."""
+        return self._submit(run_pipeline, None, source, is_new_import, pipeline_config or {}, return_frame)
+
+    def add_completed(self, result):
+        """Record a job whose result is already known (e.g. from the result cache)."""
+        job = self._new_job(status='completed')
+        job.update(stage='done', progress=1.0, started_at=job['submitted_at'],
+                   finished_at=job['submitted_at'], result=result)
+        self._add(job)
+        return job['job_id']
+
+    def _finish(self, job_id, future, finish, retry=None):
+        try:
+            try:
+                result = future.result()
+            except BrokenProcessPool:
+                if retry is None:
+                    raise
+                # The worker died mid-job, not the job itself: run it once more on a new pool
+                logger.warning(f"Worker of clustering job {job_id} died; retrying the job")
+                self._submit(*retry).add_done_callback(lambda done: self._finish(job_id, done, finish))
+                return
+            if finish is not None:
+                result = finish(result)
+            update = {'status': 'completed', 'stage': 'done', 'progress': 1.0, 'result': result}
+        except Exception as e:
+            logger.error(f"Clustering job {job_id} failed: {str(e)}")
+            logger.error(traceback.format_exc())
+            update = {'status': 'failed', 'error': str(e)}
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(update, finished_at=time.time())
+                job['started_at'] = job['started_at'] or job['submitted_at']
+
+    def status(self, job_id):
+        """Everything known about a job except its result. Raises KeyError for unknown jobs."""
+        with self._lock:
+            return {key: value for key, value in self._jobs[job_id].items() if key != 'result'}
+
+    def result(self, job_id):
+        """(status, result) of a job; the result is None until it has completed."""
+        with self._lock:
+            job = self._jobs[job_id]
+            return job['status'], job['result']
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._progress_queue.put(None)
+                self._pool = None
@@ -1,20 +1,20 @@
+# scikit-learn, scipy, kmodes and matplotlib are imported by the stages that use them, so importing
+# this module (e.g. at service startup) only loads pandas and numpy
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import LabelEncoder
-from kmodes.kmodes import KModes
-from scipy.cluster.hierarchy import linkage, fcluster, dendrogram
-import matplotlib.pyplot as plt
-import seaborn as sns
-from gower import gower_matrix
-from sklearn.manifold import TSNE
-from sklearn.metrics import silhouette_score, davies_bouldin_score, calinski_harabasz_score
 import warnings
 from collections import Counter
 import json
-import base64
-from io import BytesIO
-import matplotlib
-matplotlib.use('Agg')  # Use the Agg backend to prevent display issues
+import re
+import time
+from functools import lru_cache
+from charts import chart_to_base64, truncated_linkage
+from cluster_metrics import CategoricalMetrics
+from embedding import EMBEDDING_METHODS, embed_patterns
+from fast_json import frame_records
+from hierarchical import weighted_ward_linkage, group_prototypes
+from gower_distance import gower_condensed
+from kmodes_engine import NumpyKModes, encode_codes, split_centroids
 
 warnings.filterwarnings('ignore')
 
@@ -37,16 +37,35 @@ UNIVERSITY_MAP = {
 PERSONAL_DOMAINS = ['gmail.com', 'yahoo.com', 'hotmail.com', 'outlook.com',
                     'icloud.com', 'live.com', 'ymail.com', 'googlemail.com']
 
+ACADEMIC_TERMS = ['university', 'college', 'institute', 'campus', 'school']
 
-# Helper function to convert matplotlib figures to base64 data
-def fig_to_base64(fig):
-    buffer = BytesIO()
-    fig.savefig(buffer, format='png', bbox_inches='tight')
-    buffer.seek(0)
-    image_png = buffer.getvalue()
-    buffer.close()
-    encoded = base64.b64encode(image_png).decode('utf-8')
-    return encoded
+CORPORATE_TLDS = ('.com', '.net', '.io', '.co')
+
+# Upper bound on memoized identify_university results (one entry per distinct domain)
+UNIVERSITY_CACHE_SIZE = 65536
+
+# Silhouette during model selection: once a labeling has more distinct (pattern, cluster) cells
+# than sample_size, score a seeded stratified sample of them. Pass silhouette_sampling=None for
+# the exact score.
+SILHOUETTE_SAMPLING = {'sample_size': 2000, 'random_state': 42}
+# Scatter-plot layout: t-SNE (or linear-time PCA) over at most max_points distinct feature patterns
+EMBEDDING = {'method': 'tsne', 'max_points': 5000, 'jitter': 0.05}
+
+
+def add_chart(visualization_data, name, series, render_charts=False):
+    """Record a chart's numeric series for on-demand rendering (see charts.py); with
+    render_charts=True its PNG is also embedded, base64-encoded, under its name."""
+    visualization_data.setdefault('chart_series', {})[name] = series
+    if render_charts:
+        visualization_data[name] = chart_to_base64(name, series)
+
+
+def merge_visualization_data(target, update):
+    """dict.update that keeps the chart series recorded by earlier stages."""
+    chart_series = {**target.get('chart_series', {}), **update.get('chart_series', {})}
+    target.update(update)
+    if chart_series:
+        target['chart_series'] = chart_series
 
 
 # Helper functions
@@ -57,7 +76,74 @@ def extract_domain(email):
         return None
 
 
+class UniversityIndex:
+    """Lookup tables for identify_university, built once from a university map.
+
+    Answers are the same as scanning the map three times (exact domains, then abbreviation
+    prefixes/suffixes of the domain parts, then words of the university name), but each stage
+    is a handful of dict lookups or a single regex pass.
+    """
+
+    def __init__(self, university_map):
+        # Stage 1: exact '<abbr>.ac.lk', '<abbr>.edu.lk' and '<abbr>.lk' domains
+        self.exact_domains = {}
+        for abbr, univ_name in university_map.items():
+            for suffix in ('.ac.lk', '.edu.lk', '.lk'):
+                self.exact_domains.setdefault(f"{abbr}{suffix}", univ_name)
+
+        # Stage 2: abbreviation -> (position in the map, name); parts are probed at these lengths
+        self.abbreviations = {abbr: (position, univ_name)
+                              for position, (abbr, univ_name) in enumerate(university_map.items())}
+        self.abbreviation_lengths = sorted({len(abbr) for abbr in university_map})
+
+        # Stage 3: one pattern over every name word. At each offset the alternation tries words in
+        # map order, so the lowest-positioned word found anywhere gives the first matching name.
+        self.name_words = {}
+        for position, univ_name in enumerate(university_map.values()):
+            simplified_name = univ_name.lower().replace("university", "").replace("institute", "").strip()
+            for word in simplified_name.split():
+                if len(word) > 3:
+                    self.name_words.setdefault(word, (position, univ_name))
+        ordered_words = sorted(self.name_words, key=lambda word: self.name_words[word][0])
+        self.name_pattern = re.compile('(?=(' + '|'.join(re.escape(word) for word in ordered_words) + '))')
+
+    def resolve(self, domain):
+        univ_name = self.exact_domains.get(domain)
+        if univ_name is not None:
+            return univ_name
+
+        best = None
+        for part in domain.split('.'):
+            for length in self.abbreviation_lengths:
+                if length > len(part):
+                    break
+                for piece in (part[:length], part[-length:]):
+                    hit = self.abbreviations.get(piece)
+                    if hit is not None and (best is None or hit[0] < best[0]):
+                        best = hit
+        if best is not None:
+            return best[1]
+
+        hits = [self.name_words[match.group(1)] for match in self.name_pattern.finditer(domain.lower())]
+        return min(hits)[1] if hits else None
+
+
+UNIVERSITY_INDEX = UniversityIndex(UNIVERSITY_MAP)
+
+
+@lru_cache(maxsize=UNIVERSITY_CACHE_SIZE)
+def _resolve_university(domain):
+    return UNIVERSITY_INDEX.resolve(domain)
+
+
 def identify_university(domain):
+    if not domain:
+        return None
+    return _resolve_university(domain)
+
+
+def _identify_university_scan(domain):
+    """The original triple scan over UNIVERSITY_MAP, kept as the reference for UniversityIndex."""
     if not domain:
         return None
 
@@ -89,8 +175,7 @@ def get_domain_type(domain):
 
     # Academic domains
     if (domain in SRI_LANKAN_EDU_DOMAINS or domain.endswith('.edu') or domain.endswith('.ac.lk') or
-            domain.endswith('.edu.lk') or any(
-                term in domain for term in ['university', 'college', 'institute', 'campus', 'school'])):
+            domain.endswith('.edu.lk') or any(term in domain for term in ACADEMIC_TERMS)):
         return 'academic'
 
     # Personal email domains
@@ -98,7 +183,7 @@ def get_domain_type(domain):
         return 'personal'
 
     # Corporate/Business domains
-    if any(domain.endswith(tld) for tld in ['.com', '.net', '.io', '.co']):
+    if any(domain.endswith(tld) for tld in CORPORATE_TLDS):
         return 'corporate'
 
     # Government domains
@@ -123,35 +208,210 @@ def is_sri_lankan(domain):
     return 1 if domain and ('.lk' in domain) else 0
 
 
+# Vectorized feature extraction
+# These mirror the scalar helpers above with numpy.strings ufuncs over fixed-width unicode
+# arrays, so a 500k-row import does not pay one Python call per row and per feature.
+def _string_array(values):
+    """Return (unicode array with '' for non-strings, mask of entries that were strings)."""
+    values = pd.Series(values)
+    if pd.api.types.infer_dtype(values, skipna=True) in ('string', 'empty'):
+        is_str = values.notna().to_numpy()
+    else:
+        is_str = values.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+    text = np.where(is_str, values.to_numpy(dtype=object), '').astype(str)
+    return text, is_str
+
+
+def _lower(text):
+    """str.lower over a unicode array: ASCII rows are lowered on the code points directly."""
+    codes = text.view(np.uint32).reshape(len(text), text.dtype.itemsize // 4).copy()
+    codes[(codes >= 65) & (codes <= 90)] += 32
+    lowered = codes.view(text.dtype).reshape(len(text))
+    non_ascii = (codes > 127).any(axis=1)
+    if non_ascii.any():
+        # Unicode case mapping can change the length, so leave it to str.lower
+        lowered = lowered.astype(object)
+        lowered[non_ascii] = [value.lower() for value in text[non_ascii]]
+        lowered = lowered.astype(str)
+    return lowered
+
+
+def _to_series(values, index, keep=None):
+    out = values.astype(object)
+    if keep is not None:
+        out[~keep] = None
+    return pd.Series(out, index=index)
+
+
+def _domain_labels(text):
+    """Split each domain into (last label, second-to-last label, has a label before that)."""
+    last_dot = np.strings.rfind(text, '.')
+    last = np.where(last_dot >= 0, np.strings.slice(text, last_dot + 1, None), '')
+    head = np.strings.slice(text, 0, np.maximum(last_dot, 0))
+    head_dot = np.strings.rfind(head, '.')
+    second = np.where(last_dot >= 0, np.strings.slice(head, head_dot + 1, None), '')
+    return last, second, head_dot >= 0
+
+
+def _domain_array(emails):
+    text, is_str = _string_array(emails)
+    at = np.strings.find(text, '@')
+    rest = np.strings.slice(text, at + 1, None)
+    # Like split('@')[1], stop at a second '@' if there is one
+    second_at = np.strings.find(rest, '@')
+    domains = np.where(second_at >= 0, np.strings.slice(rest, 0, np.maximum(second_at, 0)), rest)
+    found = is_str & (at >= 0)
+    return _lower(np.where(found, domains, '')), found
+
+
+def _domain_type_array(text, labels=None):
+    last, second, deep = labels if labels is not None else _domain_labels(text)
+    # endswith('.x.lk') is "last label is lk and the one before is x", with a dot before that
+    lk_second = np.where((last == 'lk') & deep, second, '')
+    academic = (np.isin(text, SRI_LANKAN_EDU_DOMAINS) | (last == 'edu') | (lk_second == 'ac') |
+                (lk_second == 'edu') |
+                np.logical_or.reduce([np.strings.find(text, term) >= 0 for term in ACADEMIC_TERMS]))
+    conditions = [
+        text == '',
+        academic,
+        np.isin(text, PERSONAL_DOMAINS),
+        np.isin(last, [tld.lstrip('.') for tld in CORPORATE_TLDS]),
+        (last == 'gov') | (lk_second == 'gov'),
+        (last == 'org') | (lk_second == 'org'),
+    ]
+    choices = np.array(['unknown', 'academic', 'personal', 'corporate', 'government', 'organization', 'other'],
+                       dtype=object)
+    return choices[np.select(conditions, np.arange(len(conditions)), default=len(conditions))]
+
+
+def _tld_array(text, labels=None):
+    last, second, _ = labels if labels is not None else _domain_labels(text)
+    single_label = np.strings.find(text, '.') < 0
+    second_is_ac = ~single_label & (second == 'ac')
+    return np.where(second_is_ac, np.strings.add('ac.', last), np.where(single_label, text, last))
+
+
+def _sri_lankan_array(text):
+    return (np.strings.find(text, '.lk') >= 0).astype('int64')
+
+
+def extract_domains(emails):
+    """Vectorized extract_domain: lower-cased text after the first '@', None when absent."""
+    domains, found = _domain_array(emails)
+    return _to_series(domains, emails.index, keep=found)
+
+
+def classify_domain_types(domains):
+    """Vectorized get_domain_type; rules are applied in the same priority order."""
+    text, _ = _string_array(domains)
+    return _to_series(_domain_type_array(text), domains.index)
+
+
+def extract_tlds(domains):
+    """Vectorized extract_tld: the last label, or 'ac.<last>' when the second-to-last label is 'ac'.
+
+    Single-label domains (where extract_tld raises) resolve to the label itself.
+    """
+    text, _ = _string_array(domains)
+    return _to_series(_tld_array(text), domains.index, keep=text != '')
+
+
+def flag_sri_lankan(domains):
+    """Vectorized is_sri_lankan."""
+    text, _ = _string_array(domains)
+    return pd.Series(_sri_lankan_array(text), index=domains.index)
+
+
+def map_domain_features(domains, compute):
+    """Factorize `domains`, run `compute` on the distinct values only and broadcast the result back.
+
+    `compute` receives a Series of unique domains and returns a DataFrame of features aligned with it,
+    so feature cost scales with the number of distinct domains instead of with rows.
+    """
+    codes, uniques = pd.factorize(domains)
+    unique_domains = pd.Series(uniques, dtype=object)
+    if (codes < 0).any():
+        # Missing domains share one trailing slot, which code -1 picks up
+        unique_domains = pd.concat([unique_domains, pd.Series([None], dtype=object)], ignore_index=True)
+    features = compute(unique_domains)
+    return pd.DataFrame({column: features[column].to_numpy()[codes] for column in features.columns},
+                        index=domains.index)
+
+
+def _domain_features(domains):
+    text, _ = _string_array(domains)
+    labels = _domain_labels(text)
+    return pd.DataFrame({
+        'domain_type': _domain_type_array(text, labels),
+        'tld': _to_series(_tld_array(text, labels), domains.index, keep=text != ''),
+        'is_sri_lankan': _sri_lankan_array(text),
+    }, index=domains.index)
+
+
+def add_domain_features(df):
+    """Add domain, domain_type, tld and is_sri_lankan columns.
+
+    The domain is sliced out of every email; the rest is computed once per distinct domain.
+    """
+    domains, found = _domain_array(df['Email'])
+    df['domain'] = _to_series(domains, df.index, keep=found)
+    features = map_domain_features(df['domain'], _domain_features)
+    for column in features.columns:
+        df[column] = features[column]
+    return df
+
+
+def fit_label_encoder(values):
+    """LabelEncoder().fit_transform(values), fitted and transformed on the distinct values only."""
+    from sklearn.preprocessing import LabelEncoder
+
+    codes, uniques = pd.factorize(values)
+    encoder = LabelEncoder()
+    if (codes < 0).any():
+        # Missing values: let LabelEncoder handle (and reject) them exactly as before
+        return encoder, encoder.fit_transform(values)
+    encoder.fit(uniques)
+    return encoder, encoder.transform(uniques)[codes]
+
+
 # Data processing functions
-def add_academic_features(df):
-    # Add binary feature for Sri Lankan academic institutions
-    df['is_sl_academic'] = df['domain'].apply(
+def _academic_features(domains):
+    # Binary feature for Sri Lankan academic institutions
+    is_sl_academic = domains.apply(
         lambda domain: 1 if (domain in SRI_LANKAN_EDU_DOMAINS or
                              domain.endswith('.ac.lk') or domain.endswith('.edu.lk')) else 0)
 
-    # Add feature for academic level
-    df['academic_level'] = df['domain'].apply(
+    # Feature for academic level
+    academic_level = domains.apply(
         lambda domain: 2 if (domain in SRI_LANKAN_EDU_DOMAINS or domain.endswith('.ac.lk')) else
         (1 if (domain.endswith('.edu') or 'university' in domain or 'college' in domain) else 0))
 
-    # Add university identification
-    df['university_name'] = df['domain'].apply(identify_university)
-    df['is_identified_university'] = df['university_name'].apply(lambda x: 0 if x is None else 1)
+    # University identification
+    university_name = domains.apply(identify_university)
+    return pd.DataFrame({
+        'is_sl_academic': is_sl_academic,
+        'academic_level': academic_level,
+        'university_name': university_name,
+        'is_identified_university': university_name.apply(lambda x: 0 if x is None else 1),
+    })
+
+
+def add_academic_features(df):
+    # Every academic feature depends only on the domain, so compute it once per distinct domain
+    features = map_domain_features(df['domain'], _academic_features)
+    for column in features.columns:
+        df[column] = features[column]
 
     return df
 
 
 def load_and_preprocess_data(file_path):
-    # Read and process data
-    df = pd.read_csv(file_path)
+    # Read and process data; the service passes an upload it has already parsed
+    df = file_path.copy() if isinstance(file_path, pd.DataFrame) else pd.read_csv(file_path)
     print(f"Original data shape: {df.shape}")
 
     # Extract domain information
-    df['domain'] = df['Email'].apply(extract_domain)
-    df['domain_type'] = df['domain'].apply(get_domain_type)
-    df['tld'] = df['domain'].apply(extract_tld)
-    df['is_sri_lankan'] = df['domain'].apply(is_sri_lankan)
+    df = add_domain_features(df)
 
     # Remove entries with missing domains
     df = df.dropna(subset=['domain'])
@@ -173,8 +433,8 @@ def prepare_for_clustering(df):
     # Encode categorical variables
     encoders = {}
     for field in ['domain_type', 'Keyword Category', 'tld']:
-        encoder = LabelEncoder()
-        df[f'{field.split()[0].lower()}_encoded'] = encoder.fit_transform(df[field])
+        encoder, encoded = fit_label_encoder(df[field])
+        df[f'{field.split()[0].lower()}_encoded'] = encoded
         encoders[field.split()[0].lower()] = encoder
 
     # Add academic features
@@ -182,8 +442,8 @@ def prepare_for_clustering(df):
 
     # Encode university names
     df['university_name_filled'] = df['university_name'].fillna('Unknown')
-    university_encoder = LabelEncoder()
-    df['university_encoded'] = university_encoder.fit_transform(df['university_name_filled'])
+    university_encoder, university_encoded = fit_label_encoder(df['university_name_filled'])
+    df['university_encoded'] = university_encoded
     encoders['university'] = university_encoder
 
     # Feature matrix
@@ -194,35 +454,72 @@ def prepare_for_clustering(df):
     return df, X_kmodes, encoders
 
 
-def compute_tsne_coordinates(X, n_components=2, perplexity=30, learning_rate=200):
-    print("\nComputing t-SNE coordinates for 2D visualization...")
-    tsne = TSNE(n_components=n_components, perplexity=perplexity, learning_rate=learning_rate, random_state=42)
-    return tsne.fit_transform(X)
+def compute_tsne_coordinates(X, n_components=2, perplexity=30, learning_rate=200, embedding=EMBEDDING):
+    print(f"\nComputing {embedding['method']} coordinates for 2D visualization...")
+    return embed_patterns(X, n_components=n_components, perplexity=perplexity, learning_rate=learning_rate,
+                          random_state=42, **embedding)
+
+
+# Dedup mode: the clustering features are categorical, so most rows repeat a small number of
+# patterns. Clustering the distinct patterns with multiplicity weights gives the same objective.
+def collapse_patterns(X):
+    """Collapse identical rows of X to (unique rows, row -> pattern index, pattern multiplicity)."""
+    patterns, inverse, counts = np.unique(X, axis=0, return_inverse=True, return_counts=True)
+    # Float weights: KModes rejects numpy integer sample weights
+    return patterns, inverse.reshape(-1), counts.astype(float)
+
+
+def collapse_frame(frame):
+    """DataFrame version of collapse_patterns; unique rows keep their order of first appearance."""
+    codes = frame.groupby(list(frame.columns), sort=False, dropna=False).ngroup().to_numpy()
+    first_rows = np.unique(codes, return_index=True)[1]
+    return frame.iloc[first_rows].reset_index(drop=True), codes, np.bincount(codes)
+
+
+# Stage-1 k-modes implementations; both take the same arguments and expose the same attributes
+def _package_kmodes(**kwargs):
+    from kmodes.kmodes import KModes
+    return KModes(**kwargs)
+
+
+KMODES_ENGINES = {'kmodes': _package_kmodes, 'numpy': NumpyKModes}
 
 
 # Evaluation functions
-def evaluate_clustering(X, clusters, distance_matrix=None):
+def evaluate_clustering(X, clusters, sample_weight=None, silhouette_sampling=SILHOUETTE_SAMPLING,
+                        metrics_engine=None, distance='onehot', silhouette=None):
+    """Silhouette, Davies-Bouldin and Calinski-Harabasz for one labeling of categorical X.
+
+    Scores come from a CategoricalMetrics engine (one-hot features; silhouette distances are
+    one-hot Euclidean, or Gower with distance='gower'). When scoring several labelings of the
+    same data, build the engine once and pass it as metrics_engine. An exact silhouette that
+    is already known (e.g. from CategoricalMetrics.silhouette_sweep) can be passed in.
+    """
     metrics = {}
 
-    # Convert categorical data to one-hot encoding if needed
-    X_numeric = pd.get_dummies(X).values if isinstance(X, pd.DataFrame) else X.copy()
+    # With sample_weight each row of X counts sample_weight[i] times
+    if metrics_engine is None:
+        metrics_engine = CategoricalMetrics(X, sample_weight, distance=distance)
 
-    # Calculate metrics
     try:
-        if distance_matrix is not None:
-            metrics['silhouette'] = silhouette_score(distance_matrix, clusters, metric='precomputed')
+        if silhouette is not None:
+            metrics['silhouette'], metrics['silhouette_ci'] = silhouette, (silhouette, silhouette)
         else:
-            metrics['silhouette'] = silhouette_score(X_numeric, clusters)
+            # Sampled only when there are more distinct (pattern, cluster) cells than the sample
+            # size; the confidence interval goes to silhouette_ci
+            sampling = silhouette_sampling or {}
+            metrics['silhouette'], metrics['silhouette_ci'] = metrics_engine.silhouette(
+                clusters, sampling.get('sample_size'), sampling.get('random_state'))
     except:
         metrics['silhouette'] = "Could not compute"
 
     try:
-        metrics['davies_bouldin'] = davies_bouldin_score(X_numeric, clusters)
+        metrics['davies_bouldin'] = metrics_engine.davies_bouldin(clusters)
     except:
         metrics['davies_bouldin'] = "Could not compute"
 
     try:
-        metrics['calinski_harabasz'] = calinski_harabasz_score(X_numeric, clusters)
+        metrics['calinski_harabasz'] = metrics_engine.calinski_harabasz(clusters)
     except:
         metrics['calinski_harabasz'] = "Could not compute"
 
@@ -231,7 +528,15 @@ def evaluate_clustering(X, clusters, distance_matrix=None):
 
 # Clustering functions
 
-def find_optimal_k_with_metrics(X, max_k=15):
+def find_optimal_k_with_metrics(X, max_k=15, sample_weight=None, engine='kmodes', mode='independent', patience=2,
+                                silhouette_sampling=SILHOUETTE_SAMPLING, render_charts=False):
+    """Fit and score k-modes for k = 2..max_k and suggest k.
+
+    mode='independent' fits every k from scratch in parallel. mode='warm' fits k = 2 as usual,
+    seeds each following k with the previous centroids plus one split (split_centroids), and
+    stops once neither the elbow (largest cost drop) nor the best silhouette has moved for
+    `patience` consecutive values of k.
+    """
     print("\nFinding optimal number of clusters for K-modes...")
 
     # Parallelize the loop with joblib
@@ -239,20 +544,66 @@ def find_optimal_k_with_metrics(X, max_k=15):
 
     costs, silhouettes, davies_bouldin_scores, calinski_harabasz_scores = [], [], [], []
 
-    def evaluate_k(k, X):
-        kmode = KModes(n_clusters=k, init='Huang', random_state=42, n_init=5)
-        clusters = kmode.fit_predict(X)
-        cost = kmode.cost_
-        metrics = evaluate_clustering(X, clusters)
+    def fit_k(k, X, init='Huang', n_init=5):
+        kmode = KMODES_ENGINES[engine](n_clusters=k, init=init, random_state=42, n_init=n_init)
+        clusters = kmode.fit_predict(X, sample_weight=sample_weight)
+        return k, {'model': kmode, 'labels': clusters, 'cost': kmode.cost_}
+
+    # Fits may run in worker processes; every labeling is scored here against one shared engine
+    metrics_engine = CategoricalMetrics(X, sample_weight)
+
+    def evaluate_k(k, X, **fit_options):
+        fit = fit_k(k, X, **fit_options)[1]
+        fit['metrics'] = evaluate_clustering(X, fit['labels'], sample_weight=sample_weight,
+                                             silhouette_sampling=silhouette_sampling, metrics_engine=metrics_engine)
+        return fit
+
+    def silhouette_of(fit):
+        value = fit['metrics']['silhouette']
+        return float(value) if not isinstance(value, str) else np.nan
+
+    sweep_start = time.perf_counter()
+    if mode == 'warm':
+        sweep = {}
+        # Split candidates are the distinct encoded rows, weighted by how often they occur
+        rows, first_row, row_inverse = np.unique(encode_codes(X)[0], axis=0, return_index=True, return_inverse=True)
+        weights = np.ones(len(X)) if sample_weight is None else np.asarray(sample_weight, dtype=float)
+        row_weights = np.bincount(row_inverse.reshape(-1), weights=weights)
+        best_silhouette_k = best_drop_k = 2
+        for k in range(2, max_k + 1):
+            if k == 2:
+                sweep[k] = evaluate_k(k, X)
+            else:
+                previous = sweep[k - 1]
+                # Both engines keep their centroids in the encode_codes space
+                init = split_centroids(rows, previous['model']._enc_cluster_centroids,
+                                       np.asarray(previous['labels'], dtype=np.intp)[first_row], row_weights)
+                if init is None:
+                    print(f"K = {k}: every row sits on a centroid, nothing left to split")
+                    break
+                sweep[k] = evaluate_k(k, X, init=init, n_init=1)
+                if silhouette_of(sweep[k]) > silhouette_of(sweep[best_silhouette_k]):
+                    best_silhouette_k = k
+                if k > 3 and (previous['cost'] - sweep[k]['cost'] >
+                              sweep[best_drop_k]['cost'] - sweep[best_drop_k + 1]['cost']):
+                    best_drop_k = k - 1
+            if k - best_silhouette_k >= patience and k - (best_drop_k + 1) >= patience:
+                break
+    else:
+        results = Parallel(n_jobs=-1)(delayed(fit_k)(k, X) for k in range(2, max_k + 1))
+        sweep = dict(sorted(results, key=lambda x: x[0]))
+        for fit in sweep.values():
+            fit['metrics'] = evaluate_clustering(X, fit['labels'], sample_weight=sample_weight,
+                                                 silhouette_sampling=silhouette_sampling, metrics_engine=metrics_engine)
+    elapsed = time.perf_counter() - sweep_start
+
+    # Fitted model, labels, cost and metrics per k, so the final stage can select instead of refitting
+    for k, fit in sweep.items():
+        metrics = fit['metrics']
+        cost = fit['cost']
         silhouette_val = float(metrics['silhouette']) if not isinstance(metrics['silhouette'], str) else np.nan
         davies_val = float(metrics['davies_bouldin']) if not isinstance(metrics['davies_bouldin'], str) else np.nan
         calinski_val = float(metrics['calinski_harabasz']) if not isinstance(metrics['calinski_harabasz'], str) else np.nan
-        return k, cost, silhouette_val, davies_val, calinski_val
-
-    results = Parallel(n_jobs=-1)(delayed(evaluate_k)(k, X) for k in range(2, max_k + 1))
-    results.sort(key=lambda x: x[0])
-    for res in results:
-        k, cost, silhouette_val, davies_val, calinski_val = res
         costs.append(cost)
         silhouettes.append(silhouette_val)
         davies_bouldin_scores.append(davies_val)
@@ -260,50 +611,38 @@ def find_optimal_k_with_metrics(X, max_k=15):
         print(f"K = {k}, Cost = {cost}, Silhouette = {silhouette_val}, " +
               f"Davies-Bouldin = {davies_val}, Calinski-Harabasz = {calinski_val}")
 
+    fits_skipped = max_k - 1 - len(sweep)
+    sweep_report = {
+        'mode': mode,
+        'k_evaluated': len(sweep),
+        'fits_skipped': fits_skipped,
+        'wall_time_seconds': elapsed,
+        # Skipped values of k, priced at the average cost of the ones that were evaluated
+        'estimated_seconds_saved': fits_skipped * elapsed / len(sweep),
+    }
+    print(f"Sweep ({mode}): {len(sweep)} values of k in {elapsed:.2f}s, {fits_skipped} fits skipped, " +
+          f"about {sweep_report['estimated_seconds_saved']:.2f}s saved")
+
     # Create visualization data for charts instead of saving PNGs
-    k_values = list(range(2, max_k + 1))
+    k_values = list(sweep)
     
     visualization_data = {
+        'sweep_report': sweep_report,
         'k_values': k_values,
+        'silhouette_ci': [fit['metrics'].get('silhouette_ci') for fit in sweep.values()],
         'costs': costs,
         'silhouette_scores': silhouettes,
         'davies_bouldin_scores': davies_bouldin_scores,
         'calinski_harabasz_scores': calinski_harabasz_scores
     }
 
-    # Also create the figure as base64 for direct use in the frontend
-    plt.figure(figsize=(15, 10))
-    # Cost plot (Elbow method)
-    plt.subplot(2, 2, 1)
-    plt.plot(k_values, costs, 'bo-')
-    plt.xlabel('Number of clusters')
-    plt.ylabel('Cost')
-    plt.title('Elbow Method')
-
-    # Silhouette score plot
-    plt.subplot(2, 2, 2)
-    plt.plot(k_values, silhouettes, 'go-')
-    plt.xlabel('Number of clusters')
-    plt.ylabel('Silhouette Score')
-    plt.title('Silhouette Score (higher is better)')
-
-    # Davies-Bouldin index plot
-    plt.subplot(2, 2, 3)
-    plt.plot(k_values, davies_bouldin_scores, 'ro-')
-    plt.xlabel('Number of clusters')
-    plt.ylabel('Davies-Bouldin Index')
-    plt.title('Davies-Bouldin Index (lower is better)')
-
-    # Calinski-Harabasz index plot
-    plt.subplot(2, 2, 4)
-    plt.plot(k_values, calinski_harabasz_scores, 'mo-')
-    plt.xlabel('Number of clusters')
-    plt.ylabel('Calinski-Harabasz Index')
-    plt.title('Calinski-Harabasz Index (higher is better)')
-
-    plt.tight_layout()
-    visualization_data['metrics_chart'] = fig_to_base64(plt)
-    plt.close()
+    add_chart(visualization_data, 'kmodes_metrics_chart', {
+        'k_values': k_values,
+        'costs': costs,
+        'silhouette_scores': silhouettes,
+        'davies_bouldin_scores': davies_bouldin_scores,
+        'calinski_harabasz_scores': calinski_harabasz_scores,
+    }, render_charts=render_charts)
 
     # Find best k for each metric
     best_k_silhouette = np.nanargmax(silhouettes) + 2 if not all(np.isnan(s) for s in silhouettes) else None
@@ -322,27 +661,88 @@ def find_optimal_k_with_metrics(X, max_k=15):
     optimal_k = Counter(all_best_k).most_common(1)[0][0] if all_best_k else elbow_point
 
     print(f"\nSuggested optimal k: {optimal_k}")
-    return optimal_k, visualization_data
+    return optimal_k, visualization_data, sweep
+
+
+def perform_kmodes_clustering(X, num_clusters, sample_weight=None, engine='kmodes', sweep=None,
+                              silhouette_sampling=SILHOUETTE_SAMPLING):
+    """Final stage-1 clustering. When the k sweep already fitted num_clusters (sweep as returned
+    by find_optimal_k_with_metrics), its model, labels and metrics are reused as they are."""
+    if sweep is not None and num_clusters in sweep:
+        print(f"\nUsing the K-modes model with {num_clusters} clusters from the k sweep...")
+        fit = sweep[num_clusters]
+        clusters, kmode, metrics = fit['labels'], fit['model'], fit['metrics']
+        print(f"K-modes cost: {kmode.cost_}")
+        print(f"Evaluation: Silhouette: {metrics['silhouette']}, " +
+              f"Davies-Bouldin: {metrics['davies_bouldin']}, Calinski-Harabasz: {metrics['calinski_harabasz']}")
+        return clusters, kmode, metrics
 
-
-def perform_kmodes_clustering(X, num_clusters):
     print(f"\nPerforming K-modes clustering with {num_clusters} clusters...")
 
     # Initialize and fit K-modes
-    kmode = KModes(n_clusters=num_clusters, init='Huang', random_state=42)
-    clusters = kmode.fit_predict(X)
+    kmode = KMODES_ENGINES[engine](n_clusters=num_clusters, init='Huang', random_state=42)
+    clusters = kmode.fit_predict(X, sample_weight=sample_weight)
 
     print(f"K-modes cost: {kmode.cost_}")
 
     # Evaluate clustering
-    metrics = evaluate_clustering(X, clusters)
+    metrics = evaluate_clustering(X, clusters, sample_weight=sample_weight, silhouette_sampling=silhouette_sampling)
     print(f"Evaluation: Silhouette: {metrics['silhouette']}, " +
           f"Davies-Bouldin: {metrics['davies_bouldin']}, Calinski-Harabasz: {metrics['calinski_harabasz']}")
 
     return clusters, kmode, metrics
 
 
-def find_optimal_hierarchical_clusters(df, stage1_clusters, max_clusters=15):
+def stage2_observations(df_h, cat_features, dedup=False, prototypes=None):
+    """The observations stage 2 clusters: (X_eval, weights, codes).
+
+    With prototypes set, each stage-1 cluster is summarised by at most that many weighted
+    prototype rows, so their number no longer grows with the row count; with dedup, the distinct
+    feature rows weighted by multiplicity; otherwise the full frame (weights and codes are None).
+    codes maps each row of df_h to its observation.
+    """
+    if prototypes:
+        X_eval, weights, codes = group_prototypes(df_h, 'stage1_cluster',
+                                                  [col for col in cat_features if col != 'stage1_cluster'],
+                                                  max_per_group=prototypes)
+        return X_eval[cat_features], weights, codes
+    if dedup:
+        X_eval, codes, weights = collapse_frame(df_h[cat_features])
+        return X_eval, weights, codes
+    return df_h[cat_features], None, None
+
+
+def build_hierarchical_linkage(df_h, cat_features, dedup=False, prototypes=None):
+    """Gower distances and Ward linkage for stage 2.
+
+    Returns (Z, X_eval, weights, codes). With dedup=True or prototypes set, the linkage is built
+    over the weighted observations from stage2_observations (X_eval) and codes maps each row to its
+    observation; otherwise X_eval is the full frame and weights/codes are None. The condensed Gower
+    vector (O(n^2) float32) is released as soon as the linkage is built; the metrics are computed
+    by CategoricalMetrics, which does not need it.
+    """
+    if not dedup and not prototypes:
+        from scipy.cluster.hierarchy import linkage
+
+        gower_dm = gower_condensed(df_h[cat_features])
+        print(f"Gower distances for {len(df_h)} rows: {gower_dm.nbytes / 2 ** 20:.1f} MB condensed")
+        Z = linkage(gower_dm, method='ward')
+        del gower_dm
+        return Z, df_h[cat_features], None, None
+
+    X_eval, weights, codes = stage2_observations(df_h, cat_features, dedup=dedup, prototypes=prototypes)
+    kind = 'prototype' if prototypes else 'distinct feature'
+    print(f"Hierarchical stage on {len(X_eval)} {kind} rows instead of {len(df_h)} rows")
+    gower_dm = gower_condensed(X_eval)
+    Z = weighted_ward_linkage(gower_dm, weights)
+    del gower_dm
+    return Z, X_eval, weights, codes
+
+
+def find_optimal_hierarchical_clusters(df, stage1_clusters, max_clusters=15, dedup=False,
+                                       silhouette_sampling=SILHOUETTE_SAMPLING, prototypes=None, render_charts=False):
+    from scipy.cluster.hierarchy import fcluster
+
     print("\nFinding optimal number of clusters for hierarchical clustering...")
     visualization_data = {}
 
@@ -351,16 +751,23 @@ def find_optimal_hierarchical_clusters(df, stage1_clusters, max_clusters=15):
     df_h['stage1_cluster'] = stage1_clusters
     cat_features = ['domain_type', 'Keyword Category', 'tld', 'stage1_cluster']
 
-    # Compute Gower distance matrix once and get the linkage
-    gower_dm = gower_matrix(df_h[cat_features])
-    Z = linkage(gower_dm, method='ward')
+    # Build the linkage once; perform_hierarchical_clustering cuts the same tree
+    Z, X_eval, weights, _ = build_hierarchical_linkage(df_h, cat_features, dedup=dedup, prototypes=prototypes)
 
-    # Evaluate different numbers of clusters
-    silhouettes, davies_bouldin_scores, calinski_harabasz_scores = [], [], []
+    # Evaluate different numbers of clusters; the metrics engine is shared by every cut
+    metrics_engine = CategoricalMetrics(X_eval, weights, distance='gower')
+    silhouettes, davies_bouldin_scores, calinski_harabasz_scores, silhouette_cis = [], [], [], []
+
+    # The cuts of one dendrogram are nested, so a single fine-to-coarse pass gives the exact
+    # silhouette of every k
+    cuts = {k: fcluster(Z, k, criterion='maxclust') for k in range(max_clusters, 1, -1)}
+    cut_silhouettes = metrics_engine.silhouette_sweep(cuts)
 
     for k in range(2, max_clusters + 1):
-        clusters = fcluster(Z, k, criterion='maxclust')
-        metrics = evaluate_clustering(df_h[cat_features], clusters, distance_matrix=gower_dm)
+        clusters = cuts[k]
+        metrics = evaluate_clustering(X_eval, clusters, sample_weight=weights, silhouette_sampling=silhouette_sampling,
+                                      metrics_engine=metrics_engine, silhouette=cut_silhouettes.get(k))
+        silhouette_cis.append(metrics.get('silhouette_ci'))
 
         for metric_name, metric_list in [
             ('silhouette', silhouettes),
@@ -381,27 +788,17 @@ def find_optimal_hierarchical_clusters(df, stage1_clusters, max_clusters=15):
     visualization_data = {
         'k_values': k_values,
         'silhouette_scores': silhouettes,
+        'silhouette_ci': silhouette_cis,
         'davies_bouldin_scores': davies_bouldin_scores,
         'calinski_harabasz_scores': calinski_harabasz_scores
     }
 
-    plt.figure(figsize=(15, 5))
-    subplot_params = [
-        (1, 'Silhouette Score', silhouettes, 'go-', 'higher is better'),
-        (2, 'Davies-Bouldin Index', davies_bouldin_scores, 'ro-', 'lower is better'),
-        (3, 'Calinski-Harabasz Index', calinski_harabasz_scores, 'mo-', 'higher is better')
-    ]
-
-    for i, (pos, title, data, style, note) in enumerate(subplot_params):
-        plt.subplot(1, 3, pos)
-        plt.plot(range(2, max_clusters + 1), data, style)
-        plt.xlabel('Number of clusters')
-        plt.ylabel(title)
-        plt.title(f'{title} ({note})')
-
-    plt.tight_layout()
-    visualization_data['hierarchical_metrics_chart'] = fig_to_base64(plt)
-    plt.close()
+    add_chart(visualization_data, 'hierarchical_metrics_chart', {
+        'k_values': k_values,
+        'silhouette_scores': silhouettes,
+        'davies_bouldin_scores': davies_bouldin_scores,
+        'calinski_harabasz_scores': calinski_harabasz_scores,
+    }, render_charts=render_charts)
 
     best_k_silhouette = np.nanargmax(silhouettes) + 2 if not all(np.isnan(s) for s in silhouettes) else None
     best_k_davies = np.nanargmin(davies_bouldin_scores) + 2 if not all(np.isnan(s) for s in davies_bouldin_scores) else None
@@ -411,11 +808,14 @@ def find_optimal_hierarchical_clusters(df, stage1_clusters, max_clusters=15):
     optimal_k = Counter(all_best_k).most_common(1)[0][0] if all_best_k else 5
 
     print(f"\nSuggested optimal hierarchical clusters: {optimal_k}")
-    # Return gower_dm along with Z so that it can be reused downstream
-    return optimal_k, visualization_data, Z, gower_dm
+    # Return Z so that it can be reused downstream
+    return optimal_k, visualization_data, Z
+
 
+def perform_hierarchical_clustering(df, stage1_clusters, num_clusters, Z=None, dedup=False,
+                                    silhouette_sampling=SILHOUETTE_SAMPLING, prototypes=None, render_charts=False):
+    from scipy.cluster.hierarchy import fcluster
 
-def perform_hierarchical_clustering(df, stage1_clusters, num_clusters, Z=None, gower_dm=None):
     print(f"\nPerforming hierarchical clustering with Gower distance...")
     visualization_data = {}
 
@@ -423,26 +823,29 @@ def perform_hierarchical_clustering(df, stage1_clusters, num_clusters, Z=None, g
     df_h['stage1_cluster'] = stage1_clusters
     cat_features = ['domain_type', 'Keyword Category', 'tld', 'stage1_cluster']
 
-    # If gower_dm or Z are not provided, compute them (this branch is not reached if caching worked)
-    if Z is None or gower_dm is None:
-        gower_dm = gower_matrix(df_h[cat_features])
-        Z = linkage(gower_dm, method='ward')
-    
+    # If Z is not provided, build it (this branch is not reached if caching worked)
+    if Z is None:
+        Z, X_eval, weights, codes = build_hierarchical_linkage(df_h, cat_features, dedup=dedup,
+                                                               prototypes=prototypes)
+    else:
+        X_eval, weights, codes = stage2_observations(df_h, cat_features, dedup=dedup, prototypes=prototypes)
+
     clusters = fcluster(Z, num_clusters, criterion='maxclust')
 
-    plt.figure(figsize=(12, 8))
-    dendrogram(Z, truncate_mode='lastp', p=30, leaf_font_size=10)
-    plt.title('Hierarchical Clustering Dendrogram')
-    plt.xlabel('Samples')
-    plt.ylabel('Gower Distance')
-    visualization_data['dendrogram'] = fig_to_base64(plt)
-    plt.close()
+    # The top 30 merges are all the truncated dendrogram shows
+    dendrogram_linkage, dendrogram_labels = truncated_linkage(Z, p=30)
+    add_chart(visualization_data, 'dendrogram', {'linkage': dendrogram_linkage.tolist(), 'labels': dendrogram_labels},
+              render_charts=render_charts)
 
-    # Use the cached gower_dm instead of recomputing
-    metrics = evaluate_clustering(df_h[cat_features], clusters, distance_matrix=gower_dm)
+    metrics = evaluate_clustering(X_eval, clusters, sample_weight=weights, silhouette_sampling=silhouette_sampling,
+                                  distance='gower')
     print(f"Evaluation: Silhouette: {metrics['silhouette']}, " +
           f"Davies-Bouldin: {metrics['davies_bouldin']}, Calinski-Harabasz: {metrics['calinski_harabasz']}")
 
+    if codes is not None:
+        # Broadcast labels from the distinct or prototype rows back to every row
+        clusters = clusters[codes]
+
     return clusters, metrics, visualization_data
 
 
@@ -586,7 +989,7 @@ def generate_meaningful_cluster_name(cluster_id, cluster_df, is_new_import=False
     
     return cluster_name, metadata
 
-def plot_cluster_metrics(kmodes_metrics, hierarchical_metrics):
+def plot_cluster_metrics(kmodes_metrics, hierarchical_metrics, render_charts=False):
     visualization_data = {}
     
     metrics_df = pd.DataFrame({
@@ -603,6 +1006,8 @@ def plot_cluster_metrics(kmodes_metrics, hierarchical_metrics):
 
     metrics_data = {
         'categories': metrics_df.index.tolist(),
+        'silhouette_ci': {'K-modes': kmodes_metrics.get('silhouette_ci'),
+                          'Hierarchical': hierarchical_metrics.get('silhouette_ci')},
         'series': [
             {
                 'name': 'K-modes',
@@ -615,77 +1020,109 @@ def plot_cluster_metrics(kmodes_metrics, hierarchical_metrics):
         ]
     }
     
-    plt.figure(figsize=(10, 6))
-    titles = ['Silhouette Score\n(higher is better)', 'Davies-Bouldin Index\n(lower is better)',
-              'Calinski-Harabasz Index\n(higher is better)']
-
-    for i, metric in enumerate(['Silhouette Score', 'Davies-Bouldin Index', 'Calinski-Harabasz Index']):
-        plt.subplot(1, 3, i + 1)
-        metrics_df.loc[metric].plot(kind='bar', color=['#3498db', '#e74c3c'])
-        plt.title(titles[i])
-        plt.ylabel('Score')
-        if i == 0:
-            plt.ylim(0, 1)
-
-    plt.tight_layout()
-    visualization_data['metrics_chart'] = fig_to_base64(plt)
-    plt.close()
+    add_chart(visualization_data, 'metrics_chart', {'categories': metrics_data['categories'],
+                                                    'series': metrics_data['series']},
+              render_charts=render_charts)
 
     return metrics_df, metrics_data, visualization_data
 
 
 # Main execution function
 # Modify the main function to accept an is_new_import parameter
-def main(file_path, is_new_import=False):
+def main(file_path, is_new_import=False, dedup=False, kmodes_engine='kmodes', sweep_mode='independent',
+         sweep_patience=2, silhouette_sampling=SILHOUETTE_SAMPLING, stage2_prototypes=None,
+         embedding=EMBEDDING, render_charts=False, progress_callback=None, include_records=True,
+         build_segmentation_model=False):
+    """Run the whole pipeline on a CSV path or an already parsed DataFrame; progress_callback(stage,
+    fraction_done), if given, is called as each stage starts. include_records=False leaves out
+    result['clustered_data'] (one dict per row) for callers that serialise final_df themselves.
+    build_segmentation_model=True adds result['segmentation_model'], which
+    segmentation_model.assign places new imports with."""
+    def report(stage, progress):
+        if progress_callback is not None:
+            progress_callback(stage, progress)
+
     result = {
         'visualization_data': {},
         'cluster_analysis': {},
         'metrics': {}
     }
     
+    report('preprocessing', 0.0)
     df = load_and_preprocess_data(file_path)
     df, X_kmodes, encoders = prepare_for_clustering(df)
-
-    kmodes_clusters, kmodes_viz_data = find_optimal_k_with_metrics(X_kmodes, max_k=15)
-    result['visualization_data'].update(kmodes_viz_data)
-    
-    stage1_clusters, kmode_model, kmodes_metrics = perform_kmodes_clustering(X_kmodes, kmodes_clusters)
-
-    hierarchical_clusters, hierarchical_viz_data, Z, cached_gower_dm = find_optimal_hierarchical_clusters(df, stage1_clusters)
-    result['visualization_data'].update(hierarchical_viz_data)
+    report('kmodes', 0.1)
+
+    if dedup:
+        # Cluster the distinct feature patterns, weighted by how many rows share each one
+        patterns, pattern_index, pattern_weights = collapse_patterns(X_kmodes)
+        print(f"\nDedup mode: {len(X_kmodes)} rows collapsed to {len(patterns)} distinct feature patterns")
+        kmodes_clusters, kmodes_viz_data, kmodes_sweep = find_optimal_k_with_metrics(
+            patterns, max_k=15, sample_weight=pattern_weights, engine=kmodes_engine, mode=sweep_mode,
+            patience=sweep_patience, silhouette_sampling=silhouette_sampling, render_charts=render_charts)
+        merge_visualization_data(result['visualization_data'], kmodes_viz_data)
+
+        pattern_clusters, kmode_model, kmodes_metrics = perform_kmodes_clustering(
+            patterns, kmodes_clusters, sample_weight=pattern_weights, engine=kmodes_engine, sweep=kmodes_sweep,
+            silhouette_sampling=silhouette_sampling)
+        stage1_clusters = pattern_clusters[pattern_index]
+    else:
+        kmodes_clusters, kmodes_viz_data, kmodes_sweep = find_optimal_k_with_metrics(
+            X_kmodes, max_k=15, engine=kmodes_engine, mode=sweep_mode, patience=sweep_patience,
+            silhouette_sampling=silhouette_sampling, render_charts=render_charts)
+        merge_visualization_data(result['visualization_data'], kmodes_viz_data)
+
+        stage1_clusters, kmode_model, kmodes_metrics = perform_kmodes_clustering(
+            X_kmodes, kmodes_clusters, engine=kmodes_engine, sweep=kmodes_sweep, silhouette_sampling=silhouette_sampling)
+
+    report('hierarchical', 0.5)
+    hierarchical_clusters, hierarchical_viz_data, Z = find_optimal_hierarchical_clusters(
+        df, stage1_clusters, dedup=dedup, silhouette_sampling=silhouette_sampling, prototypes=stage2_prototypes,
+        render_charts=render_charts)
+    merge_visualization_data(result['visualization_data'], hierarchical_viz_data)
     
     stage2_clusters, hierarchical_metrics, hierarchical_viz_data2 = perform_hierarchical_clustering(
-        df, stage1_clusters, hierarchical_clusters, Z=Z, gower_dm=cached_gower_dm
+        df, stage1_clusters, hierarchical_clusters, Z=Z, dedup=dedup,
+        silhouette_sampling=silhouette_sampling, prototypes=stage2_prototypes, render_charts=render_charts
     )
 
     # 🔍 Compute t-SNE 2D coordinates using encoded feature matrix
-    tsne_result = compute_tsne_coordinates(X_kmodes)
+    report('embedding', 0.7)
+    tsne_result = compute_tsne_coordinates(X_kmodes, embedding=embedding)
     df['x'] = tsne_result[:, 0]
     df['y'] = tsne_result[:, 1]
     df['z'] = 1  # Optional dummy for uniform z-axis
 
-    result['visualization_data'].update(hierarchical_viz_data2)
+    merge_visualization_data(result['visualization_data'], hierarchical_viz_data2)
 
     # Pass the is_new_import flag to analyze_clusters
+    report('analysis', 0.8)
     final_df, cluster_analysis, viz_data = analyze_clusters(df, stage1_clusters, stage2_clusters, is_new_import)
     
     result['cluster_analysis'] = cluster_analysis
-    result['visualization_data'].update(viz_data)
+    merge_visualization_data(result['visualization_data'], viz_data)
 
 
     # Include t-SNE data in final output for React scatter chart
-    result['tsne_data'] = df[['x', 'y', 'z', 'cluster_name', 'university_name']].to_dict(orient='records')
+    result['tsne_data'] = frame_records(df[['x', 'y', 'z', 'cluster_name', 'university_name']])
  
-    metrics_df, metrics_data, metrics_viz_data = plot_cluster_metrics(kmodes_metrics, hierarchical_metrics)
+    metrics_df, metrics_data, metrics_viz_data = plot_cluster_metrics(kmodes_metrics, hierarchical_metrics,
+                                                                     render_charts=render_charts)
     result['metrics'] = metrics_data
-    result['visualization_data'].update(metrics_viz_data)
+    merge_visualization_data(result['visualization_data'], metrics_viz_data)
     
     print("\nClustering Evaluation Metrics:")
     print(metrics_df)
 
     print("\nClustering completed successfully!")
 
-    result['clustered_data'] = final_df.to_dict(orient='records')
+    if include_records:
+        result['clustered_data'] = frame_records(final_df)
+    if build_segmentation_model:
+        from segmentation_model import build_model
+
+        result['segmentation_model'] = build_model(final_df, encoders, kmode_model.cluster_centroids_,
+                                                   cluster_analysis['cluster_names'])
     
     return final_df, result
 
@@ -698,9 +1135,60 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Email Clustering with K-modes and Hierarchical Clustering')
     parser.add_argument('--file', type=str, default='email_data.csv', help='Path to input CSV file')
     parser.add_argument('--output', type=str, default='clustering_results.json', help='Path to output JSON file')
+    parser.add_argument('--dedup', action='store_true',
+                        help='Cluster distinct feature patterns weighted by multiplicity instead of raw rows')
+    parser.add_argument('--kmodes-engine', choices=sorted(KMODES_ENGINES), default='kmodes',
+                        help='Stage-1 k-modes implementation: the kmodes package or the NumPy engine')
+    parser.add_argument('--sweep-mode', choices=['independent', 'warm'], default='independent',
+                        help='k sweep strategy: independent fits, or warm-started with early stopping')
+    parser.add_argument('--sweep-patience', type=int, default=2,
+                        help='Warm sweep: stop after this many values of k without a new elbow or best silhouette')
+    parser.add_argument('--silhouette-sample-size', type=int, default=SILHOUETTE_SAMPLING['sample_size'],
+                        help='Observations sampled for the silhouette score; 0 computes the exact score')
+    parser.add_argument('--silhouette-seed', type=int, default=SILHOUETTE_SAMPLING['random_state'])
+    parser.add_argument('--stage2-prototypes', type=int, default=0,
+                        help='Build the stage-2 linkage over at most this many weighted prototype rows '
+                             'per stage-1 cluster; 0 clusters every row')
+    parser.add_argument('--render-charts', action='store_true',
+                        help='Embed the metric charts and dendrogram as base64 PNGs in the results')
+    parser.add_argument('--embedding', choices=EMBEDDING_METHODS, default=EMBEDDING['method'],
+                        help='Scatter-plot layout of the distinct feature patterns: t-SNE or linear-time PCA')
+    parser.add_argument('--embedding-max-points', type=int, default=EMBEDDING['max_points'],
+                        help='Most distinct patterns to embed; the rest are placed on their closest embedded pattern')
+    parser.add_argument('--out-of-core', action='store_true',
+                        help='Stream the CSV in chunks, fit on a reservoir sample and write every clustered row '
+                             'to --assignments-output, in memory bounded by the chunk and sample sizes')
+    parser.add_argument('--sample-size', type=int, default=20000, help='Out-of-core: rows sampled for the fit')
+    parser.add_argument('--chunk-size', type=int, default=100000, help='Out-of-core: rows read per chunk')
+    parser.add_argument('--assignments-output', type=str, default='clustered_emails.csv',
+                        help='Out-of-core: path of the CSV of clustered rows')
+    parser.add_argument('--model-output', type=str, default=None,
+                        help='Save the fitted segmentation to this path for assigning later imports')
 
     args = parser.parse_args()
-    final_df, result = main(file_path=args.file)
+    pipeline_options = dict(dedup=args.dedup, kmodes_engine=args.kmodes_engine,
+                            sweep_mode=args.sweep_mode, sweep_patience=args.sweep_patience,
+                            silhouette_sampling={'sample_size': args.silhouette_sample_size,
+                                                 'random_state': args.silhouette_seed}
+                            if args.silhouette_sample_size else None,
+                            stage2_prototypes=args.stage2_prototypes or None,
+                            embedding=dict(EMBEDDING, method=args.embedding, max_points=args.embedding_max_points),
+                            render_charts=args.render_charts)
+    if args.out_of_core:
+        from out_of_core import run_out_of_core
+
+        # Dedup stays on for the sample fit unless prototypes bound stage 2 instead
+        pipeline_options['dedup'] = args.dedup or not args.stage2_prototypes
+        result = run_out_of_core(args.file, args.assignments_output, sample_size=args.sample_size,
+                                 chunk_size=args.chunk_size, **pipeline_options)
+    else:
+        final_df, result = main(file_path=args.file, build_segmentation_model=bool(args.model_output),
+                                **pipeline_options)
+        if args.model_output:
+            from segmentation_model import save_model
+
+            save_model(result.pop('segmentation_model'), args.model_output)
+            print(f"Segmentation model saved to {args.model_output}")
 
     with open(args.output, 'w') as f:
         json.dump(result, f)
@@ -1,10 +1,10 @@
 from fastapi import FastAPI, UploadFile, File, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 import pandas as pd
 import numpy as np
 import tempfile
-import shutil
 import os
 import sys
 import traceback
@@ -13,9 +13,19 @@ import json
 import httpx
 import asyncio
 import time
-from typing import Dict, Any, List, Optional, Union
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Literal, Optional, Union
 
 import email_scraper_route
+import fast_json
+from charts import ChartStore
+from columnar import ARROW_AVAILABLE, ARROW_MEDIA_TYPE, RESPONSE_COLUMNS, encode_arrow, encode_columns, \
+    select_columns
+from ingest import CSV_ENGINE, CSVValidationError, read_upload
+from result_cache import ResultCache, content_key
+from result_store import ResultStore
+from segmentation_model import ModelStore, assign
+from clustering_jobs import JobManager
 
 # Configure logging
 logging.basicConfig(
@@ -25,6 +35,84 @@ logging.basicConfig(
 )
 logger = logging.getLogger("clustering-service")
 
+# Options passed through to clustering_script.main on every run
+PIPELINE_CONFIG = {
+    # Cluster distinct feature patterns weighted by multiplicity instead of raw rows
+    "dedup": os.environ.get("CLUSTERING_DEDUP", "false").lower() == "true",
+    # Stage-1 k-modes implementation: "kmodes" (the package) or "numpy" (kmodes_engine)
+    "kmodes_engine": os.environ.get("CLUSTERING_KMODES_ENGINE", "kmodes"),
+    # k sweep: "independent" fits every k; "warm" seeds each k from the previous one and stops early
+    "sweep_mode": os.environ.get("CLUSTERING_SWEEP_MODE", "independent"),
+    "sweep_patience": int(os.environ.get("CLUSTERING_SWEEP_PATIENCE", "2")),
+    # Stratified silhouette sample per candidate k; a sample size of 0 computes the exact score
+    "silhouette_sampling": {
+        "sample_size": int(os.environ.get("CLUSTERING_SILHOUETTE_SAMPLE_SIZE", "2000")),
+        "random_state": int(os.environ.get("CLUSTERING_SILHOUETTE_SEED", "42")),
+    } if os.environ.get("CLUSTERING_SILHOUETTE_SAMPLE_SIZE", "2000") != "0" else None,
+    # Stage 2 over at most this many weighted prototype rows per stage-1 cluster; 0 clusters every row
+    "stage2_prototypes": int(os.environ.get("CLUSTERING_STAGE2_PROTOTYPES", "0")) or None,
+    # Scatter-plot layout: "tsne" or linear-time "pca" over at most max_points distinct patterns
+    "embedding": {
+        "method": os.environ.get("CLUSTERING_EMBEDDING_METHOD", "tsne"),
+        "max_points": int(os.environ.get("CLUSTERING_EMBEDDING_MAX_POINTS", "5000")),
+        "jitter": float(os.environ.get("CLUSTERING_EMBEDDING_JITTER", "0.05")),
+    },
+    # Embed base64 PNG charts in every response; otherwise they are rendered on request via /charts
+    "render_charts": os.environ.get("CLUSTERING_RENDER_CHARTS", "false").lower() == "true",
+}
+
+# Chart series of recent runs, rendered to PNG on first request
+CHART_STORE = ChartStore(max_runs=int(os.environ.get("CLUSTERING_CHART_RUNS", "32")))
+
+# Results keyed by upload content, is_new_import and PIPELINE_CONFIG; a size of 0 disables the cache
+RESULT_CACHE_MAX_MB = float(os.environ.get("CLUSTERING_CACHE_MAX_MB", "512"))
+RESULT_CACHE = ResultCache(
+    os.environ.get("CLUSTERING_CACHE_DIR", os.path.join(tempfile.gettempdir(), "clustering-cache")),
+    max_bytes=int(RESULT_CACHE_MAX_MB * 2 ** 20),
+) if RESULT_CACHE_MAX_MB > 0 else None
+
+# Clustered rows of format=summary runs, paged per cluster via /runs; runs expire after the TTL
+RESULT_STORE = ResultStore(
+    os.environ.get("CLUSTERING_RESULT_STORE_DIR", os.path.join(tempfile.gettempdir(), "clustering-runs")),
+    ttl_seconds=float(os.environ.get("CLUSTERING_RESULT_TTL_SECONDS", "3600")),
+)
+RECORD_PAGE_MAX = int(os.environ.get("CLUSTERING_RECORD_PAGE_MAX", "1000"))
+
+# Segmentations of recent full (not new-import) runs by model id, which /assign places new
+# imports in; the oldest are removed beyond CLUSTERING_MODEL_HISTORY
+MODEL_STORE = ModelStore(
+    os.environ.get("CLUSTERING_MODEL_DIR", os.path.join(tempfile.gettempdir(), "clustering-models")),
+    max_models=int(os.environ.get("CLUSTERING_MODEL_HISTORY", "64")),
+)
+# /assign record columns: the response columns without the scatter-plot coordinates (new rows
+# are not embedded), plus the Hamming distance to the row's centroid
+ASSIGN_COLUMNS = [column for column in RESPONSE_COLUMNS if column not in ("x", "y")] + ["distance"]
+
+# Worker processes for /jobs and /cluster: how many pipelines may run at once, and how many
+# finished jobs are kept for status and result queries. Pre-warmed workers are started with the
+# service and run the pipeline once on a tiny CSV before taking requests.
+PREWARM_WORKERS = os.environ.get("CLUSTERING_PREWARM_WORKERS", "true").lower() == "true"
+JOB_MANAGER = JobManager(
+    max_workers=int(os.environ.get("CLUSTERING_JOB_WORKERS", str(max(1, (os.cpu_count() or 1) // 2)))),
+    history=int(os.environ.get("CLUSTERING_JOB_HISTORY", "32")),
+    warmup_config=PIPELINE_CONFIG if PREWARM_WORKERS else None,
+    # joblib processes per worker; by default the cores are divided between the workers
+    cpus_per_worker=int(os.environ.get("CLUSTERING_WORKER_CPUS", "0")) or None,
+)
+# Run /cluster on the worker pool, keeping the event loop free, instead of inside the request
+DISPATCH_TO_WORKERS = os.environ.get("CLUSTERING_DISPATCH_TO_WORKERS", "true").lower() == "true"
+WORKER_WARMUP_SECONDS = {}
+
+# Encode /cluster and job results with fast_json instead of validating every record through
+# the response model (which is still declared, for the API docs)
+FAST_JSON = os.environ.get("CLUSTERING_FAST_JSON", "true").lower() == "true"
+
+# Rows serialised per NDJSON chunk by /cluster?stream=true
+NDJSON_CHUNK_ROWS = int(os.environ.get("CLUSTERING_NDJSON_CHUNK_ROWS", "5000"))
+
+# Upload parser: pandas' C engine, or "pyarrow" (needs pyarrow installed)
+UPLOAD_CSV_ENGINE = os.environ.get("CLUSTERING_CSV_ENGINE", CSV_ENGINE)
+
 # Define response model structures for better API documentation
 from pydantic import BaseModel, Field
 
@@ -48,17 +136,81 @@ class ClusterResult(BaseModel):
     visualization_data: Optional[Dict[str, Any]] = None
     cluster_analysis: Optional[Dict[str, Any]] = None
     metrics: Optional[Dict[str, Any]] = None
+    model_id: Optional[str] = None  # segmentation to pass to /assign; None for new imports
+
+class ClusterSummary(BaseModel):
+    """First line of a streamed /cluster response; the records follow, one per line"""
+    record_count: int
+    visualization_data: Optional[Dict[str, Any]] = None
+    cluster_analysis: Optional[Dict[str, Any]] = None
+    metrics: Optional[Dict[str, Any]] = None
+    model_id: Optional[str] = None
+
+class ColumnarResult(BaseModel):
+    """format=columnar response: the records as one array per column (see columnar.py)"""
+    length: int
+    types: Dict[str, str]
+    columns: Dict[str, Any]
+    visualization_data: Optional[Dict[str, Any]] = None
+    cluster_analysis: Optional[Dict[str, Any]] = None
+    metrics: Optional[Dict[str, Any]] = None
+    model_id: Optional[str] = None
+
+class RunSummary(BaseModel):
+    """format=summary response and GET /runs/{run_id}: per-cluster counts, records fetched per cluster"""
+    run_id: str
+    expires_at: float
+    record_count: int
+    clusters: List[Dict[str, Any]]
+    visualization_data: Optional[Dict[str, Any]] = None
+    cluster_analysis: Optional[Dict[str, Any]] = None
+    metrics: Optional[Dict[str, Any]] = None
+    model_id: Optional[str] = None
+
+class RecordPage(BaseModel):
+    run_id: str
+    cluster_id: int
+    records: List[Dict[str, Any]]
+    total: int  # records of the cluster that pass the filters
+    next_cursor: Optional[int] = None
+
+class AssignResult(BaseModel):
+    """/assign response: new records placed in the saved segmentation, and how far they drift from it"""
+    model_id: str
+    model_created_at: float
+    record_count: int
+    records: List[Dict[str, Any]]
+    cluster_counts: Dict[str, int]
+    drift: Dict[str, Any]  # measures, thresholds, exceeded and refit_recommended (see segmentation_model.py)
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str  # queued, running, completed or failed
+    stage: Optional[str] = None
+    progress: float
+    submitted_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+class JobProgress(BaseModel):
+    job_id: str
+    status: str
+    stage: Optional[str] = None
+    progress: float
 
 # Import the clustering script - wrapped in try/except to handle errors gracefully
 try:
     from clustering_script import main
+    CLUSTERING_SCRIPT_AVAILABLE = True
     logger.info("Successfully imported clustering_script")
 except ImportError as e:
+    CLUSTERING_SCRIPT_AVAILABLE = False
     logger.error(f"Failed to import clustering_script: {str(e)}")
     # Define a fallback main function that will just read the CSV
-    def main(file_path, is_new_import=False):
+    def main(file_path, is_new_import=False, **pipeline_options):
         logger.warning("Using fallback CSV processing - no clustering will be performed")
-        df = pd.read_csv(file_path)
+        df = file_path.copy() if isinstance(file_path, pd.DataFrame) else pd.read_csv(file_path)
         df['domain'] = df['Email'].apply(lambda x: x.split('@')[1] if '@' in x else 'unknown')
         df['domain_type'] = df['domain'].apply(lambda x: 'academic' if '.edu' in x or '.ac.' in x else 
                                               ('personal' if x in ['gmail.com', 'yahoo.com', 'hotmail.com'] else 'other'))
@@ -279,119 +431,333 @@ async def store_metrics_after_clustering(result_data):
         logger.error(traceback.format_exc())
         return False
     
+def register_chart_series(result_data, chart_series):
+    """Hand a run's chart series to CHART_STORE and point visualization_data at it."""
+    if chart_series:
+        result_data['visualization_data']['chart_run_id'] = CHART_STORE.put(chart_series)
+        result_data['visualization_data']['charts'] = sorted(chart_series)
+
+
+def restore_cached_result(cached):
+    """A cached /cluster response, with its chart series registered under a fresh run id and its
+    segmentation model stored again under its model_id (the original run may have left
+    CHART_STORE and MODEL_STORE since)."""
+    response_data = cached["response"]
+    register_chart_series(response_data, cached.get("chart_series"))
+    store_segmentation_model(cached.get("segmentation_model"))
+    return response_data
+
+
+def store_cached_result(cache_key, entry):
+    """Put entry in the result cache. A result that cannot be cached (disk full, read-only cache
+    directory, unencodable value) is still returned to the caller, so failures are only logged."""
+    try:
+        RESULT_CACHE.put(cache_key, entry)
+    except (OSError, TypeError, ValueError) as e:
+        logger.error(f"Could not cache result {cache_key[:12]}: {str(e)}")
+
+
+async def run_on_worker(upload_df, is_new_import, return_frame=False):
+    """
+    JOB_MANAGER.run for /cluster, awaited without blocking the event loop. A worker that dies
+    mid-run (BrokenProcessPool) is an infrastructure failure, not a pipeline error: the run is
+    retried once on a new pool, then answered with a 503 rather than the basic domain grouping.
+    """
+    for attempt in range(2):
+        try:
+            return await asyncio.wrap_future(JOB_MANAGER.run(upload_df, is_new_import=is_new_import,
+                                                             pipeline_config=pipeline_options_for(is_new_import),
+                                                             return_frame=return_frame))
+        except BrokenProcessPool as e:
+            logger.error(f"Clustering worker died (attempt {attempt + 1}): {str(e)}")
+    raise HTTPException(status_code=503, detail="Clustering workers are unavailable; please retry shortly")
+
+
+def ingest_upload(file: UploadFile):
+    """
+    Parse an uploaded CSV in a single pass over the stream (see ingest.py), rejecting an empty
+    upload or a header without an 'Email' column with a 400. Returns (DataFrame, sha256 of the
+    uploaded bytes).
+    """
+    try:
+        df, content_hash = read_upload(file.file, engine=UPLOAD_CSV_ENGINE)
+    except CSVValidationError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (ValueError, UnicodeDecodeError) as csv_error:
+        logger.error(f"CSV validation error: {str(csv_error)}")
+        raise HTTPException(status_code=400, detail=f"Invalid CSV file: {str(csv_error)}")
+    logger.info(f"Parsed upload ({UPLOAD_CSV_ENGINE} engine): columns {df.columns.tolist()}, shape {df.shape}")
+    return df, content_hash
+
+
+def pipeline_options_for(is_new_import, **options):
+    """PIPELINE_CONFIG plus options for one run; full runs also build the segmentation model
+    that /assign uses. (Only PIPELINE_CONFIG goes into the cache key.)"""
+    if CLUSTERING_SCRIPT_AVAILABLE and not is_new_import:
+        options.setdefault("build_segmentation_model", True)
+    return dict(PIPELINE_CONFIG, **options)
+
+
+def store_segmentation_model(model):
+    """Put a run's segmentation model (if it built one) in MODEL_STORE; failures are only logged."""
+    if model is None:
+        return
+    try:
+        MODEL_STORE.put(model)
+        logger.info(f"Stored segmentation model {model['model_id']}")
+    except OSError as e:
+        logger.error(f"Could not store segmentation model {model['model_id']}: {str(e)}")
+
+
+def build_cluster_response(result_data, processing_time, is_using_fallback=False, cache_key=None):
+    """
+    Shape a clustering_script.main result into the /cluster response, filling in cluster names
+    and analysis where the pipeline left them out, and store it in the result cache under
+    cache_key. A segmentation model in the result is stored for /assign (and cached with the
+    response); the response carries its model_id.
+    """
+    model = result_data.pop('segmentation_model', None)
+    store_segmentation_model(model)
+
+    # Update processing time in result data
+    if 'metrics' not in result_data:
+        result_data['metrics'] = {}
+    result_data['metrics']['processing_time_seconds'] = processing_time
+    
+    # Ensure t-SNE data gets included inside visualization_data
+    if 'tsne_data' in result_data and result_data['tsne_data']:
+        if 'visualization_data' not in result_data or not result_data['visualization_data']:
+            result_data['visualization_data'] = {}
+        result_data['visualization_data']['tsne_data'] = result_data['tsne_data']
+
+    # Keep the chart series server-side; the response only says which charts can be rendered
+    chart_series = result_data.get('visualization_data', {}).pop('chart_series', None)
+    register_chart_series(result_data, chart_series)
+    
+    # If we're using the fallback and no cluster_analysis, generate one from the records
+    if is_using_fallback or ('cluster_analysis' not in result_data or not result_data['cluster_analysis'] or 'cluster_names' not in result_data['cluster_analysis']):
+        logger.info("Generating cluster_analysis from records as it was missing or incomplete")
+        result_data['cluster_analysis'] = generate_cluster_analysis_from_records(result_data['clustered_data'])
+        
+    # Ensure records has cluster_name field 
+    for record in result_data['clustered_data']:
+        if 'cluster_name' not in record or not record['cluster_name']:
+            domain_type = record.get('domain_type', 'unknown')
+            keyword = record.get('Keyword Category', 'General')
+            record['cluster_name'] = f"{keyword} - {domain_type}"
+            
+    response_data = {
+        "records": result_data['clustered_data'],
+        "visualization_data": result_data.get('visualization_data', {}),
+        "cluster_analysis": result_data.get('cluster_analysis', {}),
+        "metrics": result_data.get('metrics', {}),
+        "model_id": model['model_id'] if model else None,
+    }
+    
+    # Verify that we have cluster_names in cluster_analysis
+    if 'cluster_analysis' not in response_data or not response_data['cluster_analysis'] or 'cluster_names' not in response_data['cluster_analysis']:
+        logger.warning("Final response still missing cluster_names in cluster_analysis")
+    else:
+        cluster_count = len(response_data['cluster_analysis']['cluster_names'])
+        logger.info(f"Final response contains {cluster_count} clusters in cluster_names")
+    
+    if cache_key and not is_using_fallback:
+        store_cached_result(cache_key, {"response": response_data, "chart_series": chart_series,
+                                        "segmentation_model": model})
+
+    return response_data
+
+
+def json_response(content, headers=None):
+    """
+    content as a JSON response. With FAST_JSON it is encoded directly by fast_json, skipping
+    the response_model validation of every record; otherwise it is returned as is for FastAPI
+    to validate and encode (and headers must be set on the injected Response instead).
+    """
+    if not FAST_JSON:
+        return content
+    return Response(content=fast_json.dumps(content), media_type="application/json", headers=headers)
+
+
+def fill_cluster_names(frame):
+    """The cluster_name fill-in build_cluster_response applies to records, on a frame of them."""
+    frame = frame.copy()
+    if 'cluster_name' not in frame:
+        frame['cluster_name'] = None
+    missing = frame['cluster_name'].map(lambda name: name is None or name == '').astype(bool)
+    if missing.any():
+        keyword = frame['Keyword Category'] if 'Keyword Category' in frame else pd.Series('General', index=frame.index)
+        domain_type = frame['domain_type'] if 'domain_type' in frame else pd.Series('unknown', index=frame.index)
+        frame.loc[missing, 'cluster_name'] = (keyword[missing].astype(str) + ' - ' + domain_type[missing].astype(str))
+    return frame
+
+
+def ndjson_response(summary, records, headers=None):
+    """
+    Stream a /cluster result as NDJSON: a ClusterSummary line, then one line per record.
+    records is either the clustered DataFrame, serialised NDJSON_CHUNK_ROWS rows at a time
+    straight from its columns, or an already built list of record dicts (a cached result)
+    whose cluster names were filled in when it was built. Missing values are written as null,
+    as in the JSON response.
+    """
+    def lines():
+        yield ClusterSummary(record_count=len(records), **summary).model_dump_json() + "\n"
+        for start in range(0, len(records), NDJSON_CHUNK_ROWS):
+            if isinstance(records, pd.DataFrame):
+                chunk = fill_cluster_names(records.iloc[start:start + NDJSON_CHUNK_ROWS])
+            else:
+                chunk = pd.DataFrame.from_records(records[start:start + NDJSON_CHUNK_ROWS])
+            text = chunk.to_json(orient="records", lines=True, double_precision=15)
+            yield text if text.endswith("\n") else text + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers=headers)
+
+
+def summary_fields(response_data):
+    return {key: value for key, value in response_data.items() if key != "records"}
+
+
+def run_summary(meta):
+    return RunSummary(run_id=meta["run_id"], expires_at=meta["expires_at"], record_count=meta["length"],
+                      clusters=[{key: value for key, value in cluster.items() if key != "start"}
+                                for cluster in meta["clusters"]],
+                      **meta["summary"])
+
+
+def columnar_response(summary, records, response_format, headers=None):
+    """
+    A /cluster result in format=columnar (JSON column arrays), format=arrow (an Arrow IPC
+    stream with the summary as JSON in the schema metadata under "summary") or format=summary
+    (the rows go to RESULT_STORE; the response has the run id and per-cluster counts). The
+    coordinates travel in the x and y columns only, so tsne_data is left out of
+    visualization_data.
+    """
+    # Record dicts (cached or fallback results) already had their cluster names filled in
+    frame = fill_cluster_names(records) if isinstance(records, pd.DataFrame) else pd.DataFrame.from_records(records)
+    summary = dict(summary, visualization_data={key: value for key, value in
+                                                (summary.get("visualization_data") or {}).items()
+                                                if key != "tsne_data"})
+    if response_format == "summary":
+        run_id = RESULT_STORE.put(frame, summary)
+        return Response(content=run_summary(RESULT_STORE.meta(run_id)).model_dump_json(),
+                        media_type="application/json", headers=headers)
+    if response_format == "arrow":
+        summary_json = ClusterSummary(record_count=len(frame), **summary).model_dump_json()
+        return Response(content=encode_arrow(frame, metadata={"summary": summary_json}),
+                        media_type=ARROW_MEDIA_TYPE, headers=headers)
+    if FAST_JSON:
+        return json_response(dict(encode_columns(frame), **summary), headers=headers)
+    body = ColumnarResult(**encode_columns(frame), **summary).model_dump_json()
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def frame_response(summary, records, response_format, stream, headers=None):
+    if stream:
+        return ndjson_response(summary, records, headers=headers)
+    return columnar_response(summary, records, response_format, headers=headers)
+
+
 @app.post("/cluster", response_model=ClusterResult)
 async def cluster_emails(
+    response: Response,
     file: UploadFile = File(...),
-    is_new_import: bool = Query(False, description="Whether this is a new import (affects cluster naming)")
+    is_new_import: bool = Query(False, description="Whether this is a new import (affects cluster naming)"),
+    use_cache: bool = Query(True, description="Serve a cached result for an identical upload; "
+                                              "false reruns the pipeline and refreshes the cache"),
+    stream: bool = Query(False, description="Stream the response as NDJSON: a summary line, then one "
+                                            "line per record"),
+    response_format: Literal["records", "columnar", "arrow", "summary"] = Query(
+        "records", alias="format", description="records: one object per record; columnar: one array per "
+                                               "column; arrow: an Arrow IPC stream (needs pyarrow); summary: "
+                                               "cluster summaries only, records paged via /runs")
 ):
     """
     Process a CSV file containing email addresses and perform clustering.
     Returns clustered data along with visualization data for React components.
     When is_new_import=True, cluster names will be labeled as new imports.
+    The X-Cache response header says whether the result came from the result cache.
+    With stream=true the response is application/x-ndjson: the first line holds
+    visualization_data, cluster_analysis, metrics and record_count, and the records follow one
+    per line, serialised from the clustered DataFrame in chunks rather than built as one
+    document. format=columnar and format=arrow send the records column by column instead
+    (see columnar.py). format=summary keeps the records server-side under a run id and returns
+    only the cluster summaries; page through a cluster with /runs/{run_id}/clusters/{cluster_id}/records.
+    Streamed, columnar and summary results are served from the result cache but not stored in it.
     """
-    temp_path = None
     start_time = time.time()
+    if stream and response_format != "records":
+        raise HTTPException(status_code=400, detail="stream=true streams records; use format=records")
+    if response_format == "arrow" and not ARROW_AVAILABLE:
+        raise HTTPException(status_code=501, detail="format=arrow needs pyarrow, which is not installed")
+    from_frame = stream or response_format != "records"
     
     try:
         logger.info(f"Received file: {file.filename}, content type: {file.content_type}, new import: {is_new_import}")
         
-        # Create a temporary file
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp:
-            # Copy the uploaded file to the temporary file
-            shutil.copyfileobj(file.file, tmp)
-            temp_path = tmp.name
-        
-        logger.info(f"Temporary file created at: {temp_path}")
-        
-        # Check if the file exists and has content
-        if not os.path.exists(temp_path):
-            raise HTTPException(status_code=500, detail="Failed to create temporary file")
-        
-        file_size = os.path.getsize(temp_path)
-        logger.info(f"File size: {file_size} bytes")
-        
-        if file_size == 0:
-            raise HTTPException(status_code=400, detail="Uploaded file is empty")
-        
-        # Simple check of CSV file
-        try:
-            # Just try to read a few rows to validate the file
-            test_df = pd.read_csv(temp_path, nrows=5)
-            logger.info(f"CSV preview - columns: {test_df.columns.tolist()}")
-            logger.info(f"CSV preview - shape: {test_df.shape}")
-            
-            # Check for required columns
-            if 'Email' not in test_df.columns:
-                raise HTTPException(status_code=400, detail="CSV file must contain an 'Email' column")
-        except Exception as csv_error:
-            logger.error(f"CSV validation error: {str(csv_error)}")
-            raise HTTPException(status_code=400, detail=f"Invalid CSV file: {str(csv_error)}")
+        upload_df, content_hash = await run_in_threadpool(ingest_upload, file)
         
+        cache_key = content_key(content_hash, is_new_import, PIPELINE_CONFIG) if RESULT_CACHE else None
+        if cache_key and use_cache:
+            cached = await run_in_threadpool(RESULT_CACHE.get, cache_key)
+            if cached is not None:
+                logger.info(f"Result cache hit for {file.filename} ({cache_key[:12]})")
+                response.headers["X-Cache"] = "HIT"
+                response_data = restore_cached_result(cached)
+                if from_frame:
+                    return frame_response(summary_fields(response_data), response_data["records"],
+                                          response_format, stream, headers={"X-Cache": "HIT"})
+                return json_response(response_data, headers={"X-Cache": "HIT"})
+        response.headers["X-Cache"] = "MISS" if cache_key else "DISABLED"
+
         # Run the clustering algorithm
         try:
-            # Check which implementation of 'main' we're using
-            is_using_fallback = False
-            try:
-                # Try importing the module directly to test if it's available
-                import clustering_script
-                logger.info("Using proper clustering_script.main implementation")
-            except ImportError:
-                logger.warning("Could not import clustering_script module, will use fallback implementation")
-                is_using_fallback = True
+            # Check which implementation of 'main' we're using (checked once, at import)
+            is_using_fallback = not CLUSTERING_SCRIPT_AVAILABLE
+            if is_using_fallback:
+                logger.warning("clustering_script is not available, using fallback implementation")
             
             logger.info(f"Starting clustering process with is_new_import={is_new_import}")
             
-            # Pass the is_new_import flag to the main function
-            final_df, result_data = main(temp_path, is_new_import=is_new_import)
+            # Streamed and columnar responses skip the per-row record dicts; the rows are
+            # serialised from final_df
+            pipeline_options = pipeline_options_for(is_new_import, include_records=False) \
+                if from_frame and not is_using_fallback else pipeline_options_for(is_new_import)
+            if DISPATCH_TO_WORKERS and not is_using_fallback:
+                # Run on a (warm) worker process and wait without blocking the event loop
+                run = await run_on_worker(upload_df, is_new_import, return_frame=from_frame)
+                if from_frame:
+                    final_df, result_data = run
+                else:
+                    result_data = run
+            else:
+                # Pass the is_new_import flag to the main function
+                final_df, result_data = main(upload_df, is_new_import=is_new_import, **pipeline_options)
             
             # Calculate processing time
             processing_time = time.time() - start_time
-            logger.info(f"Clustering completed in {processing_time:.2f} seconds, dataframe shape: {final_df.shape}")
-            
-            # Update processing time in result data
-            if 'metrics' not in result_data:
-                result_data['metrics'] = {}
-            result_data['metrics']['processing_time_seconds'] = processing_time
-            
-            # Ensure t-SNE data gets included inside visualization_data
-            if 'tsne_data' in result_data and result_data['tsne_data']:
-                if 'visualization_data' not in result_data or not result_data['visualization_data']:
-                    result_data['visualization_data'] = {}
-                result_data['visualization_data']['tsne_data'] = result_data['tsne_data']
-            
-            # If we're using the fallback and no cluster_analysis, generate one from the records
-            if is_using_fallback or ('cluster_analysis' not in result_data or not result_data['cluster_analysis'] or 'cluster_names' not in result_data['cluster_analysis']):
-                logger.info("Generating cluster_analysis from records as it was missing or incomplete")
-                result_data['cluster_analysis'] = generate_cluster_analysis_from_records(result_data['clustered_data'])
-                
-            # Ensure records has cluster_name field 
-            for record in result_data['clustered_data']:
-                if 'cluster_name' not in record or not record['cluster_name']:
-                    domain_type = record.get('domain_type', 'unknown')
-                    keyword = record.get('Keyword Category', 'General')
-                    record['cluster_name'] = f"{keyword} - {domain_type}"
-                    
-            response_data = {
-                "records": result_data['clustered_data'],
-                "visualization_data": result_data.get('visualization_data', {}),
-                "cluster_analysis": result_data.get('cluster_analysis', {}),
-                "metrics": result_data.get('metrics', {})
-            }
-            
-            # Verify that we have cluster_names in cluster_analysis
-            if 'cluster_analysis' not in response_data or not response_data['cluster_analysis'] or 'cluster_names' not in response_data['cluster_analysis']:
-                logger.warning("Final response still missing cluster_names in cluster_analysis")
-            else:
-                cluster_count = len(response_data['cluster_analysis']['cluster_names'])
-                logger.info(f"Final response contains {cluster_count} clusters in cluster_names")
+            logger.info(f"Clustering completed in {processing_time:.2f} seconds, "
+                        f"{len(final_df) if from_frame else len(result_data['clustered_data'])} records")
+
+            if from_frame:
+                result_data.setdefault('clustered_data', [])
+                response_data = build_cluster_response(result_data, processing_time, is_using_fallback)
+                asyncio.create_task(store_metrics_after_clustering(result_data))
+                logger.info(f"Returning {len(final_df)} records as {'NDJSON' if stream else response_format}")
+                return frame_response(summary_fields(response_data), final_df, response_format, stream,
+                                      headers={"X-Cache": response.headers["X-Cache"]})
             
+            response_data = build_cluster_response(result_data, processing_time, is_using_fallback, cache_key)
+
             # Store metrics asynchronously (don't wait for it to complete)
             asyncio.create_task(store_metrics_after_clustering(result_data))
             
             logger.info(f"Returning {len(response_data['records'])} records with visualization data")
             
-            return response_data
-            
+            return json_response(response_data, headers={"X-Cache": response.headers["X-Cache"]})
+
+        except HTTPException:
+            # Worker pool failures (503): the basic grouping is a fallback for pipeline errors only
+            raise
         except Exception as cluster_error:
             logger.error(f"Clustering error: {str(cluster_error)}")
             logger.error(traceback.format_exc())
@@ -399,7 +765,7 @@ async def cluster_emails(
             # Try a simpler approach - just basic domain grouping without complex clustering
             try:
                 logger.info("Falling back to simple domain-based grouping")
-                df = pd.read_csv(temp_path)
+                df = upload_df.copy()
                 
                 # Extract domain and do basic categorization
                 df['domain'] = df['Email'].apply(lambda x: x.split('@')[1] if '@' in x else 'unknown')
@@ -420,6 +786,10 @@ async def cluster_emails(
                 # Generate a proper cluster_analysis object
                 cluster_analysis = generate_cluster_analysis_from_records(records)
                 
+                if from_frame:
+                    return frame_response({"visualization_data": {}, "cluster_analysis": cluster_analysis,
+                                           "metrics": {}}, records, response_format, stream)
+
                 # Return improved data with visualization data
                 logger.info(f"Returning {len(records)} records with generated cluster analysis")
                 return {
@@ -451,15 +821,6 @@ async def cluster_emails(
                 "trace": traceback.format_exc()
             }
         )
-        
-    finally:
-        # Clean up the temporary file
-        if temp_path and os.path.exists(temp_path):
-            try:
-                os.unlink(temp_path)
-                logger.info(f"Temporary file removed: {temp_path}")
-            except Exception as cleanup_error:
-                logger.warning(f"Failed to remove temporary file: {str(cleanup_error)}")
 
 @app.post("/store-pipeline-metrics", response_model=dict)
 async def store_pipeline_metrics(metrics: PipelineMetrics):
@@ -492,12 +853,185 @@ async def store_pipeline_metrics(metrics: PipelineMetrics):
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Error storing pipeline metrics: {str(e)}")
     
+@app.post("/jobs", response_model=JobStatus, status_code=202)
+async def submit_cluster_job(
+    file: UploadFile = File(...),
+    is_new_import: bool = Query(False, description="Whether this is a new import (affects cluster naming)"),
+    use_cache: bool = Query(True, description="Serve a cached result for an identical upload; "
+                                              "false reruns the pipeline and refreshes the cache")
+):
+    """
+    Queue a clustering run in a worker process and return its job id straight away, so the
+    event loop stays free while the pipeline runs. Poll /jobs/{job_id} or
+    /jobs/{job_id}/progress, then fetch /jobs/{job_id}/result, which has the same shape as
+    the /cluster response. A cached result completes the job immediately.
+    """
+    logger.info(f"Received job file: {file.filename}, new import: {is_new_import}")
+    upload_df, content_hash = await run_in_threadpool(ingest_upload, file)
+
+    cache_key = content_key(content_hash, is_new_import, PIPELINE_CONFIG) if RESULT_CACHE else None
+    if cache_key and use_cache:
+        cached = await run_in_threadpool(RESULT_CACHE.get, cache_key)
+        if cached is not None:
+            logger.info(f"Result cache hit for {file.filename} ({cache_key[:12]})")
+            return JOB_MANAGER.status(JOB_MANAGER.add_completed(restore_cached_result(cached)))
+
+    loop = asyncio.get_running_loop()
+    start_time = time.time()
+
+    def finish(result_data):
+        response_data = build_cluster_response(result_data, time.time() - start_time, cache_key=cache_key)
+        asyncio.run_coroutine_threadsafe(store_metrics_after_clustering(result_data), loop)
+        return response_data
+
+    job_id = JOB_MANAGER.submit(upload_df, is_new_import=is_new_import,
+                                pipeline_config=pipeline_options_for(is_new_import), finish=finish)
+    logger.info(f"Queued clustering job {job_id}")
+    return JOB_MANAGER.status(job_id)
+
+def get_job_status(job_id: str):
+    try:
+        return JOB_MANAGER.status(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def cluster_job_status(job_id: str):
+    """Status, current pipeline stage and timings of a clustering job"""
+    return get_job_status(job_id)
+
+@app.get("/jobs/{job_id}/progress", response_model=JobProgress)
+async def cluster_job_progress(job_id: str):
+    """Pipeline stage reached by a clustering job and the fraction of the run it marks"""
+    return get_job_status(job_id)
+
+@app.get("/jobs/{job_id}/result", response_model=ClusterResult)
+async def cluster_job_result(job_id: str):
+    """
+    Result of a completed clustering job. Returns 409 while the job is queued or running and
+    500 with the error if it failed.
+    """
+    try:
+        status, result = JOB_MANAGER.result(job_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown job '{job_id}'")
+    if status == 'failed':
+        raise HTTPException(status_code=500, detail=f"Clustering job failed: {get_job_status(job_id)['error']}")
+    if status != 'completed':
+        raise HTTPException(status_code=409, detail=f"Clustering job is still {status}")
+    return json_response(result)
+
+@app.on_event("startup")
+def start_job_workers():
+    if PREWARM_WORKERS:
+        start = time.time()
+        WORKER_WARMUP_SECONDS.update(JOB_MANAGER.start())
+        logger.info(f"Started {len(WORKER_WARMUP_SECONDS)} warm clustering workers in {time.time() - start:.2f} "
+                    f"seconds (warm-up per worker: {WORKER_WARMUP_SECONDS})")
+
+@app.on_event("shutdown")
+def shutdown_job_workers():
+    JOB_MANAGER.shutdown()
+    WORKER_WARMUP_SECONDS.clear()
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters and disk usage of the /cluster result cache"""
+    if RESULT_CACHE is None:
+        return {"enabled": False}
+    return {"enabled": True, **RESULT_CACHE.stats()}
+
+@app.get("/runs/{run_id}", response_model=RunSummary)
+async def get_run(run_id: str):
+    """Cluster summaries of a format=summary run; 404 once the run has expired"""
+    try:
+        return run_summary(RESULT_STORE.meta(run_id))
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired run '{run_id}'")
+
+@app.get("/runs/{run_id}/clusters/{cluster_id}/records", response_model=RecordPage)
+def get_cluster_records(
+    run_id: str,
+    cluster_id: int,
+    cursor: int = Query(0, ge=0, description="next_cursor of the previous page; 0 for the first page"),
+    limit: int = Query(100, ge=1, description="Records per page"),
+    domain_type: Optional[str] = Query(None, description="Only records with this domain type"),
+    university_name: Optional[str] = Query(None, description="Only records from this university"),
+):
+    """
+    One page of a cluster's records from a format=summary run, optionally filtered by
+    domain_type and university_name. next_cursor is null on the last page.
+    """
+    filters = {name: value for name, value in [("domain_type", domain_type), ("university_name", university_name)]
+               if value is not None}
+    try:
+        records, next_cursor, total = RESULT_STORE.records(run_id, cluster_id, cursor=cursor,
+                                                           limit=min(limit, RECORD_PAGE_MAX), filters=filters)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No cluster {cluster_id} in run '{run_id}'")
+    return {"run_id": run_id, "cluster_id": cluster_id, "records": records, "total": total,
+            "next_cursor": next_cursor}
+
+@app.post("/assign", response_model=AssignResult)
+def assign_to_segmentation(
+    file: UploadFile = File(...),
+    model_id: str = Query(..., description="model_id of the /cluster (or /jobs) result to assign to"),
+    is_new_import: bool = Query(True, description="Label cluster names as new imports"),
+):
+    """
+    Place the emails of an uploaded CSV in the segmentation of a full /cluster (or /jobs) run,
+    named by the model_id of its result, without re-clustering: each row goes to its nearest
+    k-modes centroid and the stage-2 cluster of its pattern, in time linear in the number of
+    rows. drift reports how far the upload is from the data the segmentation was fitted on;
+    refit_recommended says a full /cluster run is due. Returns 404 for an unknown or evicted
+    model id and 409 for a model saved in an older format.
+    """
+    try:
+        model = MODEL_STORE.get(model_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown segmentation model '{model_id}'; run /cluster")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=f"{str(e)}; run /cluster to refit")
+
+    # Imported here: out_of_core loads clustering_script, which the service can run without
+    from out_of_core import row_features
+
+    upload_df, _ = ingest_upload(file)
+    if 'Keyword Category' not in upload_df.columns:
+        upload_df['Keyword Category'] = 'Unknown'
+    assigned, drift = assign(row_features(upload_df), model, is_new_import=is_new_import)
+    logger.info(f"Assigned {len(assigned)} records to segmentation {model['model_id']}, "
+                f"refit recommended: {drift['refit_recommended']}")
+    counts = assigned['stage2_cluster'].value_counts().sort_index()
+    return json_response({
+        "model_id": model['model_id'],
+        "model_created_at": model['created_at'],
+        "record_count": len(assigned),
+        "records": fast_json.frame_records(select_columns(assigned, ASSIGN_COLUMNS)),
+        "cluster_counts": {str(cluster_id): int(count) for cluster_id, count in counts.items()},
+        "drift": drift,
+    })
+
+@app.get("/charts/{run_id}/{chart_name}")
+def get_chart(run_id: str, chart_name: str):
+    """
+    Render one chart of a recent /cluster run as a PNG. The run id and the available chart
+    names are returned in visualization_data.chart_run_id and visualization_data.charts.
+    Each chart is rendered once per run and served from the cache afterwards.
+    """
+    try:
+        png = CHART_STORE.render(run_id, chart_name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"No chart '{chart_name}' for run '{run_id}'")
+    return Response(content=png, media_type="image/png")
+
 app.include_router(email_scraper_route.router, prefix="/api/email-extraction")
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "version": "1.1.0"}
+    return {"status": "healthy", "version": "1.1.0",
+            "workers": {"max_workers": JOB_MANAGER.max_workers, "warmup_seconds": WORKER_WARMUP_SECONDS}}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,93 @@
+"""Compact columnar encoding of clustered records.
+
+The records response repeats every column name in every row, includes the pipeline's working
+columns (*_encoded, university_name_filled, z) and sends the scatter-plot coordinates a second
+time in visualization_data.tsne_data. encode_columns keeps an explicit set of columns as one
+array each: low-cardinality strings as a dictionary plus integer codes (-1 for a missing value),
+coordinates as float32, so each record and each coordinate is sent once. encode_arrow writes the
+same columns as an Arrow IPC stream when pyarrow is installed.
+"""
+import importlib.util
+
+import numpy as np
+import pandas as pd
+
+ARROW_AVAILABLE = importlib.util.find_spec('pyarrow') is not None
+ARROW_MEDIA_TYPE = 'application/vnd.apache.arrow.stream'
+
+# Columns sent to the client, in order; the scatter plot reads x, y, cluster_name and university_name
+RESPONSE_COLUMNS = ['Email', 'Keyword Category', 'domain', 'domain_type', 'tld', 'university_name',
+                    'is_sri_lankan', 'is_sl_academic', 'academic_level', 'stage1_cluster', 'stage2_cluster',
+                    'cluster_name', 'x', 'y']
+DICTIONARY_COLUMNS = ['Keyword Category', 'domain', 'domain_type', 'tld', 'university_name', 'cluster_name']
+FLOAT32_COLUMNS = ['x', 'y']
+
+
+def _float32_list(values):
+    # Through the shortest float32 decimal form, so JSON carries '0.1' rather than 0.10000000149011612
+    values = np.asarray(values, dtype=np.float32)
+    return [v if v == v else None for v in values.astype(str).astype(float).tolist()]
+
+
+def _column(values, name):
+    """(type, JSON-ready column) for one column of the response."""
+    if name in DICTIONARY_COLUMNS:
+        codes, dictionary = pd.factorize(values, use_na_sentinel=True)
+        return 'dictionary', {'dictionary': [str(value) for value in dictionary], 'codes': codes.tolist()}
+    if name in FLOAT32_COLUMNS:
+        return 'float32', _float32_list(values)
+    if pd.api.types.is_integer_dtype(values):
+        return 'int32', values.astype(np.int32).tolist()
+    return 'string', [None if pd.isna(value) else str(value) for value in values]
+
+
+def select_columns(frame, columns=RESPONSE_COLUMNS):
+    return frame[[column for column in columns if column in frame]]
+
+
+def encode_columns(frame, columns=RESPONSE_COLUMNS):
+    """{'length', 'types': {column: type}, 'columns': {column: values}} for the chosen columns of
+    frame that it has. Types are 'string', 'int32', 'float32' and 'dictionary', whose value is
+    {'dictionary': [...], 'codes': [...]}."""
+    frame = select_columns(frame, columns)
+    types, encoded = {}, {}
+    for name in frame.columns:
+        types[name], encoded[name] = _column(frame[name], name)
+    return {'length': len(frame), 'types': types, 'columns': encoded}
+
+
+def decode_columns(payload):
+    """The DataFrame an encode_columns payload describes (used by tests and clients in Python)."""
+    data = {}
+    for name, kind in payload['types'].items():
+        values = payload['columns'][name]
+        if kind == 'dictionary':
+            # The trailing None is what code -1 picks
+            dictionary = np.array(values['dictionary'] + [None], dtype=object)
+            values = dictionary[np.asarray(values['codes'], dtype=np.intp)]
+        data[name] = values
+    return pd.DataFrame(data)
+
+
+def encode_arrow(frame, columns=RESPONSE_COLUMNS, metadata=None):
+    """Arrow IPC stream bytes of the chosen columns, string columns dictionary-encoded and
+    coordinates as float32. metadata (str -> str) is attached to the schema."""
+    import pyarrow as pa
+
+    frame = select_columns(frame, columns)
+    arrays = {}
+    for name in frame.columns:
+        values = frame[name]
+        if name in DICTIONARY_COLUMNS:
+            arrays[name] = pa.array(values.astype(object).where(values.notna(), None)).dictionary_encode()
+        elif name in FLOAT32_COLUMNS:
+            arrays[name] = pa.array(values.to_numpy(dtype=np.float32))
+        elif pd.api.types.is_integer_dtype(values):
+            arrays[name] = pa.array(values.to_numpy(dtype=np.int32))
+        else:
+            arrays[name] = pa.array(values.astype(object).where(values.notna(), None), type=pa.string())
+    table = pa.table(arrays).replace_schema_metadata(metadata)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,70 @@
+"""2D coordinates for the scatter plot without running t-SNE over every row.
+
+The stage-1 features are categorical, so a large import repeats a small number of distinct
+patterns. Only those patterns are embedded, capped at max_points (the most frequent ones; any
+others are placed on the embedded pattern they match most closely). Every row then looks up its
+pattern's coordinates, plus a small jitter drawn from a fixed seed so rows sharing a pattern do
+not stack on one point and the layout is identical from run to run.
+
+method='tsne' runs Barnes-Hut t-SNE on the embedded patterns; method='pca' is a linear-time
+layout (PCA of the one-hot encoded patterns) for imports where even that is too slow.
+"""
+import numpy as np
+
+from kmodes_engine import encode_codes, hamming_assign
+
+EMBEDDING_METHODS = ('tsne', 'pca')
+
+
+def _one_hot(codes):
+    sizes = codes.max(axis=0) + 1
+    offsets = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    one_hot = np.zeros((len(codes), int(sizes.sum())))
+    np.put_along_axis(one_hot, codes + offsets, 1.0, axis=1)
+    return one_hot
+
+
+def _layout(codes, method, n_components, random_state, perplexity, learning_rate):
+    """Coordinates for a handful of distinct pattern codes."""
+    from sklearn.decomposition import PCA
+    from sklearn.manifold import TSNE
+
+    n_points = len(codes)
+    if method == 'tsne' and n_points > n_components + 1:
+        tsne = TSNE(n_components=n_components, perplexity=min(perplexity, (n_points - 1) / 3),
+                    learning_rate=learning_rate, init='pca', random_state=random_state)
+        return tsne.fit_transform(_one_hot(codes))
+    coords = np.zeros((n_points, n_components))
+    one_hot = _one_hot(codes)
+    n_fitted = min(n_components, n_points, one_hot.shape[1])
+    if n_points > 1:
+        coords[:, :n_fitted] = PCA(n_components=n_fitted, random_state=random_state).fit_transform(one_hot)
+    return coords
+
+
+def embed_patterns(X, method='tsne', max_points=5000, jitter=0.05, n_components=2, random_state=42,
+                   perplexity=30, learning_rate=200):
+    """Row coordinates of shape (n_rows, n_components) from an embedding of the distinct rows of X.
+
+    max_points caps how many distinct patterns are embedded; jitter is the spread of the
+    per-row offset, as a fraction of the standard deviation of the pattern layout.
+    """
+    if method not in EMBEDDING_METHODS:
+        raise ValueError(f"Unknown embedding method {method!r}; expected one of {EMBEDDING_METHODS}")
+    codes, _ = encode_codes(X)
+    patterns, row_pattern, counts = np.unique(codes, axis=0, return_inverse=True, return_counts=True)
+    row_pattern = row_pattern.reshape(-1)
+
+    # Embed the most frequent patterns; the rest borrow the closest embedded one
+    embedded = np.sort(np.argsort(-counts, kind='stable')[:max_points])
+    layout = _layout(patterns[embedded], method, n_components, random_state, perplexity, learning_rate)
+    pattern_slot = np.empty(len(patterns), dtype=np.intp)
+    pattern_slot[embedded] = np.arange(len(embedded))
+    if len(embedded) < len(patterns):
+        rest = np.setdiff1d(np.arange(len(patterns)), embedded)
+        pattern_slot[rest], _, _ = hamming_assign(patterns[rest], patterns[embedded])
+
+    coords = layout[pattern_slot[row_pattern]]
+    spread = layout.std(axis=0) if len(layout) > 1 else np.ones(n_components)
+    rng = np.random.default_rng(random_state)
+    return coords + rng.normal(scale=jitter, size=coords.shape) * np.where(spread > 0, spread, 1.0)
@@ -0,0 +1,57 @@
+"""JSON encoding for large responses without per-record pydantic validation.
+
+A /cluster result is mostly one record dict per row. Returning it through response_model has
+FastAPI validate every record against List[Dict[str, Any]] before encoding it, and NumPy scalars
+in the result make the encode fail outright. dumps encodes with orjson when it is installed
+(NumPy arrays and scalars natively, NaN as null) and falls back to the standard library;
+frame_records builds the records from a DataFrame one column at a time.
+"""
+import importlib.util
+import json
+import math
+
+import numpy as np
+
+ORJSON_AVAILABLE = importlib.util.find_spec('orjson') is not None
+
+
+def _plain(value):
+    """value with NumPy types and non-finite floats replaced, for the standard library encoder."""
+    if isinstance(value, dict):
+        return {key if isinstance(key, str) else str(_plain(key)): _plain(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if isinstance(value, np.ndarray):
+        return _plain(value.tolist())
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def dumps(value):
+    """JSON bytes of value; NaN and infinities are written as null, as pydantic does."""
+    if ORJSON_AVAILABLE:
+        import orjson
+
+        return orjson.dumps(value, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS, default=_default)
+    return json.dumps(_plain(value), separators=(',', ':')).encode()
+
+
+def _default(value):
+    # Types orjson leaves to us: NumPy scalars it does not know (e.g. float16 or object arrays)
+    if isinstance(value, np.ndarray):
+        return _plain(value.tolist())
+    if isinstance(value, np.generic):
+        return _plain(value.item())
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def frame_records(frame):
+    """frame.to_dict(orient='records'), built a column at a time: each column is converted to
+    Python values in one tolist() pass, then the rows are zipped together. Missing values stay
+    as to_dict leaves them (NaN or None); dumps writes both as null."""
+    columns = [frame[name].tolist() for name in frame.columns]
+    names = [str(name) for name in frame.columns]
+    return [dict(zip(names, row)) for row in zip(*columns)]
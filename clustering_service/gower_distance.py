@@ -0,0 +1,107 @@
+"""Condensed Gower distances computed in bounded-memory chunks.
+
+Produces the same values as `gower.gower_matrix` (equal feature weights; categorical columns
+are the non-numeric ones unless cat_features says otherwise), but as a float32 condensed vector
+in scipy's pdist layout instead of a dense n x n matrix. Categorical columns are compared as
+integer codes, and the pairwise block for a range of rows is sized so it never exceeds
+max_chunk_mb, so the only O(n^2) allocation is the output itself: half the size of the dense
+float32 matrix and directly usable by scipy's linkage.
+"""
+import numpy as np
+import pandas as pd
+
+
+def encode_gower_features(frame, cat_features=None):
+    """Split a DataFrame into (categorical codes, numeric values, numeric scales).
+
+    Categorical values become int32 codes; missing values share one code of their own, as None
+    does in gower_matrix (which would instead never match a float NaN to itself). Each numeric
+    column comes with the factor that turns an absolute difference into its Gower term.
+    """
+    frame = pd.DataFrame(frame)
+    if cat_features is None:
+        cat_mask = [not pd.api.types.is_numeric_dtype(dtype) for dtype in frame.dtypes]
+    elif all(isinstance(col, str) for col in cat_features):
+        cat_mask = [col in cat_features for col in frame.columns]
+    else:
+        cat_mask = list(np.asarray(cat_features, dtype=bool))
+
+    cat_codes, numeric, scales = [], [], []
+    for col, is_cat in zip(frame.columns, cat_mask):
+        if is_cat:
+            cat_codes.append(pd.factorize(frame[col], use_na_sentinel=False)[0].astype(np.int32))
+            continue
+        values = frame[col].to_numpy(dtype=np.float32)
+        empty = np.isnan(values).all()
+        col_max = 0.0 if empty else np.nanmax(values)
+        col_min = 0.0 if empty else np.nanmin(values)
+        # gower_matrix divides by the column max and then by |1 - min / max|, i.e. by |max - min|,
+        # and drops the column entirely when max is 0
+        spread = abs(float(col_max) - float(col_min))
+        numeric.append(values)
+        scales.append(1.0 / spread if col_max != 0 and spread != 0 else 0.0)
+
+    n = len(frame)
+    cat_codes = np.column_stack(cat_codes) if cat_codes else np.empty((n, 0), dtype=np.int32)
+    numeric = np.column_stack(numeric) if numeric else np.empty((n, 0), dtype=np.float32)
+    return cat_codes, numeric, np.asarray(scales, dtype=np.float32)
+
+
+def condensed_size(n):
+    return n * (n - 1) // 2
+
+
+def _row_blocks(n, max_chunk_mb):
+    """Row ranges whose pairwise block (rows x remaining columns, float32) fits max_chunk_mb."""
+    max_cells = max(int(max_chunk_mb * 2 ** 20) // 4, n)
+    start = 0
+    while start < n - 1:
+        stop = min(n - 1, start + max(1, max_cells // (n - start)))
+        yield start, stop
+        start = stop
+
+
+def gower_block(cat_codes, numeric, scales, rows, cols):
+    """Gower distances between two row selections (slices or index arrays) of encoded features."""
+    n_features = cat_codes.shape[1] + numeric.shape[1]
+    block = np.zeros((len(cat_codes[rows]), len(cat_codes[cols])), dtype=np.float32)
+    for j in range(cat_codes.shape[1]):
+        block += cat_codes[rows, j][:, None] != cat_codes[cols, j][None, :]
+    for j in range(numeric.shape[1]):
+        if scales[j]:
+            block += np.abs(numeric[rows, j][:, None] - numeric[cols, j][None, :]) * scales[j]
+    block /= n_features
+    return block
+
+
+def gower_condensed(frame, cat_features=None, max_chunk_mb=64):
+    """Condensed (pdist-layout) float32 Gower distance vector for the rows of frame.
+
+    Peak memory beyond the output is bounded by roughly twice max_chunk_mb.
+    """
+    cat_codes, numeric, scales = encode_gower_features(frame, cat_features)
+    n = len(cat_codes)
+    out = np.empty(condensed_size(n), dtype=np.float32)
+
+    offset = 0
+    for start, stop in _row_blocks(n, max_chunk_mb):
+        block = gower_block(cat_codes, numeric, scales, slice(start, stop), slice(start, None))
+        # Keep the strict upper triangle; row-major order is exactly the condensed layout
+        upper = np.arange(start, n)[None, :] > np.arange(start, stop)[:, None]
+        values = block[upper]
+        out[offset:offset + len(values)] = values
+        offset += len(values)
+    return out
+
+
+def condensed_rows(condensed, n, rows):
+    """The given rows (an index array) of the square matrix behind a condensed distance vector."""
+    i = np.asarray(rows)[:, None]
+    j = np.arange(n)[None, :]
+    low, high = np.minimum(i, j), np.maximum(i, j)
+    diagonal = i == j
+    # The diagonal has no condensed entry; read any valid slot and zero it afterwards
+    index = np.where(diagonal, 0, n * low - low * (low + 1) // 2 + (high - low - 1))
+    rows = np.asarray(condensed)[index].astype(float)
+    rows[np.broadcast_to(diagonal, rows.shape)] = 0.0
+    return rows
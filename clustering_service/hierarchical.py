@@ -0,0 +1,111 @@
+"""Agglomerative clustering over weighted observations."""
+import numpy as np
+import pandas as pd
+
+
+def weighted_ward_linkage(distances, weights):
+    """Ward linkage where observation i stands for weights[i] identical rows.
+
+    `distances` is a condensed (pdist-style) vector of distances between the observations.
+    Merge heights match scipy's linkage(method='ward') on the expanded rows, minus the
+    zero-height merges of the duplicates. The fourth column counts observations, not rows,
+    so the result passes scipy's linkage validation and works with fcluster and dendrogram.
+    Uses the nearest-neighbour chain algorithm, so time is O(n^2) for n observations.
+    """
+    weights = np.asarray(weights, dtype=float)
+    n = len(weights)
+    if n < 2:
+        raise ValueError("weighted_ward_linkage needs at least 2 observations")
+
+    # Squared Ward distance between two weighted singletons, on scipy's scale
+    # (two single rows merge at their plain distance)
+    from scipy.spatial.distance import squareform
+
+    dist = squareform(np.asarray(distances, dtype=float)) ** 2
+    dist *= 2.0 * np.outer(weights, weights) / (weights[:, None] + weights[None, :])
+    np.fill_diagonal(dist, np.inf)
+
+    size = weights.copy()
+    active = np.ones(n, dtype=bool)
+    merges = []
+    chain = []
+    for _ in range(n - 1):
+        if not chain:
+            chain.append(int(np.argmax(active)))
+        while True:
+            a = chain[-1]
+            b = int(np.argmin(dist[a]))
+            # Prefer the previous chain element on ties so the chain always terminates
+            if len(chain) > 1 and dist[a, chain[-2]] <= dist[a, b]:
+                b = chain[-2]
+            if len(chain) > 1 and b == chain[-2]:
+                break
+            chain.append(b)
+        chain.pop()
+        chain.pop()
+
+        # Lance-Williams update for Ward, keeping the merged cluster in slot a
+        d_ab = dist[a, b]
+        total = size[a] + size[b] + size
+        with np.errstate(invalid='ignore'):
+            merged = ((size[a] + size) * dist[a] + (size[b] + size) * dist[b] - size * d_ab) / total
+        merged[a] = np.inf
+        dist[a, :] = dist[:, a] = merged
+        dist[b, :] = dist[:, b] = np.inf
+        active[b] = False
+        size[a] += size[b]
+        merges.append((a, b, np.sqrt(d_ab)))
+
+    # Sort merges by height and label clusters the way scipy does
+    order = np.argsort([height for _, _, height in merges], kind='mergesort')
+    parent = np.arange(2 * n - 1)
+    cluster_size = np.concatenate([np.ones(n), np.zeros(n - 1)])
+
+    def find(x):
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    Z = np.empty((n - 1, 4))
+    for i, step in enumerate(order):
+        a, b, height = merges[step]
+        root_a, root_b = find(a), find(b)
+        new_id = n + i
+        parent[root_a] = parent[root_b] = new_id
+        cluster_size[new_id] = cluster_size[root_a] + cluster_size[root_b]
+        Z[i] = [min(root_a, root_b), max(root_a, root_b), height, cluster_size[new_id]]
+    return Z
+
+
+def group_prototypes(frame, group_col, feature_cols, max_per_group=50):
+    """Summarise each group (e.g. a stage-1 cluster) by at most max_per_group weighted prototype rows.
+
+    A group's prototypes are its most frequent distinct combinations of feature_cols; rows with
+    any other combination join the prototype of their group that matches the most features
+    (the more frequent one on ties). Returns (prototypes, weights, row_prototype): prototypes is a
+    frame of group_col and feature_cols, weights counts the rows behind each prototype and
+    row_prototype maps every row of frame to its prototype.
+    """
+    columns = [group_col] + list(feature_cols)
+    combo = frame.groupby(columns, sort=False, dropna=False).ngroup().to_numpy()
+    counts = np.bincount(combo).astype(float)
+    combos = frame[columns].iloc[np.unique(combo, return_index=True)[1]].reset_index(drop=True)
+    feature_codes = np.column_stack([pd.factorize(combos[col], use_na_sentinel=False)[0] for col in feature_cols])
+    group = combos[group_col].to_numpy()
+
+    target = np.empty(len(combos), dtype=np.intp)
+    for value in pd.unique(group):
+        members = np.flatnonzero(group == value)
+        ranked = members[np.argsort(-counts[members], kind='stable')]
+        kept, rest = ranked[:max_per_group], ranked[max_per_group:]
+        target[kept] = kept
+        if len(rest):
+            mismatches = (feature_codes[rest][:, None, :] != feature_codes[kept][None, :, :]).sum(axis=2)
+            target[rest] = kept[mismatches.argmin(axis=1)]
+
+    kept, combo_prototype = np.unique(target, return_inverse=True)
+    weights = np.bincount(combo_prototype, weights=counts)
+    return combos.iloc[kept].reset_index(drop=True), weights, combo_prototype[combo]
@@ -0,0 +1,96 @@
+"""Single-pass CSV ingestion for uploads.
+
+The upload stream is read exactly once. The header line is checked as soon as it arrives, then
+the stream goes straight into pandas' parser, restricted to the columns the pipeline reads and
+with string dtypes, while every byte also feeds a SHA-256 (the result cache key). engine='pyarrow'
+(opt-in; pyarrow is not a requirement) parses the stream with pyarrow.csv directly, with the
+columns typed as strings up front: pandas' pyarrow engine infers types first and only then
+casts, which turns '007' into '7' and a missing cell into the string 'nan'.
+"""
+import csv
+import hashlib
+import io
+
+import pandas as pd
+
+# Columns the pipeline reads; other columns of an upload are not parsed
+INGEST_COLUMNS = ('Email', 'Keyword Category')
+REQUIRED_COLUMNS = ('Email',)
+
+CSV_ENGINE = 'c'
+
+
+class CSVValidationError(ValueError):
+    """The upload is empty or its header lacks a required column."""
+
+
+class _HashingReader(io.RawIOBase):
+    """Replays prefix, then the rest of stream, feeding every byte to content_hash."""
+
+    def __init__(self, stream, content_hash, prefix=b''):
+        self._stream = stream
+        self._hash = content_hash
+        self._prefix = prefix
+        content_hash.update(prefix)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if self._prefix:
+            data, self._prefix = self._prefix[:len(buffer)], self._prefix[len(buffer):]
+        else:
+            data = self._stream.read(len(buffer))
+            self._hash.update(data)
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def read_header(stream, chunk_size=2 ** 16):
+    """(header columns, bytes consumed) from the start of a binary CSV stream."""
+    head = b''
+    while b'\n' not in head:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        head += chunk
+    line = head.split(b'\n', 1)[0].decode('utf-8-sig').rstrip('\r')
+    return (next(csv.reader([line])) if line.strip() else []), head
+
+
+def _parse(reader, usecols, engine):
+    """The usecols of a binary CSV stream as string columns, missing cells as NaN/None."""
+    if engine == 'pyarrow':
+        import pyarrow as pa
+        from pyarrow import csv as pa_csv
+
+        table = pa_csv.read_csv(reader, convert_options=pa_csv.ConvertOptions(
+            column_types={column: pa.string() for column in usecols}, include_columns=usecols,
+            strings_can_be_null=True))
+        return table.to_pandas()
+    return pd.read_csv(reader, usecols=usecols, dtype={column: str for column in usecols}, engine=engine)
+
+
+def read_upload(stream, columns=INGEST_COLUMNS, required=REQUIRED_COLUMNS, chunk_size=2 ** 20,
+                engine=CSV_ENGINE):
+    """Parse a binary CSV stream in one pass; returns (DataFrame, sha256 of the bytes).
+
+    Only the given columns that the header has are read, as strings. Raises CSVValidationError
+    for an empty upload or a header without a required column, before the body is parsed.
+    """
+    header, head = read_header(stream)
+    if not header:
+        raise CSVValidationError("Uploaded file is empty")
+    missing = [column for column in required if column not in header]
+    if missing:
+        raise CSVValidationError(f"CSV file must contain {', '.join(repr(c) for c in missing)} column(s)")
+
+    content_hash = hashlib.sha256()
+    reader = io.BufferedReader(_HashingReader(stream, content_hash, prefix=head), buffer_size=chunk_size)
+    # In header order, as pandas' usecols gives them
+    usecols = [column for column in header if column in columns]
+    df = _parse(reader, usecols, engine)
+    # The hash covers the whole upload even if the parser stopped short of the end
+    for _ in iter(lambda: reader.read(chunk_size), b''):
+        pass
+    return df, content_hash
@@ -0,0 +1,212 @@
+"""K-modes clustering on small-integer code arrays, vectorised with NumPy.
+
+A drop-in alternative to `kmodes.KModes` for the stage-1 features: same constructor arguments
+for the options the pipeline uses (n_clusters, init='Huang', n_init, max_iter, random_state),
+same fitted attributes (cluster_centroids_, labels_, cost_, n_iter_, epoch_costs_) and the same
+fit / predict / fit_predict(X, sample_weight=None) interface.
+
+Where the package visits one point at a time in Python, this engine alternates two batch steps:
+every point is assigned to its nearest mode using Hamming distances computed a chunk of rows at
+a time, then every mode is recomputed from per-cluster value counts (one bincount per feature).
+Ties are broken the same way as the package: lowest cluster index, then smallest value.
+"""
+import numpy as np
+
+
+def encode_codes(X):
+    """Map each column of X to dense codes 0..n_values-1; returns (codes, per-column values)."""
+    X = np.asarray(X)
+    if X.ndim == 1:
+        X = X[:, None]
+    codes = np.empty(X.shape, dtype=np.int32)
+    values = []
+    for j in range(X.shape[1]):
+        column_values, codes[:, j] = np.unique(X[:, j], return_inverse=True)
+        values.append(column_values)
+    return codes, values
+
+
+def hamming_assign(codes, centroids, sample_weight=None, max_chunk_cells=2 ** 22):
+    """Nearest centroid (matching dissimilarity) for every row; returns (labels, distances, cost).
+
+    Works through the rows in chunks so the rows x clusters x features comparison stays below
+    max_chunk_cells booleans.
+    """
+    n_points, n_features = codes.shape
+    chunk = max(1, max_chunk_cells // max(1, len(centroids) * n_features))
+    labels = np.empty(n_points, dtype=np.intp)
+    distances = np.empty(n_points, dtype=np.int32)
+    for start in range(0, n_points, chunk):
+        block = codes[start:start + chunk]
+        mismatches = (block[:, None, :] != centroids[None, :, :]).sum(axis=2)
+        labels[start:start + chunk] = mismatches.argmin(axis=1)
+        distances[start:start + chunk] = mismatches.min(axis=1)
+    weights = np.ones(n_points) if sample_weight is None else sample_weight
+    return labels, distances, float(weights @ distances)
+
+
+def compute_modes(codes, labels, n_clusters, n_values, sample_weight=None):
+    """Per-cluster modes and cluster weights from one bincount per feature."""
+    modes = np.empty((n_clusters, codes.shape[1]), dtype=codes.dtype)
+    for j, n_j in enumerate(n_values):
+        counts = np.bincount(labels * n_j + codes[:, j], weights=sample_weight,
+                             minlength=n_clusters * n_j).reshape(n_clusters, n_j)
+        # argmax takes the first maximum, i.e. the smallest value on ties
+        modes[:, j] = counts.argmax(axis=1)
+    sizes = np.bincount(labels, weights=sample_weight, minlength=n_clusters)
+    return modes, sizes
+
+
+def init_huang(codes, n_clusters, n_values, random_state, sample_weight=None):
+    """Huang [1997] initialisation: sample each attribute by frequency, then snap every
+    centroid to its nearest distinct data row that is not already a centroid."""
+    centroids = np.empty((n_clusters, codes.shape[1]), dtype=codes.dtype)
+    for j, n_j in enumerate(n_values):
+        frequency = np.bincount(codes[:, j], weights=sample_weight, minlength=n_j)
+        centroids[:, j] = random_state.choice(n_j, n_clusters, p=frequency / frequency.sum())
+
+    rows = np.unique(codes, axis=0)
+    for ik in range(n_clusters):
+        distances = (rows != centroids[ik]).sum(axis=1)
+        taken = (rows[:, None, :] == centroids[None, :, :]).all(axis=2).any(axis=1)
+        if not taken.all():
+            distances = np.where(taken, codes.shape[1] + 1, distances)
+        centroids[ik] = rows[np.argmin(distances)]
+    return centroids
+
+
+def split_centroids(codes, centroids, labels, sample_weight=None, max_chunk_cells=2 ** 22):
+    """Initial centroids for k + 1 clusters from a k-cluster fit: the existing centroids plus the
+    row that lowers the assignment cost the most when added as a centroid (a greedy split).
+
+    Candidates are the rows of codes, so pass distinct rows weighted by multiplicity. Returns None
+    when every row already sits on its centroid, i.e. there is nothing left to split.
+    """
+    distances = (codes != centroids[labels]).sum(axis=1)
+    if not distances.any():
+        return None
+    weights = np.ones(len(codes)) if sample_weight is None else np.asarray(sample_weight, dtype=float)
+    chunk = max(1, max_chunk_cells // (len(codes) * codes.shape[1]))
+    best_gain, best_row = -1.0, None
+    for start in range(0, len(codes), chunk):
+        candidates = codes[start:start + chunk]
+        to_candidate = (codes[:, None, :] != candidates[None, :, :]).sum(axis=2)
+        gain = weights @ np.maximum(distances[:, None] - to_candidate, 0)
+        if gain.max() > best_gain:
+            best_gain, best_row = gain.max(), start + int(gain.argmax())
+    return np.vstack([centroids, codes[best_row]])
+
+
+class NumpyKModes:
+    """k-modes clustering for categorical data with batch, vectorised updates.
+
+    Parameters mirror `kmodes.KModes`: init is 'Huang', 'random' or an array of initial
+    encoded centroids (column codes as from encode_codes, as in the package); n_init runs are made with seeds drawn from
+    random_state and the lowest-cost run is kept. max_chunk_cells bounds the memory of
+    the assignment step.
+    """
+
+    def __init__(self, n_clusters=8, max_iter=100, init='Huang', n_init=10, verbose=0,
+                 random_state=None, max_chunk_cells=2 ** 22):
+        self.n_clusters = n_clusters
+        self.max_iter = max_iter
+        self.init = init
+        self.n_init = n_init
+        self.verbose = verbose
+        self.random_state = random_state
+        self.max_chunk_cells = max_chunk_cells
+
+    def _initial_centroids(self, codes, n_clusters, random_state, sample_weight):
+        if hasattr(self.init, '__array__'):
+            return np.asarray(self.init, dtype=codes.dtype).copy()
+        if self.init.lower() == 'huang':
+            return init_huang(codes, n_clusters, self._n_values, random_state, sample_weight)
+        if self.init.lower() == 'random':
+            return codes[random_state.choice(len(codes), n_clusters)].copy()
+        raise NotImplementedError(f"Unsupported init: {self.init!r}")
+
+    def _run(self, codes, n_clusters, max_iter, seed, sample_weight):
+        from sklearn.utils import check_random_state
+
+        random_state = check_random_state(seed)
+        centroids = self._initial_centroids(codes, n_clusters, random_state, sample_weight)
+        labels, _, _ = hamming_assign(codes, centroids, sample_weight, self.max_chunk_cells)
+        centroids = self._update(codes, labels, centroids, random_state, sample_weight)
+        labels, distances, cost = hamming_assign(codes, centroids, sample_weight, self.max_chunk_cells)
+        epoch_costs = [cost]
+
+        n_iter = 0
+        while n_iter < max_iter:
+            n_iter += 1
+            centroids = self._update(codes, labels, centroids, random_state, sample_weight)
+            new_labels, distances, new_cost = hamming_assign(codes, centroids, sample_weight,
+                                                             self.max_chunk_cells)
+            moves = int((new_labels != labels).sum())
+            epoch_costs.append(new_cost)
+            labels, converged, cost = new_labels, moves == 0 or new_cost >= cost, new_cost
+            if self.verbose:
+                print(f"Iteration: {n_iter}/{max_iter}, moves: {moves}, cost: {cost}")
+            if converged:
+                break
+        return centroids, labels, cost, n_iter, epoch_costs
+
+    def _update(self, codes, labels, centroids, random_state, sample_weight):
+        modes, sizes = compute_modes(codes, labels, len(centroids), self._n_values, sample_weight)
+        # An emptied cluster keeps going from a random data row, as in the package
+        for ik in np.flatnonzero(sizes == 0):
+            modes[ik] = codes[random_state.randint(len(codes))]
+        return modes
+
+    def _encode(self, X):
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X[:, None]
+        codes = np.empty(X.shape, dtype=np.int32)
+        for j, values in enumerate(self._values):
+            position = np.searchsorted(values, X[:, j]).clip(0, len(values) - 1)
+            # Unseen values match no centroid
+            codes[:, j] = np.where(values[position] == X[:, j], position, -1)
+        return codes
+
+    def fit(self, X, y=None, sample_weight=None, **kwargs):
+        codes, self._values = encode_codes(X)
+        self._n_values = [len(values) for values in self._values]
+        if sample_weight is not None:
+            sample_weight = np.asarray(sample_weight, dtype=float)
+        n_points = len(codes)
+        if self.n_clusters > n_points:
+            raise ValueError(f"Cannot have more clusters ({self.n_clusters}) than data points ({n_points}).")
+
+        from sklearn.utils import check_random_state
+
+        random_state = check_random_state(self.random_state)
+        unique = np.unique(codes, axis=0)
+        if len(unique) <= self.n_clusters:
+            # Every distinct row becomes a centroid; nothing to iterate
+            labels, _, cost = hamming_assign(codes, unique, sample_weight, self.max_chunk_cells)
+            best = unique, labels, cost, 0, [cost]
+        else:
+            n_init = 1 if hasattr(self.init, '__array__') else self.n_init
+            seeds = random_state.randint(np.iinfo(np.int32).max, size=n_init)
+            runs = [self._run(codes, self.n_clusters, self.max_iter, seed, sample_weight) for seed in seeds]
+            best = min(runs, key=lambda run: run[2])
+        self._enc_cluster_centroids, labels, self.cost_, self.n_iter_, self.epoch_costs_ = best
+        self.labels_ = labels.astype(np.uint16)
+        return self
+
+    @property
+    def cluster_centroids_(self):
+        if not hasattr(self, '_enc_cluster_centroids'):
+            raise AttributeError("'NumpyKModes' object has no attribute 'cluster_centroids_' "
+                                 "because the model is not yet fitted.")
+        return np.column_stack([values[self._enc_cluster_centroids[:, j]]
+                                for j, values in enumerate(self._values)])
+
+    def predict(self, X, **kwargs):
+        assert hasattr(self, '_enc_cluster_centroids'), "Model not yet fitted."
+        labels, _, _ = hamming_assign(self._encode(X), self._enc_cluster_centroids,
+                                      max_chunk_cells=self.max_chunk_cells)
+        return labels.astype(np.uint16)
+
+    def fit_predict(self, X, y=None, **kwargs):
+        return self.fit(X, **kwargs).labels_
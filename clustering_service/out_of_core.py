@@ -0,0 +1,201 @@
+"""Out-of-core clustering for CSV imports too large to hold in memory.
+
+main() loads the whole CSV and keeps several full copies of it alive. run_out_of_core works in
+three passes instead, with peak memory bounded by chunk_size and sample_size rather than by
+the file:
+
+1. stream the CSV in chunks, counting rows, domains, domain types and keyword categories, and
+   keep a uniform reservoir sample of sample_size rows;
+2. run the normal pipeline (main) on the sample;
+3. stream the CSV again, assign every row and append it to a CSV of clustered rows.
+
+Every clustering feature is derived from the email domain and the keyword category, so a row
+is assigned by its feature pattern: rows whose pattern occurs in the sample take that
+pattern's stage-1 and stage-2 clusters, and rows with an unseen pattern take those of the
+closest sample pattern (matching dissimilarity, as k-modes uses).
+"""
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from clustering_script import EMBEDDING, add_academic_features, add_domain_features, main
+from ingest import INGEST_COLUMNS
+from kmodes_engine import hamming_assign
+
+# The raw form of the stage-1 feature matrix built by prepare_for_clustering
+PATTERN_FEATURES = ['domain_type', 'Keyword Category', 'tld', 'is_sri_lankan', 'is_sl_academic',
+                    'academic_level', 'is_identified_university', 'university_name_filled']
+
+OUTPUT_COLUMNS = ['Email', 'Keyword Category', 'domain', 'domain_type', 'tld', 'university_name',
+                  'stage1_cluster', 'stage2_cluster', 'cluster_name', 'x', 'y']
+
+
+def read_chunks(file_path, chunk_size):
+    return pd.read_csv(file_path, usecols=lambda column: column in INGEST_COLUMNS, dtype=str,
+                       chunksize=chunk_size)
+
+
+def row_features(chunk):
+    """The columns prepare_for_clustering derives for each row, without the label encoding, on a
+    copy of chunk (which may be a slice of a larger frame)."""
+    df = add_domain_features(chunk.copy())
+    df = df.dropna(subset=['domain'])
+    df = add_academic_features(df)
+    df['university_name_filled'] = df['university_name'].fillna('Unknown')
+    return df
+
+
+def scan_csv(file_path, sample_size=20000, chunk_size=100000, random_state=42):
+    """Pass 1: (uniform sample of at most sample_size rows, statistics of the whole file).
+
+    The sample holds the rows with the sample_size smallest of a random key drawn per row, which
+    is a uniform sample without replacement however many chunks the file has.
+    """
+    rng = np.random.default_rng(random_state)
+    sample, sample_keys = None, np.empty(0)
+    rows, domains, domain_types, keywords = 0, Counter(), Counter(), Counter()
+
+    for chunk in read_chunks(file_path, chunk_size):
+        rows += len(chunk)
+        candidates = chunk if sample is None else pd.concat([sample, chunk], ignore_index=True)
+        keys = np.concatenate([sample_keys, rng.random(len(chunk))])
+        keep = np.sort(np.argsort(keys, kind='stable')[:sample_size])
+        sample, sample_keys = candidates.iloc[keep].reset_index(drop=True), keys[keep]
+
+        df = add_domain_features(chunk.copy()).dropna(subset=['domain'])
+        domains.update(df['domain'].value_counts().to_dict())
+        domain_types.update(df['domain_type'].value_counts().to_dict())
+        keywords.update(df['Keyword Category'].value_counts().to_dict())
+        print(f"Pass 1: {rows} rows scanned, {len(domains)} unique domains")
+
+    stats = {
+        'rows': rows,
+        'rows_with_domain': sum(domains.values()),
+        'unique_domains': len(domains),
+        'top_domains': dict(domains.most_common(10)),
+        'domain_types': dict(domain_types),
+        'keyword_categories': dict(keywords),
+    }
+    if sample is None:
+        sample = pd.DataFrame(columns=list(INGEST_COLUMNS))
+    return sample, stats
+
+
+def fit_patterns(final_df):
+    """Pattern table of a clustered frame: one row per distinct PATTERN_FEATURES value with the
+    clusters most of its rows got and the mean of their scatter-plot coordinates."""
+    # dropna=False: a missing value (an empty Keyword Category, a missing cluster_name) must not
+    # drop its pattern
+    labels = (final_df.groupby(PATTERN_FEATURES + ['stage1_cluster', 'stage2_cluster', 'cluster_name'], dropna=False)
+              .size().rename('count').reset_index()
+              .sort_values('count', ascending=False, kind='stable')
+              .drop_duplicates(PATTERN_FEATURES))
+    coords = final_df.groupby(PATTERN_FEATURES, dropna=False)[['x', 'y']].mean().reset_index()
+    return labels.drop(columns='count').merge(coords, on=PATTERN_FEATURES).reset_index(drop=True)
+
+
+def assign_patterns(df, patterns, features=PATTERN_FEATURES):
+    """Index into patterns for every row of df, and the mask of rows without an exact match on
+    the feature columns."""
+    index = pd.MultiIndex.from_frame(patterns[features])
+    slots = index.get_indexer(pd.MultiIndex.from_frame(df[features]))
+    unmatched = slots < 0
+    if unmatched.any():
+        # Codes per column from the pattern table; a value it has never seen matches nothing
+        codes = np.column_stack([pd.Index(patterns[column].unique()).get_indexer(values)
+                                 for column, values in df.loc[unmatched, features].items()])
+        centroids = np.column_stack([pd.Index(patterns[column].unique()).get_indexer(patterns[column])
+                                     for column in features])
+        slots[unmatched], _, _ = hamming_assign(codes, centroids)
+    return slots, unmatched
+
+
+def _add_counts(total, counts):
+    return counts if total is None else total.add(counts, fill_value=0)
+
+
+def _summary(domain_counts, keyword_counts):
+    """stage1_summary/stage2_summary records from (cluster, value) -> row counts."""
+    def top(counts):
+        counts = counts.sort_values(ascending=False, kind='stable')
+        return counts[~counts.index.get_level_values(0).duplicated()].reset_index(level=1).iloc[:, 0]
+
+    summary = pd.DataFrame({'domain_type': top(domain_counts), 'Keyword Category': top(keyword_counts),
+                            'count': domain_counts.groupby(level=0).sum().astype(int)})
+    summary.index.name = domain_counts.index.names[0]
+    return summary.sort_values('count', ascending=False).reset_index().to_dict('records')
+
+
+def _distribution(counts):
+    crosstab = counts.unstack(fill_value=0).astype(int)
+    return {'index': crosstab.index.tolist(), 'columns': crosstab.columns.tolist(),
+            'data': crosstab.values.tolist()}
+
+
+def assign_csv(file_path, output_path, patterns, chunk_size=100000, jitter=EMBEDDING['jitter'], random_state=42):
+    """Pass 3: assign every row of file_path and write it to output_path.
+
+    Returns full-file counts for the cluster summaries: {(stage, column): Series of row counts
+    indexed by (cluster, value)}, plus the number of rows assigned and of rows without an exact
+    pattern match.
+    """
+    rng = np.random.default_rng(random_state)
+    spread = patterns[['x', 'y']].to_numpy().std(axis=0) if len(patterns) > 1 else np.ones(2)
+    counts, assigned, unmatched_rows = {}, 0, 0
+
+    for i, chunk in enumerate(read_chunks(file_path, chunk_size)):
+        df = row_features(chunk)
+        slots, unmatched = assign_patterns(df, patterns)
+        for column in ['stage1_cluster', 'stage2_cluster', 'cluster_name', 'x', 'y']:
+            df[column] = patterns[column].to_numpy()[slots]
+        # Rows sharing a pattern are spread around its point, as embed_patterns does
+        df[['x', 'y']] += rng.normal(scale=jitter, size=(len(df), 2)) * np.where(spread > 0, spread, 1.0)
+        df[OUTPUT_COLUMNS].to_csv(output_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+
+        for stage in ['stage1_cluster', 'stage2_cluster']:
+            for column in ['domain_type', 'Keyword Category']:
+                counts[stage, column] = _add_counts(counts.get((stage, column)), df.groupby([stage, column]).size())
+        assigned += len(df)
+        unmatched_rows += int(unmatched.sum())
+        print(f"Pass 3: {assigned} rows assigned, {unmatched_rows} by nearest pattern")
+
+    if assigned == 0:
+        pd.DataFrame(columns=OUTPUT_COLUMNS).to_csv(output_path, index=False)
+    return counts, assigned, unmatched_rows
+
+
+def run_out_of_core(file_path, output_path, sample_size=20000, chunk_size=100000, random_state=42,
+                    is_new_import=False, **pipeline_options):
+    """Cluster a CSV of any size in bounded memory; returns main()'s result dict.
+
+    The clustered rows are written to output_path instead of being returned under
+    'clustered_data'. Cluster summaries and distributions count every row of the file, while the
+    metrics, charts, cluster names and scatter-plot data come from the fit on the sample. The
+    pipeline options are passed to main, with dedup on unless set.
+    """
+    print(f"Out-of-core mode: sampling {sample_size} rows in chunks of {chunk_size}")
+    sample, stats = scan_csv(file_path, sample_size=sample_size, chunk_size=chunk_size, random_state=random_state)
+    print(f"\nData Summary:\nEmails: {stats['rows_with_domain']}, Unique domains: {stats['unique_domains']}")
+    print(f"Fitting on a sample of {len(sample)} of {stats['rows']} rows")
+
+    pipeline_options.setdefault('dedup', True)
+    final_df, result = main(sample, is_new_import=is_new_import, **pipeline_options)
+    patterns = fit_patterns(final_df)
+    del final_df, result['clustered_data']
+
+    counts, assigned, unmatched_rows = assign_csv(
+        file_path, output_path, patterns, chunk_size=chunk_size,
+        jitter=pipeline_options.get('embedding', EMBEDDING)['jitter'], random_state=random_state)
+
+    analysis = result['cluster_analysis']
+    if assigned:
+        for stage in ['stage1', 'stage2']:
+            analysis[f'{stage}_summary'] = _summary(counts[f'{stage}_cluster', 'domain_type'],
+                                                    counts[f'{stage}_cluster', 'Keyword Category'])
+        analysis['domain_distribution'] = _distribution(counts['stage2_cluster', 'domain_type'])
+        analysis['keyword_distribution'] = _distribution(counts['stage2_cluster', 'Keyword Category'])
+    result['out_of_core'] = dict(stats, sample_rows=len(sample), patterns=len(patterns), assigned_rows=assigned,
+                                 unmatched_rows=unmatched_rows, output_path=output_path)
+    print(f"Clustered rows saved to {output_path}")
+    return result
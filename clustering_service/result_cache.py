@@ -0,0 +1,111 @@
+"""Content-addressed on-disk cache of /cluster results.
+
+An entry is keyed by the SHA-256 of the uploaded bytes together with is_new_import and the
+pipeline options, so re-uploads and retries of the same CSV under the same configuration are
+answered without rerunning the pipeline. Entries are JSON files in one directory; reading an
+entry refreshes its modification time, and after every write the least recently used entries
+are removed until the directory fits in max_bytes.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+import fast_json
+
+# Part of every key: bump it when the shape of cached results changes
+CACHE_FORMAT = 2
+
+
+def content_key(content_hash, is_new_import, config):
+    """Cache key from a sha256 object already fed with the uploaded bytes, plus the options
+    that change the result."""
+    options = json.dumps({'format': CACHE_FORMAT, 'is_new_import': is_new_import, 'config': config},
+                         sort_keys=True, default=str)
+    content_hash = content_hash.copy()
+    content_hash.update(options.encode('utf-8'))
+    return content_hash.hexdigest()
+
+
+class ResultCache:
+    """Size-bounded LRU store of JSON-serialisable results in directory, with hit/miss counters."""
+
+    def __init__(self, directory, max_bytes=512 * 2 ** 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        """The cached result for key, or None. Entries are replaced atomically, so they are read
+        without holding the lock; callers on an event loop should run this in a thread."""
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                value = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Store value under key, then evict least recently used entries beyond max_bytes.
+
+        Raises what encoding or writing raises (TypeError, ValueError, OSError), leaving no
+        partial entry or temporary file behind.
+        """
+        data = fast_json.dumps(value)
+        with self._lock:
+            # Write to a temporary file first so readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, self._path(key))
+            except BaseException:
+                with contextlib.suppress(OSError):
+                    os.unlink(tmp_path)
+                raise
+            self._evict()
+
+    def _entries(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.json'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return sorted(entries)
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def stats(self):
+        with self._lock:
+            entries = self._entries()
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else None,
+                'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries),
+                'max_bytes': self.max_bytes,
+            }
@@ -0,0 +1,150 @@
+"""Clustered records kept server-side by run id, served one cluster page at a time.
+
+The frontend shows one cluster's emails at a time, so /cluster?format=summary stores the
+clustered rows here and returns only the cluster summaries; records are then fetched per
+cluster, page by page. Each run is a directory holding one .npy file per column of
+columnar.RESPONSE_COLUMNS (strings as dictionary codes, the dictionaries in meta.json), the row
+order grouped by cluster and the run's summary. Columns are memory-mapped on read, so a page
+touches only the rows it returns. Runs expire ttl_seconds after they were stored.
+"""
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from columnar import DICTIONARY_COLUMNS, FLOAT32_COLUMNS, select_columns
+
+CLUSTER_COLUMN = 'stage2_cluster'
+
+
+def _store_column(values, name):
+    """(kind, array to save, dictionary or None) for one column."""
+    if name in DICTIONARY_COLUMNS:
+        codes, dictionary = pd.factorize(values, use_na_sentinel=True)
+        return 'dictionary', codes.astype(np.int32), [str(value) for value in dictionary]
+    if name in FLOAT32_COLUMNS:
+        return 'float32', values.to_numpy(dtype=np.float32), None
+    if pd.api.types.is_integer_dtype(values):
+        return 'int64', values.to_numpy(dtype=np.int64), None
+    # Fixed-width unicode keeps the column memory-mappable; a missing value is stored as ''
+    return 'string', values.fillna('').astype(str).to_numpy(dtype=str), None
+
+
+class ResultStore:
+    """Runs in directory by run id, each removed ttl_seconds after it was stored."""
+
+    def __init__(self, directory, ttl_seconds=3600):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, run_id, name=''):
+        # Run ids are uuid hex, so anything else cannot name a run
+        if not run_id or not all(c in '0123456789abcdef' for c in run_id):
+            raise KeyError(run_id)
+        return os.path.join(self.directory, run_id, name)
+
+    def put(self, frame, summary):
+        """Store the clustered rows of a run with its summary; returns the run id."""
+        frame = select_columns(frame).reset_index(drop=True)
+        run_id = uuid.uuid4().hex
+        staging = tempfile.mkdtemp(dir=self.directory, prefix='.staging-')
+        columns, dictionaries = [], {}
+        for i, name in enumerate(frame.columns):
+            kind, array, dictionary = _store_column(frame[name], name)
+            np.save(os.path.join(staging, f'{i}.npy'), array)
+            columns.append({'name': name, 'kind': kind})
+            if dictionary is not None:
+                dictionaries[name] = dictionary
+
+        # Rows grouped by cluster, original order kept within each cluster
+        clusters = frame[CLUSTER_COLUMN].to_numpy()
+        order = np.argsort(clusters, kind='stable')
+        cluster_ids, starts, counts = np.unique(clusters[order], return_index=True, return_counts=True)
+        np.save(os.path.join(staging, 'order.npy'), order)
+        names = frame.groupby(CLUSTER_COLUMN)['cluster_name'].first().to_dict() if 'cluster_name' in frame else {}
+        meta = {
+            'run_id': run_id,
+            'created_at': time.time(),
+            'length': len(frame),
+            'columns': columns,
+            'dictionaries': dictionaries,
+            'clusters': [{'cluster_id': int(cluster_id),
+                          'cluster_name': names[cluster_id] if isinstance(names.get(cluster_id), str) else None,
+                          'count': int(count), 'start': int(start)}
+                         for cluster_id, start, count in zip(cluster_ids, starts, counts)],
+            'summary': summary,
+        }
+        with open(os.path.join(staging, 'meta.json'), 'w') as f:
+            json.dump(meta, f, default=str)
+        with self._lock:
+            os.replace(staging, self._path(run_id))
+            self._evict()
+        return run_id
+
+    def _evict(self):
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if entry.is_dir() and now - entry.stat().st_mtime > self.ttl_seconds:
+                shutil.rmtree(entry.path, ignore_errors=True)
+
+    def meta(self, run_id):
+        """The stored metadata of a run. Raises KeyError for an unknown or expired run."""
+        with self._lock:
+            self._evict()
+            try:
+                with open(self._path(run_id, 'meta.json')) as f:
+                    meta = json.load(f)
+            except OSError:
+                raise KeyError(run_id)
+        meta['expires_at'] = meta['created_at'] + self.ttl_seconds
+        return meta
+
+    def records(self, run_id, cluster_id, cursor=0, limit=100, filters=None):
+        """
+        One page of a cluster's records: (records, next cursor or None, rows matching).
+
+        cursor is the position within the cluster to resume from (0 for the first page);
+        filters maps dictionary columns to the value rows must have. Raises KeyError for an
+        unknown run or cluster.
+        """
+        meta = self.meta(run_id)
+        cluster = next((c for c in meta['clusters'] if c['cluster_id'] == cluster_id), None)
+        if cluster is None:
+            raise KeyError(cluster_id)
+        path = self._path(run_id)
+        rows = np.load(os.path.join(path, 'order.npy'), mmap_mode='r')[
+            cluster['start']:cluster['start'] + cluster['count']]
+        columns = {column['name']: (column['kind'], np.load(os.path.join(path, f'{i}.npy'), mmap_mode='r'))
+                   for i, column in enumerate(meta['columns'])}
+
+        # Positions (within the cluster) of the rows that pass every filter
+        matches = np.arange(len(rows))
+        for name, value in (filters or {}).items():
+            dictionary = meta['dictionaries'].get(name, [])
+            if value not in dictionary:
+                matches = matches[:0]
+                continue
+            matches = matches[np.asarray(columns[name][1][rows[matches]]) == dictionary.index(value)]
+        page = matches[np.searchsorted(matches, cursor):][:limit]
+        next_cursor = int(page[-1]) + 1 if len(page) and page[-1] < matches[-1] else None
+
+        selected = rows[page]
+        data = {}
+        for name, (kind, array) in columns.items():
+            values = np.asarray(array[selected])
+            if kind == 'dictionary':
+                # The trailing None is what code -1 picks
+                values = np.array(meta['dictionaries'][name] + [None], dtype=object)[values]
+            elif kind == 'float32':
+                values = values.astype(str).astype(float)
+            data[name] = values.tolist()
+        records = [dict(zip(data, row)) for row in zip(*data.values())]
+        return records, next_cursor, len(matches)
@@ -0,0 +1,189 @@
+"""A fitted segmentation that new imports can be assigned to without re-clustering.
+
+A full pipeline run re-fits the k sweep, the linkage and the embedding. build_model keeps what
+is needed to place new emails in the segmentation that run produced: the label encoders of
+prepare_for_clustering, the k-modes centroids, the stage-2 cluster of every (domain_type,
+Keyword Category, tld, stage-1 cluster) combination seen and the cluster names. assign scores
+new rows against it in time linear in their number: encode, nearest centroid, stage-2 lookup.
+
+assign also measures how far the new rows are from the data the model was fitted on. The
+drift report compares the share of rows with categories the encoders have never seen, the
+mean distance to the nearest centroid and the stage-1 cluster mix with the fitted data, and
+recommends a full refit once any of them crosses DRIFT_THRESHOLDS.
+
+Every model has a model_id. ModelStore keeps the most recent models by id, so each caller
+assigns against the segmentation its own /cluster run returned rather than whichever run
+finished last.
+"""
+import os
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+import fast_json
+from kmodes_engine import hamming_assign
+
+MODEL_FORMAT = 1
+
+# X_kmodes columns of prepare_for_clustering: (column, encoder name or None for raw values)
+STAGE1_FEATURES = [('domain_type', 'domain_type'), ('Keyword Category', 'keyword'), ('tld', 'tld'),
+                   ('is_sri_lankan', None), ('is_sl_academic', None), ('academic_level', None),
+                   ('is_identified_university', None), ('university_name_filled', 'university')]
+STAGE2_FEATURES = ['domain_type', 'Keyword Category', 'tld', 'stage1_cluster']
+
+DRIFT_THRESHOLDS = {
+    # Share of rows with a category no encoder has seen
+    'unseen_rate': 0.2,
+    # Mean distance to the nearest centroid over the fitted data's mean distance
+    'distance_ratio': 1.5,
+    # Total variation distance between the stage-1 cluster mix and the fitted one
+    'cluster_shift': 0.25,
+}
+
+
+def encode_stage1(df, encoders):
+    """The stage-1 feature matrix of df under the model's encoders; unseen categories get -1."""
+    columns = []
+    for column, encoder in STAGE1_FEATURES:
+        if encoder is None:
+            columns.append(df[column].to_numpy(dtype=np.int64))
+        else:
+            columns.append(pd.Index(encoders[encoder]).get_indexer(df[column].astype(str)))
+    return np.column_stack(columns)
+
+
+def build_model(final_df, encoders, centroids, cluster_names):
+    """The segmentation model of a pipeline run, as a JSON-serialisable dict.
+
+    final_df is main's clustered frame, encoders the LabelEncoders of prepare_for_clustering,
+    centroids the k-modes centroids in that encoding and cluster_names the stage-2 names.
+    """
+    encoders = {name: [str(value) for value in encoder.classes_] for name, encoder in encoders.items()}
+    centroids = np.asarray(centroids, dtype=np.int64)
+    _, distances, _ = hamming_assign(encode_stage1(final_df, encoders), centroids)
+    stage1 = final_df['stage1_cluster'].to_numpy()
+
+    # The stage-2 cluster most rows of each combination got
+    combinations = (final_df.groupby(STAGE2_FEATURES + ['stage2_cluster']).size().rename('count').reset_index()
+                    .sort_values('count', ascending=False, kind='stable').drop_duplicates(STAGE2_FEATURES))
+    return {
+        'format': MODEL_FORMAT,
+        'model_id': uuid.uuid4().hex,
+        'created_at': time.time(),
+        'row_count': len(final_df),
+        'encoders': encoders,
+        'centroids': centroids.tolist(),
+        'stage2': {
+            'rows': combinations[STAGE2_FEATURES].astype(object).values.tolist(),
+            'clusters': combinations['stage2_cluster'].astype(int).tolist(),
+        },
+        'cluster_names': {str(key): value for key, value in cluster_names.items()},
+        'baseline': {
+            'stage1_distribution': (np.bincount(stage1, minlength=len(centroids)) / max(1, len(stage1))).tolist(),
+            'mean_distance': float(distances.mean()) if len(distances) else 0.0,
+        },
+    }
+
+
+def drift_report(unseen, distances, stage1, model, thresholds=DRIFT_THRESHOLDS):
+    """Drift measures of a batch of assigned rows against the model's fitted data, with the
+    ones over their threshold and whether a full refit is recommended."""
+    baseline = model['baseline']
+    distribution = np.bincount(stage1, minlength=len(model['centroids'])) / max(1, len(stage1))
+    measures = {
+        'unseen_rate': float(unseen.mean()) if len(unseen) else 0.0,
+        'distance_ratio': (float(distances.mean()) / baseline['mean_distance'] if baseline['mean_distance'] > 0
+                           else float(distances.mean() > 0)) if len(distances) else 0.0,
+        'cluster_shift': float(0.5 * np.abs(distribution - np.asarray(baseline['stage1_distribution'])).sum())
+        if len(stage1) else 0.0,
+    }
+    exceeded = [name for name, value in measures.items() if value > thresholds[name]]
+    return dict(measures, thresholds=dict(thresholds), exceeded=exceeded, refit_recommended=bool(exceeded))
+
+
+def assign(df, model, is_new_import=True, thresholds=DRIFT_THRESHOLDS):
+    """
+    Assign rows with the columns of out_of_core.row_features to the model's clusters.
+
+    Returns (df with stage1_cluster, stage2_cluster, cluster_name and distance columns, drift
+    report). Combinations stage 2 has not seen take the cluster of the closest one seen.
+    """
+    # Imported here: out_of_core loads the whole pipeline module
+    from out_of_core import assign_patterns
+
+    df = df.copy()
+    codes = encode_stage1(df, model['encoders'])
+    stage1, distances, _ = hamming_assign(codes, np.asarray(model['centroids'], dtype=np.int64))
+    df['stage1_cluster'] = stage1
+
+    combinations = pd.DataFrame(model['stage2']['rows'], columns=STAGE2_FEATURES)
+    combinations['stage1_cluster'] = combinations['stage1_cluster'].astype(np.int64)
+    slots, _ = assign_patterns(df, combinations, features=STAGE2_FEATURES)
+    df['stage2_cluster'] = np.asarray(model['stage2']['clusters'], dtype=np.int64)[slots]
+
+    names = df['stage2_cluster'].astype(str).map(model['cluster_names'])
+    if is_new_import:
+        names = names.map(lambda name: name if not isinstance(name, str) or name.startswith('New: ')
+                          else f"New: {name}")
+    df['cluster_name'] = names
+    df['distance'] = distances
+    return df, drift_report((codes < 0).any(axis=1), distances, stage1, model, thresholds=thresholds)
+
+
+def save_model(model, path):
+    """Write model to path, replacing any previous model atomically."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        f.write(fast_json.dumps(model))
+    os.replace(tmp_path, path)
+
+
+def load_model(path):
+    """The model saved at path. Raises FileNotFoundError if there is none."""
+    import json
+
+    with open(path) as f:
+        model = json.load(f)
+    if model.get('format') != MODEL_FORMAT:
+        raise ValueError(f"Unsupported segmentation model format {model.get('format')!r}")
+    return model
+
+
+class ModelStore:
+    """The max_models most recently stored models in directory, by model id."""
+
+    def __init__(self, directory, max_models=64):
+        self.directory = directory
+        self.max_models = max_models
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, model_id):
+        # Model ids are uuid hex, so anything else cannot name a model
+        if not model_id or not all(c in '0123456789abcdef' for c in model_id):
+            raise KeyError(model_id)
+        return os.path.join(self.directory, f'{model_id}.json')
+
+    def put(self, model):
+        """Store model (again, if it is already stored); returns its id."""
+        with self._lock:
+            save_model(model, self._path(model['model_id']))
+            entries = sorted((entry.stat().st_mtime, entry.path) for entry in os.scandir(self.directory)
+                             if entry.name.endswith('.json'))
+            for _, path in entries[:max(0, len(entries) - self.max_models)]:
+                os.remove(path)
+        return model['model_id']
+
+    def get(self, model_id):
+        """The stored model. Raises KeyError for an unknown or evicted model id, ValueError for a
+        model saved in another format."""
+        try:
+            return load_model(self._path(model_id))
+        except FileNotFoundError:
+            raise KeyError(model_id)
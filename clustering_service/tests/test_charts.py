@@ -0,0 +1,55 @@
+import pathlib
+import sys
+
+import numpy as np
+import pytest
+from scipy.cluster.hierarchy import dendrogram, linkage
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import charts
+from charts import CHARTS, ChartStore, truncated_linkage
+
+
+def test_truncated_linkage_draws_the_truncated_dendrogram():
+    Z = linkage(np.random.default_rng(2).random((200, 3)), method='ward')
+    small, labels = truncated_linkage(Z, p=30)
+    assert small.shape == (29, 4)
+
+    expected = dendrogram(Z, truncate_mode='lastp', p=30, no_plot=True)
+    drawn = dendrogram(small, labels=labels, no_plot=True)
+    assert drawn['ivl'] == expected['ivl']
+    assert np.allclose(drawn['dcoord'], expected['dcoord'])
+
+
+def test_chart_store_renders_once_and_evicts_old_runs():
+    store = ChartStore(max_runs=2)
+    series = {'metrics_chart': {'categories': ['Silhouette Score', 'Davies-Bouldin Index', 'Calinski-Harabasz Index'],
+                                'series': [{'name': 'K-modes', 'data': [0.4, 1.2, 300.0]},
+                                           {'name': 'Hierarchical', 'data': [0.6, 0.9, 500.0]}]}}
+    run_id = store.put(series)
+    png = store.render(run_id, 'metrics_chart')
+    assert png.startswith(b'\x89PNG')
+    assert store.render(run_id, 'metrics_chart') is png
+    assert store.charts(run_id) == ['metrics_chart'] and set(store.charts(run_id)) <= set(CHARTS)
+
+    with pytest.raises(KeyError):
+        store.render(run_id, 'dendrogram')
+    store.put(series)
+    store.put(series)
+    with pytest.raises(KeyError):
+        store.render(run_id, 'metrics_chart')
+
+
+def test_chart_store_renders_outside_its_lock(monkeypatch):
+    store = ChartStore()
+    run_id = store.put({'metrics_chart': {}})
+    locked = []
+
+    def render(name, series):
+        locked.append(store._lock.locked())
+        return b'png'
+
+    monkeypatch.setattr(charts, 'render_chart', render)
+    assert store.render(run_id, 'metrics_chart') == b'png'
+    assert locked == [False]
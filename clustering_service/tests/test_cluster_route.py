@@ -1,7 +1,13 @@
+import asyncio
+import json
 import os
 import pathlib
 import sys
 import tempfile
+import threading
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
 import pandas as pd
 import pytest
 from httpx import AsyncClient, ASGITransport
@@ -10,7 +16,47 @@ from asgi_lifespan import LifespanManager
 # Add the parent folder to sys.path
 sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
 
+import clustering_service
 from clustering_service import app
+from clustering_jobs import JobManager, warmup_upload
+from columnar import ARROW_AVAILABLE, decode_columns
+from result_cache import ResultCache
+from result_store import ResultStore
+from segmentation_model import ModelStore
+
+
+def upload(csv, name="test.csv"):
+    return {"file": (name, csv, "text/csv")}
+
+
+@pytest.fixture(scope="module")
+def small_csv():
+    """24 rows over a personal and two university domains: enough for every pipeline stage"""
+    return warmup_upload().to_csv(index=False).encode()
+
+
+@pytest.fixture
+def result_cache(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / "cache"))
+    monkeypatch.setattr(clustering_service, "RESULT_CACHE", cache)
+    return cache
+
+
+@pytest.fixture
+def job_manager(monkeypatch):
+    # Requested before client, so the service starts (and stops) this pool
+    manager = JobManager(max_workers=1)
+    monkeypatch.setattr(clustering_service, "JOB_MANAGER", manager)
+    yield manager
+    manager.shutdown()
+
+
+@pytest.fixture
+async def client():
+    async with LifespanManager(app):
+        async with AsyncClient(transport=ASGITransport(app=app), base_url="http://testserver") as client:
+            yield client
+
 
 @pytest.mark.asyncio
 async def test_cluster_endpoint_with_sample_csv():
@@ -40,3 +86,205 @@ async def test_cluster_endpoint_with_sample_csv():
     assert "records" in json_data
     assert "cluster_analysis" in json_data
     assert "metrics" in json_data
+
+
+async def test_charts_are_rendered_on_request(client, small_csv):
+    response = await client.post("/cluster", files=upload(small_csv))
+    visualization_data = response.json()["visualization_data"]
+    assert "chart_series" not in visualization_data and "dendrogram" not in visualization_data
+
+    run_id = visualization_data["chart_run_id"]
+    assert "dendrogram" in visualization_data["charts"]
+    chart = await client.get(f"/charts/{run_id}/dendrogram")
+    missing = await client.get(f"/charts/{run_id}/not-a-chart")
+
+    assert chart.status_code == 200 and chart.headers["content-type"] == "image/png"
+    assert missing.status_code == 404
+
+
+async def test_identical_uploads_are_served_from_the_result_cache(result_cache, client, small_csv):
+    responses = []
+    for params in [{}, {}, {"use_cache": False}, {"is_new_import": True}]:
+        responses.append(await client.post("/cluster", files=upload(small_csv), params=params))
+    stats = (await client.get("/cache/stats")).json()
+
+    assert [r.headers["X-Cache"] for r in responses] == ["MISS", "HIT", "MISS", "MISS"]
+    assert responses[1].json()["records"] == responses[0].json()["records"]
+    # The bypassed request neither looks up nor counts, but refreshes its entry
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 2)
+
+
+async def test_a_result_that_cannot_be_cached_is_still_returned(result_cache, monkeypatch, client, small_csv):
+    def disk_full(key, value):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(result_cache, "put", disk_full)
+    response = await client.post("/cluster", files=upload(small_csv))
+
+    assert response.status_code == 200 and response.headers["X-Cache"] == "MISS"
+    # The pipeline's result, not the domain-grouping fallback (which has no metrics)
+    assert "processing_time_seconds" in response.json()["metrics"]
+
+
+async def test_uploads_are_parsed_off_the_event_loop(result_cache, monkeypatch, client, small_csv):
+    threads = []
+    ingest_upload = clustering_service.ingest_upload
+
+    def recording_ingest_upload(file):
+        threads.append(threading.current_thread())
+        return ingest_upload(file)
+
+    monkeypatch.setattr(clustering_service, "ingest_upload", recording_ingest_upload)
+    await client.post("/cluster", files=upload(small_csv))
+    # A cache hit, so the job completes without a worker
+    await client.post("/jobs", files=upload(small_csv))
+
+    assert len(threads) == 2 and threading.main_thread() not in threads
+
+
+async def test_job_api_runs_the_pipeline_in_a_worker_process(result_cache, job_manager, client, small_csv):
+    submitted = await client.post("/jobs", files=upload(small_csv))
+    job_id = submitted.json()["job_id"]
+    assert submitted.status_code == 202
+
+    for _ in range(600):
+        status = (await client.get(f"/jobs/{job_id}")).json()
+        if status["status"] in ("completed", "failed"):
+            break
+        await asyncio.sleep(0.1)
+    progress = (await client.get(f"/jobs/{job_id}/progress")).json()
+    result = await client.get(f"/jobs/{job_id}/result")
+    unknown = await client.get("/jobs/not-a-job")
+    # The finished job's result is cached, so resubmitting completes at once
+    resubmitted = (await client.post("/jobs", files=upload(small_csv))).json()
+
+    assert status["status"] == "completed" and status["started_at"] <= status["finished_at"]
+    assert progress == {"job_id": job_id, "status": "completed", "stage": "done", "progress": 1.0}
+    assert result.status_code == 200 and len(result.json()["records"]) == 24
+    assert unknown.status_code == 404
+    assert resubmitted["status"] == "completed"
+
+
+async def test_a_dead_worker_is_retried_then_reported_as_unavailable(monkeypatch, client, small_csv):
+    runs = []
+
+    def run_on_dead_worker(*args, **kwargs):
+        runs.append(args)
+        future = Future()
+        future.set_exception(BrokenProcessPool("A process in the process pool was terminated abruptly"))
+        return future
+
+    monkeypatch.setattr(clustering_service.JOB_MANAGER, "run", run_on_dead_worker)
+    response = await client.post("/cluster", files=upload(small_csv), params={"use_cache": False})
+
+    # Not the domain-grouping fallback, which only stands in for pipeline errors
+    assert response.status_code == 503
+    assert len(runs) == 2
+
+
+async def test_streamed_response_matches_the_json_response(result_cache, monkeypatch, client, small_csv):
+    monkeypatch.setattr(clustering_service, "NDJSON_CHUNK_ROWS", 10)
+    expected = await client.post("/cluster", files=upload(small_csv))
+    streams = [await client.post("/cluster", files=upload(small_csv), params={"stream": True, **params})
+               for params in [{"use_cache": False}, {}]]
+
+    expected = expected.json()
+    columns = ["Email", "domain_type", "stage1_cluster", "stage2_cluster", "cluster_name"]
+    for streamed, cache in zip(streams, ["MISS", "HIT"]):
+        assert streamed.headers["content-type"] == "application/x-ndjson"
+        assert streamed.headers["X-Cache"] == cache
+        summary, *records = [json.loads(line) for line in streamed.text.splitlines()]
+        assert summary["record_count"] == len(records) == 24
+        assert summary["cluster_analysis"] == expected["cluster_analysis"]
+        assert ([{key: record[key] for key in columns} for record in records] ==
+                [{key: record[key] for key in columns} for record in expected["records"]])
+
+
+async def test_columnar_format_sends_each_record_once(client, small_csv):
+    records = (await client.post("/cluster", files=upload(small_csv))).json()
+    columnar = await client.post("/cluster", files=upload(small_csv), params={"format": "columnar"})
+    arrow = await client.post("/cluster", files=upload(small_csv), params={"format": "arrow"})
+    invalid = await client.post("/cluster", files=upload(small_csv), params={"format": "columnar", "stream": True})
+
+    payload = columnar.json()
+    assert payload["length"] == 24 and "tsne_data" not in payload["visualization_data"]
+    assert "university_name_filled" not in payload["columns"] and "tld_encoded" not in payload["columns"]
+    decoded = decode_columns(payload)
+    expected = pd.DataFrame(records["records"])
+    assert decoded["Email"].tolist() == expected["Email"].tolist()
+    assert decoded["stage2_cluster"].tolist() == expected["stage2_cluster"].tolist()
+    assert payload["cluster_analysis"] == records["cluster_analysis"]
+    assert len(columnar.content) < len(json.dumps(records)) / 2
+    assert arrow.status_code == (200 if ARROW_AVAILABLE else 501)
+    assert invalid.status_code == 400
+
+
+async def test_summary_format_pages_records_per_cluster(tmp_path, monkeypatch, client, small_csv):
+    monkeypatch.setattr(clustering_service, "RESULT_STORE", ResultStore(str(tmp_path)))
+    summary = (await client.post("/cluster", files=upload(small_csv), params={"format": "summary"})).json()
+    run = (await client.get(f"/runs/{summary['run_id']}")).json()
+    cluster = summary["clusters"][0]
+    records_url = f"/runs/{summary['run_id']}/clusters/{cluster['cluster_id']}/records"
+    pages, cursor = [], 0
+    while cursor is not None:
+        page = (await client.get(records_url, params={"cursor": cursor, "limit": 2})).json()
+        pages.append(page)
+        cursor = page["next_cursor"]
+    filtered = (await client.get(records_url, params={"domain_type": "personal"})).json()
+    missing = await client.get(f"/runs/{summary['run_id']}/clusters/999/records")
+
+    assert "records" not in summary and "tsne_data" not in summary["visualization_data"]
+    assert run == summary
+    assert sum(c["count"] for c in summary["clusters"]) == summary["record_count"] == 24
+    records = [record for page in pages for record in page["records"]]
+    assert len(records) == pages[0]["total"] == cluster["count"]
+    assert all(record["stage2_cluster"] == cluster["cluster_id"] for record in records)
+    assert all(record["domain_type"] == "personal" for record in filtered["records"])
+    assert filtered["total"] == sum(record["domain_type"] == "personal" for record in records)
+    assert missing.status_code == 404
+
+
+async def test_fast_json_response_matches_the_validated_response(monkeypatch, client, small_csv):
+    responses = []
+    for fast in [True, False]:
+        monkeypatch.setattr(clustering_service, "FAST_JSON", fast)
+        responses.append(await client.post("/cluster", files=upload(small_csv), params={"use_cache": False}))
+    schema = (await client.get("/openapi.json")).json()
+
+    fast, validated = [response.json() for response in responses]
+    assert fast["records"] == validated["records"]
+    assert fast["cluster_analysis"] == validated["cluster_analysis"]
+    assert [r.headers["X-Cache"] for r in responses] == ["MISS", "MISS"]
+    # The response model still documents /cluster
+    response_schema = schema["paths"]["/cluster"]["post"]["responses"]["200"]["content"]["application/json"]["schema"]
+    assert response_schema["$ref"].endswith("/ClusterResult")
+
+
+async def test_assign_places_new_imports_in_the_segmentation_of_a_run(tmp_path, monkeypatch, result_cache,
+                                                                       client, small_csv):
+    monkeypatch.setattr(clustering_service, "MODEL_STORE", ModelStore(str(tmp_path / "models")))
+    other_csv = pd.DataFrame({"Email": [f"user{i}@{domain}" for i, domain in enumerate(["yahoo.com", "uom.lk"] * 12)],
+                              "Keyword Category": ["IT", "Finance", "Marketing"] * 8}).to_csv(index=False).encode()
+    new_csv = pd.DataFrame({"Email": ["new1@gmail.com", "new2@sliit.lk", "new3@proton.me"],
+                            "Keyword Category": ["AI", "Finance", "AI"]}).to_csv(index=False).encode()
+
+    fitted = (await client.post("/cluster", files=upload(small_csv))).json()
+    other = (await client.post("/cluster", files=upload(other_csv))).json()
+    new_import = (await client.post("/cluster", files=upload(other_csv), params={"is_new_import": True})).json()
+    # A cache hit of the first upload after the model store lost its model
+    (tmp_path / "models" / f"{fitted['model_id']}.json").unlink()
+    hit = await client.post("/cluster", files=upload(small_csv))
+    assigned = (await client.post("/assign", files=upload(new_csv, "new.csv"),
+                                  params={"model_id": fitted["model_id"]})).json()
+    unknown = await client.post("/assign", files=upload(new_csv, "new.csv"), params={"model_id": "0" * 32})
+
+    assert fitted["model_id"] != other["model_id"] and new_import["model_id"] is None
+    assert hit.headers["X-Cache"] == "HIT" and hit.json()["model_id"] == fitted["model_id"]
+    assert assigned["model_id"] == fitted["model_id"]
+    assert assigned["record_count"] == len(assigned["records"]) == 3
+    assert sum(assigned["cluster_counts"].values()) == 3
+    names = set(fitted["cluster_analysis"]["cluster_names"].values())
+    assert all(record["cluster_name"].removeprefix("New: ") in names for record in assigned["records"])
+    # proton.me is a domain the segmentation has never seen
+    assert assigned["drift"]["unseen_rate"] == pytest.approx(1 / 3)
+    assert unknown.status_code == 404
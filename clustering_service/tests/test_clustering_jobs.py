@@ -0,0 +1,62 @@
+import os
+import pathlib
+import signal
+import sys
+import time
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+from clustering_jobs import JobManager, warmup_upload
+
+
+def test_start_warms_every_worker_before_requests(tmp_path):
+    manager = JobManager(max_workers=1, warmup_config={'kmodes_engine': 'numpy'})
+    try:
+        warmup = manager.start()
+        assert len(warmup) == 1 and all(seconds > 0 for seconds in warmup.values())
+
+        path = tmp_path / "emails.csv"
+        warmup_upload().to_csv(path, index=False)
+        result = manager.run(str(path), pipeline_config={'kmodes_engine': 'numpy'}).result(timeout=120)
+        assert len(result['clustered_data']) == 24
+        # run() leaves the file to the caller
+        assert path.exists()
+    finally:
+        manager.shutdown()
+
+
+def test_a_killed_worker_does_not_break_later_runs():
+    manager = JobManager(max_workers=1)
+    try:
+        (pid,) = manager.start()
+        os.kill(pid, signal.SIGKILL)
+        # The executor notices the dead worker and marks itself broken
+        time.sleep(1)
+
+        result = manager.run(warmup_upload(), pipeline_config={'kmodes_engine': 'numpy'}).result(timeout=120)
+        assert len(result['clustered_data']) == 24
+
+        # A job whose worker dies mid-run is run again on a new pool
+        (pid,) = manager.start()
+        job_id = manager.submit(warmup_upload(), pipeline_config={'kmodes_engine': 'numpy'})
+        time.sleep(0.5)
+        os.kill(pid, signal.SIGKILL)
+        for _ in range(1200):
+            if manager.status(job_id)['status'] in ('completed', 'failed'):
+                break
+            time.sleep(0.1)
+        assert manager.status(job_id)['status'] == 'completed'
+    finally:
+        manager.shutdown()
+
+
+def test_workers_cap_joblib_at_their_share_of_the_cores(monkeypatch):
+    monkeypatch.setattr(os, 'cpu_count', lambda: 8)
+    assert JobManager(max_workers=4).cpus_per_worker == 2
+    assert JobManager(max_workers=16).cpus_per_worker == 1
+
+    manager = JobManager(max_workers=1, cpus_per_worker=3)
+    try:
+        assert manager._submit(os.getenv, 'LOKY_MAX_CPU_COUNT').result(timeout=60) == '3'
+    finally:
+        manager.shutdown()
@@ -0,0 +1,59 @@
+import io
+import json
+import pathlib
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+from columnar import decode_columns, encode_arrow, encode_columns
+
+
+@pytest.fixture
+def clustered():
+    return pd.DataFrame({
+        'Email': ['a@sliit.lk', 'b@gmail.com', 'c@sliit.lk'],
+        'Keyword Category': ['AI', 'Finance', 'AI'],
+        'domain_type': ['academic', 'personal', 'academic'],
+        'university_name': ['Sri Lanka Institute of Information Technology', None,
+                            'Sri Lanka Institute of Information Technology'],
+        'domain_type_encoded': [0, 1, 0],
+        'university_name_filled': ['SLIIT', 'Unknown', 'SLIIT'],
+        'stage2_cluster': np.array([3, 1, 3], dtype=np.int32),
+        'cluster_name': ['AI Students', np.nan, 'AI Students'],
+        'x': [0.1, -2.5, 1 / 3],
+        'y': [1.0, 2.0, 3.0],
+        'z': [1, 1, 1],
+    })
+
+
+def test_columns_are_selected_and_dictionary_encoded(clustered):
+    payload = json.loads(json.dumps(encode_columns(clustered)))
+    assert list(payload['types']) == ['Email', 'Keyword Category', 'domain_type', 'university_name',
+                                      'stage2_cluster', 'cluster_name', 'x', 'y']
+    assert payload['types']['domain_type'] == 'dictionary'
+    assert payload['columns']['domain_type'] == {'dictionary': ['academic', 'personal'], 'codes': [0, 1, 0]}
+    assert payload['columns']['university_name']['codes'] == [0, -1, 0]
+    # Coordinates go out as their shortest float32 form
+    assert payload['columns']['x'] == [0.1, -2.5, 0.33333334]
+
+
+def test_decoding_gives_back_the_selected_columns(clustered):
+    decoded = decode_columns(json.loads(json.dumps(encode_columns(clustered))))
+    expected = clustered[decoded.columns]
+    for column in ['Email', 'Keyword Category', 'domain_type', 'stage2_cluster']:
+        assert decoded[column].tolist() == expected[column].tolist()
+    assert decoded['university_name'].tolist()[1] is None and decoded['cluster_name'].tolist()[1] is None
+    assert np.allclose(decoded['x'], expected['x'], rtol=1e-6)
+
+
+def test_arrow_stream_round_trip(clustered):
+    pa = pytest.importorskip('pyarrow')
+    table = pa.ipc.open_stream(io.BytesIO(encode_arrow(clustered, metadata={'summary': '{}'}))).read_all()
+    assert table.column_names == list(encode_columns(clustered)['types'])
+    assert pa.types.is_dictionary(table.schema.field('domain_type').type)
+    assert table.schema.field('x').type == pa.float32()
+    assert table.schema.metadata[b'summary'] == b'{}'
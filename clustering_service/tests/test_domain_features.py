@@ -0,0 +1,60 @@
+import pathlib
+import sys
+
+import pandas as pd
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import clustering_script as cs
+
+EMAILS = [
+    "student1@university.edu", "test@gmail.com", "info@institute.ac.lk", "Mixed@GMAIL.Com",
+    "a@my.sliit.lk", "b@kdu.ac.lk", "c@ac.lk", "d@x.ac.uk", "e@health.gov.lk", "f@unicef.org",
+    "g@redcross.org.lk", "h@wso2.com", "i@virtusa.io", "j@abc.xyz", "k@a.lk@b.com", "l@", "no-at-sign",
+    "m@gmail.com.", "n@openschool.edu.lk", "o@ÄBC.LK", None, 42,
+]
+
+
+def test_vectorized_domain_features_match_scalar_helpers():
+    df = cs.add_domain_features(pd.DataFrame({"Email": EMAILS}))
+
+    expected_domains = [cs.extract_domain(e) for e in EMAILS]
+    assert df["domain"].tolist() == expected_domains
+    assert df["domain_type"].tolist() == [cs.get_domain_type(d) for d in expected_domains]
+    assert df["tld"].tolist() == [cs.extract_tld(d) for d in expected_domains]
+    assert df["is_sri_lankan"].tolist() == [cs.is_sri_lankan(d) for d in expected_domains]
+
+
+def test_single_label_domain_resolves_to_itself():
+    domains = pd.Series(["localhost", "example.com"])
+    assert cs.extract_tlds(domains).tolist() == ["localhost", "com"]
+    assert cs.classify_domain_types(domains).tolist() == ["other", "corporate"]
+
+
+def test_prepare_for_clustering_broadcasts_per_domain_features():
+    emails = ["a@sliit.lk", "b@gmail.com", "c@sliit.lk", "d@uom.lk", "e@gmail.com", "f@mit.edu"]
+    df = cs.add_domain_features(pd.DataFrame({"Email": emails, "Keyword Category": list("ABABAC")}))
+    df, X, encoders = cs.prepare_for_clustering(df)
+
+    assert df["university_name"].tolist() == [cs.identify_university(d) for d in df["domain"]]
+    assert df["is_identified_university"].tolist() == [1, 0, 1, 1, 0, 0]
+    assert df["academic_level"].tolist() == [2, 0, 2, 2, 0, 1]
+    assert list(encoders["tld"].classes_) == ["com", "edu", "lk"]
+    assert X[:, 2].tolist() == [2, 0, 2, 2, 0, 1]
+
+
+def test_map_domain_features_keeps_missing_domains():
+    domains = pd.Series(["gmail.com", None, "gmail.com"])
+    features = cs.map_domain_features(domains, lambda d: pd.DataFrame({"n": d.apply(lambda x: -1 if x is None else len(x))}))
+    assert features["n"].tolist() == [9, -1, 9]
+
+
+def test_university_index_matches_triple_scan():
+    domains = [
+        "kdu.ac.lk", "sliit.lk", "my.sliit.lk", "stu.kln.ac.lk", "students.nsbm.ac.lk", "outlook.com",
+        "openai.com", "maritime-academy.org", "performingarts.lk", "lankabiz.com", "wusl.ac.lk",
+        "esnseu.lk", "xcmb.lk", "sabkdu.edu", "jaffna.ac.lk", "ouruh.ac.lk", "", "gmail.com",
+        "INFORMATION.TECH", "iit.edu.lk", "a.b.c.sjp",
+    ]
+    for domain in domains:
+        assert cs.identify_university(domain) == cs._identify_university_scan(domain), domain
@@ -0,0 +1,35 @@
+import pathlib
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+from embedding import embed_patterns
+
+
+def repeated_patterns(seed=3):
+    rng = np.random.default_rng(seed)
+    patterns = rng.integers(0, 4, (30, 4))
+    rows = rng.integers(0, len(patterns), 3000)
+    return patterns[rows], rows
+
+
+@pytest.mark.parametrize("method", ['tsne', 'pca'])
+def test_rows_sharing_a_pattern_land_together_and_layout_is_deterministic(method):
+    X, rows = repeated_patterns()
+    coords = embed_patterns(X, method=method, jitter=0.01)
+    assert coords.shape == (len(X), 2)
+    assert np.array_equal(coords, embed_patterns(X, method=method, jitter=0.01))
+
+    centres = np.array([coords[rows == p].mean(axis=0) for p in np.unique(rows)])
+    within = np.mean([coords[rows == p].std(axis=0).max() for p in np.unique(rows)])
+    assert within < 0.1 * centres.std(axis=0).max()
+
+
+def test_patterns_beyond_the_cap_reuse_their_closest_embedded_pattern():
+    X = np.array([[0, 0, 0]] * 50 + [[1, 1, 1]] * 40 + [[0, 0, 1]] * 2)
+    coords = embed_patterns(X, method='pca', max_points=2, jitter=0.0)
+    assert np.allclose(coords[-1], coords[0])
+    assert not np.allclose(coords[50], coords[0])
@@ -0,0 +1,34 @@
+import json
+import pathlib
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import fast_json
+from fast_json import dumps, frame_records
+
+VALUE = {'count': np.int64(3), 'score': np.float32(0.5), 'missing': float('nan'), 'infinite': np.inf,
+         'coords': np.array([1.5, np.nan]), 'nested': [{'k': np.bool_(True)}], 7: 'non-string key'}
+EXPECTED = {'count': 3, 'score': 0.5, 'missing': None, 'infinite': None, 'coords': [1.5, None],
+            'nested': [{'k': True}], '7': 'non-string key'}
+
+
+@pytest.mark.parametrize('use_orjson', [True, False])
+def test_numpy_values_and_nan(monkeypatch, use_orjson):
+    if use_orjson:
+        pytest.importorskip('orjson')
+    monkeypatch.setattr(fast_json, 'ORJSON_AVAILABLE', use_orjson)
+    assert json.loads(dumps(VALUE)) == EXPECTED
+
+
+def test_frame_records_match_to_dict():
+    frame = pd.DataFrame({'Email': ['a@b.lk', 'c@d.lk'], 'stage2_cluster': np.array([1, 2], dtype=np.int32),
+                          'x': [0.25, np.nan], 'university_name': ['UoM', None]})
+    records = frame_records(frame)
+    assert json.loads(dumps(records)) == json.loads(frame.to_json(orient='records'))
+    assert [type(record['stage2_cluster']) for record in records] == [int, int]
+    assert records[1]['university_name'] is None and np.isnan(records[1]['x'])
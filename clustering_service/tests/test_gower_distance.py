@@ -0,0 +1,43 @@
+import pathlib
+import sys
+
+import numpy as np
+import pandas as pd
+from gower import gower_matrix
+from scipy.spatial.distance import squareform
+from sklearn.metrics import silhouette_score
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+from cluster_metrics import weighted_silhouette_score
+from gower_distance import condensed_rows, gower_condensed
+
+
+def stage2_frame(n, seed=3):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'domain_type': rng.choice(['academic', 'corporate', 'other', None], n),
+        'Keyword Category': rng.choice(['IT', 'Finance', 'Health'], n),
+        'tld': rng.choice(['.lk', '.com', '.org'], n),
+        'stage1_cluster': rng.integers(0, 7, n).astype(np.uint16),
+    })
+
+
+def test_condensed_gower_matches_gower_matrix_across_chunks():
+    frame = stage2_frame(500)
+    expected = squareform(gower_matrix(frame), checks=False)
+    # A tiny chunk budget forces many row blocks
+    condensed = gower_condensed(frame, max_chunk_mb=0.05)
+    assert condensed.dtype == np.float32
+    np.testing.assert_allclose(condensed, expected, atol=1e-6)
+
+
+def test_condensed_rows_and_silhouette_match_square_matrix():
+    frame = stage2_frame(300)
+    condensed = gower_condensed(frame)
+    square = squareform(condensed)
+    np.testing.assert_allclose(condensed_rows(condensed, len(frame), np.arange(40, 90)), square[40:90])
+
+    labels = np.random.default_rng(0).integers(0, 4, len(frame))
+    expected = silhouette_score(square, labels, metric='precomputed')
+    assert np.isclose(weighted_silhouette_score(condensed, labels, metric='precomputed', chunk_size=64), expected)
@@ -0,0 +1,24 @@
+import json
+import pathlib
+import subprocess
+import sys
+
+import pytest
+
+SERVICE_DIR = pathlib.Path(__file__).resolve().parents[1]
+
+# Loaded by the pipeline stages that need them, never by importing the modules below
+HEAVY_PACKAGES = {'sklearn', 'scipy', 'matplotlib', 'kmodes', 'gower', 'seaborn'}
+
+
+def loaded_modules(module):
+    """sys.modules after importing module in a fresh interpreter."""
+    completed = subprocess.run([sys.executable, '-c', f'import json, sys, {module}; print(json.dumps(list(sys.modules)))'],
+                               cwd=SERVICE_DIR, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout.splitlines()[-1])
+
+
+@pytest.mark.parametrize("module", ['clustering_script', 'clustering_service'])
+def test_import_does_not_load_heavy_dependencies(module):
+    loaded = sorted(name for name in loaded_modules(module) if name.split('.')[0] in HEAVY_PACKAGES)
+    assert not loaded, f"importing {module} loads {loaded[:5]}"
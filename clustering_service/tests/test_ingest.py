@@ -0,0 +1,52 @@
+import hashlib
+import io
+import pathlib
+import sys
+
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+from ingest import CSVValidationError, read_upload
+
+
+@pytest.fixture(params=['c', 'pyarrow'])
+def engine(request):
+    if request.param == 'pyarrow':
+        pytest.importorskip('pyarrow')
+    return request.param
+
+
+CSV = (b"Name,Email,Phone,Keyword Category\n"
+       b"Ann,ann@sliit.lk,0771234567,AI\n"
+       b"Bob,bob@gmail.com,0712345678,Finance\n")
+
+
+def test_reads_only_pipeline_columns_and_hashes_every_byte(engine):
+    df, content_hash = read_upload(io.BytesIO(CSV), engine=engine)
+    assert df.columns.tolist() == ["Email", "Keyword Category"]
+    assert df["Email"].tolist() == ["ann@sliit.lk", "bob@gmail.com"]
+    assert content_hash.hexdigest() == hashlib.sha256(CSV).hexdigest()
+
+
+def test_small_chunks_bom_and_crlf(engine):
+    content = b"\xef\xbb\xbfEmail\r\n" + b"".join(b"user%d@uom.lk\r\n" % i for i in range(200))
+    df, content_hash = read_upload(io.BytesIO(content), chunk_size=16, engine=engine)
+    assert df.columns.tolist() == ["Email"]
+    assert len(df) == 200 and df["Email"].iloc[-1] == "user199@uom.lk"
+    assert content_hash.hexdigest() == hashlib.sha256(content).hexdigest()
+
+
+def test_numeric_looking_values_and_missing_cells_stay_strings_and_missing(engine):
+    df, _ = read_upload(io.BytesIO(b"Email,Keyword Category\n0123@x.lk,007\nann@uom.lk,\n"), engine=engine)
+    assert df["Keyword Category"].iloc[0] == "007"
+    assert df["Keyword Category"].isna().tolist() == [False, True]
+
+
+@pytest.mark.parametrize("content, message", [
+    (b"", "empty"),
+    (b"Name,Phone\nAnn,077\n", "'Email'"),
+])
+def test_rejects_upload_before_parsing(content, message, engine):
+    with pytest.raises(CSVValidationError, match=message):
+        read_upload(io.BytesIO(content), engine=engine)
@@ -0,0 +1,59 @@
+import pathlib
+import sys
+
+import numpy as np
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+from kmodes_engine import NumpyKModes, compute_modes, hamming_assign, split_centroids
+
+
+def categorical_rows(n, seed=5):
+    rng = np.random.default_rng(seed)
+    # Features shaped like X_kmodes: label-encoded categories plus 0/1 flags
+    return np.column_stack([rng.integers(0, 6, n), rng.integers(0, 8, n) * 3, rng.integers(0, 5, n),
+                            rng.integers(0, 2, n), rng.integers(0, 3, n)])
+
+
+def test_assignment_and_modes_match_brute_force():
+    codes = categorical_rows(300).astype(np.int32)
+    centroids = codes[[0, 10, 20, 30]]
+    labels, distances, cost = hamming_assign(codes, centroids, max_chunk_cells=64)
+    brute = np.array([[np.sum(row != c) for c in centroids] for row in codes])
+    np.testing.assert_array_equal(labels, brute.argmin(axis=1))
+    assert cost == brute.min(axis=1).sum()
+
+    modes, sizes = compute_modes(codes, labels, 4, codes.max(axis=0) + 1)
+    for ik in range(4):
+        members = codes[labels == ik]
+        expected = [np.bincount(column).argmax() for column in members.T]
+        np.testing.assert_array_equal(modes[ik], expected)
+        assert sizes[ik] == len(members)
+
+
+def test_fit_is_consistent_and_weights_equal_repeated_rows():
+    X = categorical_rows(400)
+    model = NumpyKModes(n_clusters=5, init='Huang', n_init=3, random_state=42).fit(X)
+    distances = (X[:, None, :] != model.cluster_centroids_[None]).sum(axis=2)
+    assert model.cost_ == distances[np.arange(len(X)), model.labels_].sum()
+    np.testing.assert_array_equal(model.predict(X), model.labels_)
+
+    patterns, inverse, counts = np.unique(X, axis=0, return_inverse=True, return_counts=True)
+    weighted = NumpyKModes(n_clusters=5, init='Huang', n_init=3, random_state=42)
+    weighted.fit(patterns, sample_weight=counts.astype(float))
+    assert weighted.cost_ == NumpyKModes(n_clusters=5, n_init=3, random_state=42).fit(patterns[inverse]).cost_
+
+
+def test_fewer_distinct_rows_than_clusters():
+    X = np.array([[0, 1], [0, 1], [2, 3], [2, 3], [2, 3]])
+    model = NumpyKModes(n_clusters=4, random_state=0).fit(X)
+    assert model.cost_ == 0 and len(model.cluster_centroids_) == 2
+
+
+def test_split_adds_the_row_with_the_largest_cost_reduction():
+    codes = np.array([[0, 0, 0], [0, 0, 1], [1, 1, 1], [1, 1, 2]], dtype=np.int32)
+    weights = np.array([5.0, 1.0, 3.0, 1.0])
+    centroids = codes[[0]]
+    init = split_centroids(codes, centroids, np.zeros(4, dtype=np.intp), weights)
+    np.testing.assert_array_equal(init, [[0, 0, 0], [1, 1, 1]])
+    assert split_centroids(codes, codes, np.arange(4), weights) is None
@@ -0,0 +1,92 @@
+import pathlib
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+from out_of_core import PATTERN_FEATURES, assign_patterns, fit_patterns, row_features, run_out_of_core, scan_csv
+
+# Academic domains all name a university: an academic cluster without one trips a known
+# naming bug in generate_meaningful_cluster_name
+DOMAINS = ['gmail.com', 'yahoo.com', 'sliit.lk', 'uom.lk', 'kdu.ac.lk', 'wso2.com', 'dialog.lk',
+           'health.gov.lk', 'unicef.org', 'virtusa.io', 'company1.com']
+KEYWORDS = ['AI', 'Marketing', 'Finance', 'Data Science', 'IT']
+
+
+@pytest.fixture
+def email_csv(tmp_path):
+    rng = np.random.default_rng(0)
+    n_rows = 900
+    df = pd.DataFrame({'Name': [f'n{i}' for i in range(n_rows)],
+                       'Email': [f'user{i}@{domain}' for i, domain in enumerate(rng.choice(DOMAINS, n_rows))],
+                       'Keyword Category': rng.choice(KEYWORDS, n_rows)})
+    path = tmp_path / 'emails.csv'
+    df.to_csv(path, index=False)
+    return path
+
+
+def test_scan_keeps_a_bounded_sample_and_counts_every_row(email_csv):
+    sample, stats = scan_csv(email_csv, sample_size=100, chunk_size=64)
+    assert len(sample) == 100
+    assert sample.columns.tolist() == ['Email', 'Keyword Category']
+    assert sample['Email'].is_unique
+    assert stats['rows'] == stats['rows_with_domain'] == 900
+    assert stats['unique_domains'] == len(DOMAINS)
+    assert sum(stats['keyword_categories'].values()) == 900
+    # The same seed draws the same sample
+    again, _ = scan_csv(email_csv, sample_size=100, chunk_size=300)
+    assert sample['Email'].tolist() == again['Email'].tolist()
+
+
+def test_row_features_leave_the_input_untouched():
+    upload = pd.DataFrame({'Email': ['a@gmail.com', 'b@sliit.lk'], 'Keyword Category': ['AI', 'IT'], 'Name': ['a', 'b']})
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', pd.errors.SettingWithCopyWarning)
+        features = row_features(upload[['Email', 'Keyword Category']])
+    assert upload.columns.tolist() == ['Email', 'Keyword Category', 'Name']
+    assert set(PATTERN_FEATURES) <= set(features.columns)
+
+
+def test_unseen_patterns_go_to_the_closest_pattern():
+    known = row_features(pd.DataFrame({'Email': ['a@gmail.com', 'b@sliit.lk'], 'Keyword Category': ['AI', 'IT']}))
+    patterns = known[PATTERN_FEATURES].assign(stage1_cluster=[0, 1]).reset_index(drop=True)
+    rows = row_features(pd.DataFrame({'Email': ['c@gmail.com', 'd@gmail.com', 'e@sliit.lk'],
+                                      'Keyword Category': ['AI', 'Finance', 'Finance']}))
+    slots, unmatched = assign_patterns(rows, patterns)
+    assert slots.tolist() == [0, 0, 1]
+    assert unmatched.tolist() == [False, True, True]
+
+
+def test_patterns_with_a_missing_keyword_are_kept():
+    clustered = row_features(pd.DataFrame({'Email': ['a@gmail.com', 'b@gmail.com'], 'Keyword Category': ['AI', np.nan]}))
+    clustered = clustered.assign(stage1_cluster=[0, 1], stage2_cluster=[0, 1], cluster_name=['A', 'B'],
+                                 x=[0.0, 1.0], y=[0.0, 1.0])
+    patterns = fit_patterns(clustered)
+    slots, unmatched = assign_patterns(clustered, patterns)
+    assert len(patterns) == 2
+    assert patterns['stage2_cluster'].to_numpy()[slots].tolist() == [0, 1]
+    assert not unmatched.any()
+
+
+def test_out_of_core_assigns_every_row(email_csv, tmp_path):
+    output_path = tmp_path / 'clustered.csv'
+    result = run_out_of_core(email_csv, output_path, sample_size=300, chunk_size=200, kmodes_engine='numpy',
+                             embedding={'method': 'pca', 'max_points': 5000, 'jitter': 0.05})
+
+    clustered = pd.read_csv(output_path)
+    assert len(clustered) == 900
+    assert clustered['stage2_cluster'].notna().all()
+    assert 'clustered_data' not in result
+    assert result['out_of_core']['sample_rows'] == 300
+    assert len(result['tsne_data']) == 300
+    # Summaries count the whole file, not the sample
+    for stage in ['stage1_summary', 'stage2_summary']:
+        assert sum(record['count'] for record in result['cluster_analysis'][stage]) == 900
+    assert np.asarray(result['cluster_analysis']['domain_distribution']['data']).sum() == 900
+    # Rows with a pattern seen in the sample get that pattern's clusters
+    per_pattern = clustered.assign(**row_features(clustered[['Email', 'Keyword Category']])[PATTERN_FEATURES])
+    assert (per_pattern.groupby(PATTERN_FEATURES)['stage2_cluster'].nunique() == 1).all()
@@ -0,0 +1,54 @@
+import hashlib
+import os
+import pathlib
+import sys
+import time
+
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+from result_cache import ResultCache, content_key
+
+
+def test_key_covers_content_and_options():
+    content = hashlib.sha256(b"Email\na@b.com\n")
+    key = content_key(content, False, {"dedup": False})
+    assert key == content_key(hashlib.sha256(b"Email\na@b.com\n"), False, {"dedup": False})
+    assert key != content_key(content, True, {"dedup": False})
+    assert key != content_key(content, False, {"dedup": True})
+    assert key != content_key(hashlib.sha256(b"Email\nc@d.com\n"), False, {"dedup": False})
+
+
+def test_size_bound_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=2500)
+    payload = {"records": ["x" * 1000]}
+    cache.put("a", payload)
+    cache.put("b", payload)
+    # Make "a" the most recently used before a third entry forces an eviction
+    past = time.time() - 60
+    os.utime(tmp_path / "b.json", (past, past))
+    os.utime(tmp_path / "a.json", (past - 60, past - 60))
+    assert cache.get("a") == payload
+    cache.put("c", payload)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == payload and cache.get("c") == payload
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (3, 1, 2)
+    assert stats["bytes"] <= 2500
+
+
+def test_failed_put_leaves_no_partial_entry(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path))
+    with pytest.raises(TypeError):
+        cache.put("a", {"records": [object()]})
+
+    def disk_full(src, dst):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(os, "replace", disk_full)
+    with pytest.raises(OSError):
+        cache.put("b", {"records": []})
+    assert os.listdir(tmp_path) == []
+    assert cache.get("a") is None and cache.get("b") is None
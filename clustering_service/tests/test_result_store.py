@@ -0,0 +1,71 @@
+import os
+import pathlib
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+from result_store import ResultStore
+
+
+@pytest.fixture
+def clustered():
+    n_rows = 50
+    return pd.DataFrame({
+        'Email': [f'user{i}@example.lk' for i in range(n_rows)],
+        'domain_type': ['academic', 'personal'] * (n_rows // 2),
+        'university_name': ['University of Moratuwa', None, None, 'University of Colombo', None] * (n_rows // 5),
+        'university_name_filled': ['x'] * n_rows,
+        'stage2_cluster': np.arange(n_rows) % 3 + 1,
+        'cluster_name': [f'Cluster {i % 3 + 1}' for i in range(n_rows)],
+        'x': np.linspace(0, 1, n_rows),
+        'y': np.zeros(n_rows),
+    })
+
+
+def test_pages_walk_a_cluster_in_order(tmp_path, clustered):
+    store = ResultStore(str(tmp_path))
+    run_id = store.put(clustered, {'metrics': {'m': 1}})
+    meta = store.meta(run_id)
+    assert [(c['cluster_id'], c['count'], c['cluster_name']) for c in meta['clusters']] == \
+        [(1, 17, 'Cluster 1'), (2, 17, 'Cluster 2'), (3, 16, 'Cluster 3')]
+    assert meta['summary'] == {'metrics': {'m': 1}}
+
+    emails, cursor = [], 0
+    while cursor is not None:
+        records, cursor, total = store.records(run_id, 2, cursor=cursor, limit=5)
+        emails += [record['Email'] for record in records]
+    assert total == 17
+    assert emails == clustered.loc[clustered['stage2_cluster'] == 2, 'Email'].tolist()
+    assert 'university_name_filled' not in records[0]
+
+
+def test_filters_and_unknown_runs(tmp_path, clustered):
+    store = ResultStore(str(tmp_path))
+    run_id = store.put(clustered, {})
+    expected = clustered[(clustered['stage2_cluster'] == 1) & (clustered['domain_type'] == 'academic') &
+                         (clustered['university_name'] == 'University of Moratuwa')]
+    records, cursor, total = store.records(run_id, 1, filters={'domain_type': 'academic',
+                                                               'university_name': 'University of Moratuwa'})
+    assert [record['Email'] for record in records] == expected['Email'].tolist() and total == len(expected)
+    assert cursor is None
+    assert store.records(run_id, 1, filters={'domain_type': 'government'})[0] == []
+    with pytest.raises(KeyError):
+        store.records(run_id, 99)
+    with pytest.raises(KeyError):
+        store.meta('../etc')
+
+
+def test_runs_expire_after_the_ttl(tmp_path, clustered):
+    store = ResultStore(str(tmp_path), ttl_seconds=60)
+    old, fresh = store.put(clustered, {}), store.put(clustered, {})
+    stale = time.time() - 120
+    os.utime(tmp_path / old, (stale, stale))
+    with pytest.raises(KeyError):
+        store.meta(old)
+    assert store.meta(fresh)['expires_at'] > time.time()
+    assert sorted(os.listdir(tmp_path)) == [fresh]
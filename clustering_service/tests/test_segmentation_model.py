@@ -0,0 +1,84 @@
+import contextlib
+import io
+import pathlib
+import sys
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+from clustering_script import main
+from out_of_core import row_features
+from segmentation_model import ModelStore, assign, load_model, save_model
+
+# Academic domains all name a university (see test_out_of_core.py)
+DOMAINS = ['gmail.com', 'yahoo.com', 'sliit.lk', 'uom.lk', 'kdu.ac.lk', 'wso2.com', 'dialog.lk',
+           'health.gov.lk', 'unicef.org', 'virtusa.io']
+KEYWORDS = ['AI', 'Marketing', 'Finance', 'Data Science', 'IT']
+
+
+def emails(n_rows, domains=DOMAINS, keywords=KEYWORDS, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'Email': [f'user{i}@{domain}' for i, domain in enumerate(rng.choice(domains, n_rows))],
+                         'Keyword Category': rng.choice(keywords, n_rows)})
+
+
+@pytest.fixture(scope='module')
+def fitted():
+    upload = emails(600)
+    with contextlib.redirect_stdout(io.StringIO()):
+        final_df, result = main(upload, dedup=True, kmodes_engine='numpy', include_records=False,
+                                embedding={'method': 'pca', 'max_points': 5000, 'jitter': 0.05},
+                                build_segmentation_model=True)
+    return upload, final_df, result['segmentation_model']
+
+
+def test_fitted_rows_keep_their_clusters(fitted):
+    upload, final_df, model = fitted
+    assigned, drift = assign(row_features(upload.copy()), model, is_new_import=False)
+    assert assigned['stage1_cluster'].tolist() == final_df['stage1_cluster'].tolist()
+    assert assigned['stage2_cluster'].tolist() == final_df['stage2_cluster'].tolist()
+    assert assigned['cluster_name'].tolist() == \
+        final_df['stage2_cluster'].astype(str).map(model['cluster_names']).tolist()
+    assert drift['unseen_rate'] == 0 and drift['cluster_shift'] == pytest.approx(0)
+    assert not drift['refit_recommended']
+
+
+def test_new_imports_are_labelled_and_drift_is_reported(fitted):
+    _, _, model = fitted
+    # Same mix as the fit: new emails, no drift
+    assigned, drift = assign(row_features(emails(300, seed=1)), model)
+    assert assigned['cluster_name'].str.startswith('New: ').all()
+    assert not drift['refit_recommended']
+
+    # Mostly domains and categories the model has never seen
+    shifted = emails(300, domains=['proton.me', 'acme.de', 'gmail.com'], keywords=['Robotics', 'AI'], seed=2)
+    assigned, drift = assign(row_features(shifted), model)
+    assert assigned['stage2_cluster'].isin([int(key) for key in model['cluster_names']]).all()
+    assert drift['unseen_rate'] > 0.5
+    assert 'unseen_rate' in drift['exceeded'] and drift['refit_recommended']
+
+
+def test_model_store_keeps_recent_models_by_id(fitted, tmp_path):
+    upload, _, model = fitted
+    store = ModelStore(str(tmp_path), max_models=2)
+    assert store.put(model) == model['model_id']
+    loaded = store.get(model['model_id'])
+    assert assign(row_features(upload), loaded)[0]['stage2_cluster'].tolist() == \
+        assign(row_features(upload), model)[0]['stage2_cluster'].tolist()
+
+    for _ in range(2):
+        time.sleep(0.01)
+        store.put(dict(model, model_id=uuid.uuid4().hex))
+    with pytest.raises(KeyError):
+        store.get(model['model_id'])
+    with pytest.raises(KeyError):
+        store.get('../model')
+
+    save_model(dict(model, format=0), tmp_path / 'old.json')
+    with pytest.raises(ValueError):
+        load_model(tmp_path / 'old.json')
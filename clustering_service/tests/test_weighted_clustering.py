@@ -0,0 +1,165 @@
+import pathlib
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from gower import gower_matrix
+from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.spatial.distance import pdist, squareform
+from sklearn.metrics import calinski_harabasz_score, davies_bouldin_score, silhouette_score
+
+sys.path.append(str(pathlib.Path(__file__).resolve().parents[1]))
+
+import clustering_script as cs
+from cluster_metrics import (CategoricalMetrics, sampled_silhouette_score, weighted_calinski_harabasz_score,
+                             weighted_davies_bouldin_score, weighted_silhouette_score)
+from hierarchical import group_prototypes, weighted_ward_linkage
+
+
+def categorical_rows(n, seed=5):
+    rng = np.random.default_rng(seed)
+    # Features shaped like X_kmodes: label-encoded categories plus 0/1 flags
+    return np.column_stack([rng.integers(0, 6, n), rng.integers(0, 8, n) * 3, rng.integers(0, 5, n),
+                            rng.integers(0, 2, n), rng.integers(0, 3, n)])
+
+
+@pytest.fixture
+def weighted_points():
+    rng = np.random.default_rng(7)
+    points = rng.random((40, 3))
+    weights = rng.integers(1, 6, len(points))
+    return points, weights, np.repeat(points, weights, axis=0)
+
+
+def test_weighted_ward_matches_scipy_on_expanded_rows(weighted_points):
+    points, weights, expanded = weighted_points
+    Z = weighted_ward_linkage(pdist(points), weights)
+    expected_heights = np.sort(linkage(expanded, method='ward')[:, 2])
+    # Duplicate rows merge at height 0 in the expanded linkage
+    expected_heights = expected_heights[expected_heights > 1e-12]
+    assert np.allclose(np.sort(Z[:, 2]), expected_heights)
+    assert Z[-1, 3] == len(points)
+
+
+@pytest.mark.parametrize("k", [2, 4, 7])
+def test_weighted_metrics_match_sklearn_on_expanded_rows(weighted_points, k):
+    points, weights, expanded = weighted_points
+    labels = fcluster(weighted_ward_linkage(pdist(points), weights), k, criterion='maxclust')
+    expanded_labels = np.repeat(labels, weights)
+
+    assert np.isclose(weighted_silhouette_score(points, labels, weights, chunk_size=7),
+                      silhouette_score(expanded, expanded_labels))
+    assert np.isclose(weighted_silhouette_score(squareform(pdist(points, 'cityblock')), labels, weights,
+                                                metric='precomputed'),
+                      silhouette_score(squareform(pdist(expanded, 'cityblock')), expanded_labels,
+                                       metric='precomputed'))
+    assert np.isclose(weighted_davies_bouldin_score(points, labels, weights),
+                      davies_bouldin_score(expanded, expanded_labels))
+    assert np.isclose(weighted_calinski_harabasz_score(points, labels, weights),
+                      calinski_harabasz_score(expanded, expanded_labels))
+
+
+def test_weighted_metrics_reject_a_single_cluster():
+    with pytest.raises(ValueError):
+        weighted_silhouette_score(np.eye(3), [1, 1, 1], [2, 2, 2])
+
+
+def test_sampled_silhouette_interval_covers_the_exact_score():
+    rng = np.random.default_rng(1)
+    points = np.vstack([rng.normal(center, 1.0, (size, 3)) for center, size in [(0, 1500), (3, 1000), (6, 500)]])
+    labels = np.repeat([0, 1, 2], [1500, 1000, 500])
+    weights = rng.integers(1, 5, len(points))
+
+    exact = silhouette_score(points, labels)
+    estimate, (low, high) = sampled_silhouette_score(points, labels, sample_size=500, random_state=0)
+    assert low <= exact <= high and high - low < 0.05
+    assert sampled_silhouette_score(points, labels, sample_size=500, random_state=0)[0] == estimate
+
+    exact = weighted_silhouette_score(points, labels, weights)
+    _, (low, high) = sampled_silhouette_score(points, labels, sample_size=500, sample_weight=weights, random_state=0)
+    assert low <= exact <= high
+
+    # A sample at least as large as the data gives the exact score
+    score, interval = sampled_silhouette_score(points[::30], labels[::30], sample_size=100)
+    assert np.isclose(score, silhouette_score(points[::30], labels[::30])) and interval == (score, score)
+
+
+@pytest.mark.parametrize("max_cached_patterns", [4096, 0])
+def test_categorical_metrics_engine_matches_one_hot_and_gower_scores(max_cached_patterns):
+    rng = np.random.default_rng(2)
+    frame = pd.DataFrame({'domain_type': rng.choice(['academic', 'corporate', 'other'], 500),
+                          'tld': rng.choice(['.lk', '.com'], 500),
+                          'stage1_cluster': rng.integers(0, 5, 500).astype(np.uint16)})
+    weights = rng.integers(1, 4, len(frame)).astype(float)
+    one_hot = pd.get_dummies(frame.astype(str)).to_numpy(dtype=float)
+
+    engine = CategoricalMetrics(frame, weights, max_cached_patterns=max_cached_patterns)
+    gower_engine = CategoricalMetrics(frame, distance='gower', max_cached_patterns=max_cached_patterns)
+    for k in [2, 5]:
+        labels = rng.integers(0, k, len(frame))
+        assert np.isclose(engine.silhouette(labels)[0], weighted_silhouette_score(one_hot, labels, weights))
+        assert np.isclose(engine.davies_bouldin(labels), weighted_davies_bouldin_score(one_hot, labels, weights))
+        assert np.isclose(engine.calinski_harabasz(labels),
+                          weighted_calinski_harabasz_score(one_hot, labels, weights))
+        assert np.isclose(gower_engine.silhouette(labels)[0],
+                          silhouette_score(gower_matrix(frame), labels, metric='precomputed'), atol=1e-6)
+
+
+def test_silhouette_sweep_over_dendrogram_cuts_matches_each_cut():
+    rng = np.random.default_rng(4)
+    points = rng.integers(0, 4, (400, 3))
+    weights = rng.integers(1, 4, len(points)).astype(float)
+    engine = CategoricalMetrics(points, weights)
+    Z = weighted_ward_linkage(pdist(points), weights)
+    cuts = {k: fcluster(Z, k, criterion='maxclust') for k in range(10, 1, -1)}
+
+    sweep = engine.silhouette_sweep(cuts)
+    assert sorted(sweep) == list(range(2, 11))
+    for k, labels in cuts.items():
+        assert np.isclose(sweep[k], engine.silhouette(labels)[0])
+
+    with pytest.raises(ValueError):
+        engine.silhouette_sweep({2: cuts[2], 3: cuts[3]})
+
+
+def test_group_prototypes_cap_each_group_and_keep_row_weights():
+    rng = np.random.default_rng(9)
+    frame = pd.DataFrame({'stage1_cluster': rng.integers(0, 3, 2000),
+                          'domain_type': rng.choice(['personal', 'educational', 'corporate', None], 2000),
+                          'tld': rng.choice([f'tld{i}' for i in range(12)], 2000)})
+    features = ['domain_type', 'tld']
+
+    prototypes, weights, row_prototype = group_prototypes(frame, 'stage1_cluster', features, max_per_group=5)
+    assert (prototypes.groupby('stage1_cluster').size() <= 5).all()
+    assert weights.sum() == len(frame)
+    assert np.array_equal(np.bincount(row_prototype), weights)
+    # Rows only ever join a prototype of their own group; prototype rows map to themselves
+    assert (prototypes['stage1_cluster'].to_numpy()[row_prototype] == frame['stage1_cluster'].to_numpy()).all()
+    matches = frame.reset_index().merge(prototypes.reset_index(), on=['stage1_cluster'] + features,
+                                        suffixes=('_row', '_prototype'))
+    assert (row_prototype[matches['index_row']] == matches['index_prototype']).all()
+
+    # Without a binding cap the prototypes are the distinct rows
+    distinct, distinct_weights, _ = group_prototypes(frame, 'stage1_cluster', features, max_per_group=1000)
+    assert len(distinct) == len(frame.drop_duplicates()) and distinct_weights.sum() == len(frame)
+
+
+def test_final_stage_reuses_the_sweep_fit():
+    X = categorical_rows(200)
+    optimal_k, _, sweep = cs.find_optimal_k_with_metrics(X, max_k=5, engine='numpy')
+    assert sorted(sweep) == [2, 3, 4, 5]
+    clusters, model, metrics = cs.perform_kmodes_clustering(X, optimal_k, engine='numpy', sweep=sweep)
+    assert model is sweep[optimal_k]['model'] and metrics is sweep[optimal_k]['metrics']
+    np.testing.assert_array_equal(clusters, model.labels_)
+
+
+def test_warm_sweep_stops_early_and_reports_skipped_fits():
+    X = categorical_rows(300)
+    _, viz, sweep = cs.find_optimal_k_with_metrics(X, max_k=15, engine='numpy', mode='warm', patience=1)
+    report = viz['sweep_report']
+    assert list(sweep) == list(range(2, 2 + len(sweep))) == viz['k_values']
+    assert report['fits_skipped'] == 14 - len(sweep) > 0
+    # Each warm-started k starts from the previous centroids, so the cost never goes up
+    costs = [fit['cost'] for fit in sweep.values()]
+    assert costs == sorted(costs, reverse=True)